@@ -0,0 +1,21 @@
+""" api.urls with the read-only views swapped for their async versions
+(api.async_views), routed by the ASGI entry point """
+from django.urls import URLPattern
+
+from . import async_views, urls
+
+ASYNC_VIEWS = {
+    'venues': async_views.VenueList,
+    'venue': async_views.VenueDetail,
+    'calendar': async_views.CalendarList,
+    'calendar_day': async_views.CalendarDayList,
+    'availability': async_views.AvailabilityList,
+    'analytics_occupancy': async_views.OccupancyAnalytics,
+}
+
+urlpatterns = [
+    URLPattern(pattern.pattern, ASYNC_VIEWS[pattern.name],
+               pattern.default_args, pattern.name)
+    if pattern.name in ASYNC_VIEWS else pattern
+    for pattern in urls.urlpatterns
+]
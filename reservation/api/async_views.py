@@ -0,0 +1,83 @@
+""" Async versions of the read-only API views, routed by the ASGI entry point
+(reservation.asgi).
+
+The ORM is synchronous, so each request still runs the regular DRF view,
+in a thread of the default executor with that thread's own DB connection.
+What moves to the event loop is the waiting: a slow client or a long poll
+holds a coroutine instead of a worker thread. Writes are not served from
+here. Under ASGI they keep their sync views, which Django runs in its sync
+thread, so their transactions are unchanged.
+
+Conditional views (ConditionalGetMixin) also accept ?wait=<seconds> along
+with If-None-Match. Instead of answering 304 right away, the view runs
+again every ASYNC_LONG_POLL_INTERVAL seconds until the resource changes or
+the wait is over.
+"""
+import asyncio
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+
+from . import views
+from .conditional import ConditionalGetMixin
+from .querycount import QueryRecorder
+
+
+def parse_wait(request):
+    """ Seconds to long poll for, capped by ASYNC_LONG_POLL_MAX_WAIT """
+    try:
+        wait = float(request.GET.get('wait', 0))
+    except ValueError:
+        return 0
+    return min(max(wait, 0),
+               getattr(settings, 'ASYNC_LONG_POLL_MAX_WAIT', 30))
+
+
+def async_read_view(view_class, **initkwargs):
+    """ Async view running the DRF view_class in an executor thread """
+    view = view_class.as_view(**initkwargs)
+    long_poll = issubclass(view_class, ConditionalGetMixin)
+
+    def respond(request, args, kwargs):
+        # What request_started and request_finished do for the connection
+        # of a sync request, in this thread
+        close_old_connections()
+        try:
+            with QueryRecorder() as recorder:
+                response = view(request, *args, **kwargs)
+                if hasattr(response, 'render'):
+                    # Rendering may query too, e.g. the browsable API
+                    response.render()
+        finally:
+            close_old_connections()
+        # Only the last run of a long poll counts for the query budget
+        request.query_recorder = recorder
+        return response
+
+    run = sync_to_async(respond, thread_sensitive=False)
+
+    async def async_view(request, *args, **kwargs):
+        response = await run(request, args, kwargs)
+        if not long_poll or response.status_code != 304:
+            return response
+        deadline = time.monotonic() + parse_wait(request)
+        interval = getattr(settings, 'ASYNC_LONG_POLL_INTERVAL', 0.5)
+        while response.status_code == 304 and time.monotonic() < deadline:
+            await asyncio.sleep(min(interval, deadline - time.monotonic()))
+            response = await run(request, args, kwargs)
+        return response
+
+    # Read by QueryCountMiddleware for the view name, like a DRF view
+    async_view.view_class = view_class
+    async_view.csrf_exempt = True
+    return async_view
+
+
+VenueList = async_read_view(views.VenueList)
+VenueDetail = async_read_view(views.VenueDetail)
+CalendarList = async_read_view(views.CalendarList)
+CalendarDayList = async_read_view(views.CalendarDayList)
+AvailabilityList = async_read_view(views.AvailabilityList)
+OccupancyAnalytics = async_read_view(views.OccupancyAnalytics)
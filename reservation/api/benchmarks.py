@@ -0,0 +1,247 @@
+""" Micro-benchmarks of the hot paths, run by `python manage.py bench`.
+
+Each group fills the database it needs, then times one operation with
+Runner.measure: `repeat` rounds of `number` calls, reported per call. The
+results are plain dicts, written as JSON and compared against a saved
+baseline by compare().
+"""
+import itertools
+import os
+import platform
+import random
+import shutil
+import statistics
+import tempfile
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+
+import django
+from django.db import transaction
+from django.test import override_settings
+
+from rest_framework.exceptions import ValidationError
+from rest_framework.test import APIRequestFactory
+
+from core.calendar_builder import build_calendar
+from core.interval_index import reservation_index
+from core.models import Calendar, Guest, Reservation, Room, Venue
+from core.pricing import reprice
+from core.serializers import CalendarSerializer, ReservationSerializer
+
+from .throttling import ResourceBasedScopedRateThrottle
+from .views import ReservationDetail
+
+PAGE_SIZES = (10, 100, 1000)
+# Stays per room of the overlap check fixture
+STAYS_PER_ROOM = 200
+
+
+class Runner(object):
+
+    def __init__(self, repeat=5, only=None, log=None):
+        self.repeat = repeat
+        self.only = only
+        self.log = log
+        self.results = {}
+
+    def selected(self, name):
+        return not self.only or any(part in name for part in self.only)
+
+    def measure(self, name, func, number=1, setup=None):
+        """ Seconds per call of func(), setup() runs untimed before every
+        round """
+        if not self.selected(name):
+            return
+        timings = []
+        for _ in range(self.repeat):
+            if setup is not None:
+                setup()
+            start = time.perf_counter()
+            for _ in range(number):
+                func()
+            timings.append((time.perf_counter() - start) / number)
+        self.results[name] = {
+            'min': min(timings),
+            'median': statistics.median(timings),
+            'mean': statistics.mean(timings),
+            'number': number,
+            'repeat': self.repeat,
+        }
+        if self.log is not None:
+            self.log(name, self.results[name])
+
+
+def _venue(name):
+    return Venue.objects.create(name=name, address='1 Lane',
+                                city='Los Angeles', zipcode='90000',
+                                timezone='America/Los_Angeles')
+
+
+def bench_calendar(runner, venues=5, rooms=20, days=30):
+    """ build_calendar then reprice, as populatedb runs them """
+    name = 'build_calendar+reprice[%dx%dx%d]' % (venues, rooms, days)
+    if not runner.selected(name):
+        return
+    created = [_venue('Calendar %d' % i) for i in range(venues)]
+    for venue in created:
+        Room.objects.bulk_create([Room(venue=venue, room_number=str(i))
+                                  for i in range(rooms)])
+    start = date.today()
+    end = start + timedelta(days=days - 1)
+
+    def create_calendar():
+        build_calendar(start, end)
+        reprice(start, end)
+
+    runner.measure(name, create_calendar,
+                   setup=lambda: Calendar.objects.all().delete())
+    Calendar.objects.all().delete()
+    Venue.objects.filter(pk__in=[venue.pk for venue in created]).delete()
+
+
+def _fill_reservations(venue, guest, total):
+    """ Bring the reservations up to `total`, STAYS_PER_ROOM two-night stays
+    per room. Returns the room ids. """
+    origin = date.today()
+    count = Reservation.objects.count()
+    while count < total:
+        room = Room.objects.create(venue=venue,
+                                   room_number=str(Room.objects.count()))
+        stays = min(STAYS_PER_ROOM, total - count)
+        Reservation.objects.bulk_create([
+            Reservation(venue=venue, room=room, guest=guest, amount=200,
+                        checkin=origin + timedelta(days=3 * i),
+                        checkout=origin + timedelta(days=3 * i + 2))
+            for i in range(stays)], batch_size=1000)
+        count += stays
+    return list(Room.objects.filter(venue=venue).values_list('id',
+                                                             flat=True))
+
+
+def bench_clean(runner, sizes, probes=200):
+    """ Reservation.clean overlap check, through the interval index and
+    straight against the database """
+    names = ['Reservation.clean[%s,%d]' % (kind, size)
+             for size in sizes for kind in ('index', 'db')]
+    if not any(runner.selected(name) for name in names):
+        return
+    venue = _venue('Clean')
+    guest = Guest.objects.create(name='Guest', address='1 Lane',
+                                 city='Los Angeles', zipcode='90000')
+    rng = random.Random(0)
+    origin = date.today()
+    for size in sorted(sizes):
+        room_ids = _fill_reservations(venue, guest, size)
+        reservation_index.invalidate()
+        # One night probes, two in three of them hit a stay
+        candidates = [Reservation(
+            venue=venue, guest=guest, amount=200,
+            room_id=rng.choice(room_ids[:100]),
+            checkin=origin + timedelta(days=day),
+            checkout=origin + timedelta(days=day + 1))
+            for day in (rng.randrange(3 * STAYS_PER_ROOM)
+                        for _ in range(probes))]
+
+        probe = itertools.cycle(candidates)
+
+        def clean():
+            # As Reservation.save runs it: room loaded first, checked inside
+            # the transaction of the write
+            reservation = next(probe)
+            reservation_index.preload(reservation.venue_id,
+                                      reservation.room_id)
+            try:
+                with transaction.atomic():
+                    reservation.clean()
+            except ValidationError:
+                pass
+
+        runner.measure('Reservation.clean[index,%d]' % size, clean, probes)
+        with override_settings(RESERVATION_INDEX_ENABLED=False):
+            runner.measure('Reservation.clean[db,%d]' % size, clean, probes)
+
+
+def bench_throttle(runner, keys=1000, number=2000):
+    """ ResourceBasedScopedRateThrottle.allow_request per throttle store """
+    tmp = tempfile.mkdtemp()
+    stores = (
+        ('sqlite', {'BACKEND': 'api.throttle_store.SQLiteThrottleStore',
+                    'LOCATION': os.path.join(tmp, 'throttle.sqlite3')}),
+        ('locmem', {'BACKEND': 'api.throttle_store.CacheThrottleStore',
+                    'LOCATION': 'bench'}),
+    )
+    caches = {'bench': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+    request = APIRequestFactory().patch('/')
+    view = ReservationDetail()
+    try:
+        for kind, store in stores:
+            counter = itertools.count()
+
+            def allow_request():
+                throttle = ResourceBasedScopedRateThrottle(
+                    next(counter) % keys)
+                throttle.allow_request(request, view)
+
+            with override_settings(THROTTLE_STORE=store, CACHES=caches):
+                runner.measure('throttle.allow_request[%s]' % kind,
+                               allow_request, number)
+    finally:
+        shutil.rmtree(tmp)
+
+
+def bench_serializers(runner, page_sizes=PAGE_SIZES):
+    """ List serialization of a page, on instances already in memory """
+    today = date.today()
+    for size in page_sizes:
+        reservations = [Reservation(
+            id=i, venue_id=1, room_id=i, guest_id=1, amount=Decimal('200.00'),
+            checkin=today, checkout=today + timedelta(days=2))
+            for i in range(size)]
+        calendar = [Calendar(id=i, venue_id=1, room_id=i, day=today,
+                             price=Decimal('100.00'), reservation_id=i)
+                    for i in range(size)]
+        number = max(1, 2000 // size)
+        runner.measure('ReservationSerializer[%d]' % size,
+                       lambda: ReservationSerializer(reservations,
+                                                     many=True).data,
+                       number)
+        runner.measure('CalendarSerializer[%d]' % size,
+                       lambda: CalendarSerializer(calendar, many=True).data,
+                       number)
+
+
+def run(sizes, repeat=5, only=None, log=None):
+    """ Run every group, returns the JSON document """
+    runner = Runner(repeat, only, log)
+    bench_serializers(runner)
+    bench_throttle(runner)
+    bench_calendar(runner)
+    bench_clean(runner, sizes)
+    return {
+        'meta': {
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'machine': platform.machine(),
+            'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'sizes': list(sizes),
+            'repeat': repeat,
+        },
+        'results': runner.results,
+    }
+
+
+def compare(results, baseline, threshold):
+    """ (name, baseline median, median, ratio, regressed) for the benchmarks
+    present in both runs. A benchmark regressed when its median grew by
+    more than `threshold` (0.2 = 20%). """
+    rows = []
+    for name in sorted(results['results']):
+        if name not in baseline['results']:
+            continue
+        before = baseline['results'][name]['median']
+        after = results['results'][name]['median']
+        ratio = after / before if before else float('inf')
+        rows.append((name, before, after, ratio, ratio > 1 + threshold))
+    return rows
@@ -0,0 +1,74 @@
+""" Conditional GET (ETag / Last-Modified) for DRF views.
+
+Views tell what version of the resource a GET would serve in
+get_validators(). A request whose If-None-Match (or If-Modified-Since)
+matches is answered 304 before the main query and the serializer run.
+
+ETags are strong: they combine the version key of the view with the full
+path and the negotiated media type, so every page and format of a resource
+has its own.
+"""
+import hashlib
+from calendar import timegm
+
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+
+def timestamp(value):
+    return timegm(value.utctimetuple()) if value is not None else None
+
+
+class ConditionalGetMixin(object):
+    # True when get_validators(instance) can read the validators off the
+    # object served, which saves a query on unconditional requests. When
+    # False they are read before the response is built, so they are never
+    # newer than the data.
+    validators_from_object = False
+
+    def get_validators(self, instance=None):
+        """ (version key, last modified datetime or None) of the resource,
+        None when it does not exist """
+        raise NotImplementedError('.get_validators() must be overridden')
+
+    def get_object(self):
+        self.served_object = super(ConditionalGetMixin, self).get_object()
+        return self.served_object
+
+    def make_etag(self, key):
+        request = self.request
+        representation = '%s|%s' % (request.get_full_path(),
+                                    request.accepted_media_type)
+        return '"%s-%s"' % (key, hashlib.md5(
+            representation.encode('utf-8')).hexdigest()[:12])
+
+    def set_validators(self, response, etag, last_modified):
+        response['ETag'] = etag
+        if last_modified is not None:
+            response['Last-Modified'] = http_date(last_modified)
+        return response
+
+    def get(self, request, *args, **kwargs):
+        conditional = ('HTTP_IF_NONE_MATCH' in request.META or
+                       'HTTP_IF_MODIFIED_SINCE' in request.META)
+        validators = None
+        if conditional or not self.validators_from_object:
+            validators = self.get_validators()
+        if validators is not None:
+            etag = self.make_etag(validators[0])
+            last_modified = timestamp(validators[1])
+            not_modified = get_conditional_response(
+                request, etag=etag, last_modified=last_modified)
+            if not_modified is not None:
+                return self.set_validators(not_modified, etag, last_modified)
+
+        response = super(ConditionalGetMixin, self).get(
+            request, *args, **kwargs)
+        if response.status_code != 200:
+            return response
+        if self.validators_from_object:
+            validators = self.get_validators(self.served_object)
+        if validators is not None:
+            self.set_validators(response, self.make_etag(validators[0]),
+                                timestamp(validators[1]))
+        return response
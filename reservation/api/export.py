@@ -0,0 +1,106 @@
+""" Streaming NDJSON / CSV exports.
+
+ExportView streams rows straight from a values_list() iterator into a
+StreamingHttpResponse: no model instances, no serializer, and only one
+chunk of rows in memory at any time, whatever the size of the export.
+The format is negotiated like any other DRF response, ?format=csv or an
+Accept header, NDJSON being the default.
+"""
+import csv
+import json
+from datetime import date, datetime
+from decimal import Decimal
+
+from django.http import StreamingHttpResponse
+
+from rest_framework.renderers import BaseRenderer
+from rest_framework.views import APIView
+
+CHUNK_SIZE = 2000
+
+
+def prepare(value):
+    # Same representation as the JSON API: ISO dates, decimals as strings
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    return value
+
+
+class Echo(object):
+    """ File-like object handing back what csv.writer writes """
+
+    def write(self, value):
+        return value
+
+
+class NDJSONRenderer(BaseRenderer):
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+    charset = 'utf-8'
+
+    # Rows are streamed by ExportView, renderers only render errors
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return (json.dumps(data) + '\n').encode(self.charset)
+
+
+class CSVRenderer(BaseRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        writer = csv.writer(Echo())
+        items = data.items() if isinstance(data, dict) else [('', data)]
+        return ''.join(writer.writerow([key, value])
+                       for key, value in items).encode(self.charset)
+
+
+def ndjson_lines(fields, rows):
+    lines = []
+    for row in rows:
+        lines.append(json.dumps(dict(zip(fields, map(prepare, row)))))
+        if len(lines) >= CHUNK_SIZE:
+            yield '\n'.join(lines) + '\n'
+            lines = []
+    if lines:
+        yield '\n'.join(lines) + '\n'
+
+
+def csv_lines(fields, rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(fields)
+    lines = []
+    for row in rows:
+        lines.append(writer.writerow([prepare(value) for value in row]))
+        if len(lines) >= CHUNK_SIZE:
+            yield ''.join(lines)
+            lines = []
+    if lines:
+        yield ''.join(lines)
+
+
+class ExportView(APIView):
+    """ Views set `fields` and `filename`, and return an iterable of tuples
+    in `fields` order from get_rows(). get_rows() should validate eagerly and
+    return a lazy iterator: errors raised once streaming started can no
+    longer turn into an error response. """
+    renderer_classes = (NDJSONRenderer, CSVRenderer)
+    fields = ()
+    filename = 'export'
+    streams = {'ndjson': ndjson_lines, 'csv': csv_lines}
+
+    def get_rows(self):
+        raise NotImplementedError('.get_rows() must be overridden')
+
+    def get(self, request, format=None):
+        rows = self.get_rows()
+        renderer = request.accepted_renderer
+        response = StreamingHttpResponse(
+            self.streams[renderer.format](self.fields, rows),
+            content_type='%s; charset=%s' % (renderer.media_type,
+                                             renderer.charset))
+        response['Content-Disposition'] = 'attachment; filename="%s.%s"' % (
+            self.filename, renderer.format)
+        return response
@@ -0,0 +1,354 @@
+""" Closed-loop load generator for the reservation flow, run by
+`python manage.py loadgen`.
+
+Each client thread sends a request, waits for the answer and sends the next
+one, picking the endpoint from a weighted mix:
+
+    availability   GET   /api/availability?venue_id=&checkin=&checkout=
+    calendar_day   GET   /api/calendar/<day>
+    book           POST  /api/reservations
+    update         PATCH /api/reservation/<id>, throttled per reservation
+
+Requests go to the WSGI application of this process (WSGITransport) or over
+HTTP to a server on localhost (HTTPTransport). Ids and dates are drawn from
+the database of the settings, so both sides should use the same one, filled
+by populatedb. Per endpoint, the report has the throughput, latency
+percentiles and histogram, the status codes, the conflict rate (409, or 400
+for a stay that overlaps another one), the throttled rate (429) and the
+database lock errors.
+"""
+import http.client
+import io
+import json
+import math
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import date, timedelta
+from urllib.parse import urlsplit
+
+from django.core.signals import got_request_exception
+from django.core.wsgi import get_wsgi_application
+from django.db import connection
+from django.db.models import Max, Min
+
+from core.models import Calendar, Guest, Reservation, Room
+
+ENDPOINTS = ('availability', 'calendar_day', 'book', 'update')
+DEFAULT_MIX = {'availability': 50, 'calendar_day': 30, 'book': 15,
+               'update': 5}
+# Upper bounds of the latency histogram buckets, in milliseconds
+LATENCY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+# Error messages of a stay that overlaps another one, see core.models and
+# core.booking
+CONFLICT_MESSAGES = (b'existing reservation', b'already booked')
+LOCK_MESSAGE = 'database is locked'
+
+
+def parse_mix(value):
+    """ 'availability=50,book=10' -> {'availability': 50, 'book': 10} """
+    mix = {}
+    for part in value.split(','):
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if name not in ENDPOINTS:
+            raise ValueError('Unknown endpoint %r, expected one of %s.' % (
+                name, ', '.join(ENDPOINTS)))
+        try:
+            mix[name] = float(weight)
+        except ValueError:
+            raise ValueError('Expected <endpoint>=<weight>, got %r.' % part)
+        if mix[name] < 0:
+            raise ValueError('Weights should not be negative.')
+    if not any(mix.values()):
+        raise ValueError('At least one endpoint needs a weight.')
+    return mix
+
+
+class WSGITransport(object):
+    """ Calls the WSGI application of this process, as a threaded WSGI
+    server would. Exceptions turned into 500 responses are kept to tell
+    database lock errors apart. """
+
+    def __init__(self):
+        self.application = get_wsgi_application()
+        self.local = threading.local()
+        got_request_exception.connect(self._exception, weak=False)
+
+    def _exception(self, sender, **kwargs):
+        self.local.error = str(sys.exc_info()[1])
+
+    def request(self, method, path, body=b''):
+        """ (status, content, error) """
+        path, _, query = path.partition('?')
+        environ = {
+            'REQUEST_METHOD': method,
+            'PATH_INFO': path,
+            'QUERY_STRING': query,
+            'SERVER_NAME': 'localhost',
+            'SERVER_PORT': '80',
+            'SERVER_PROTOCOL': 'HTTP/1.1',
+            'HTTP_HOST': 'localhost',
+            'HTTP_ACCEPT': 'application/json',
+            'CONTENT_TYPE': 'application/json',
+            'CONTENT_LENGTH': str(len(body)),
+            'wsgi.input': io.BytesIO(body),
+            'wsgi.errors': sys.stderr,
+            'wsgi.url_scheme': 'http',
+            'wsgi.version': (1, 0),
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': False,
+            'wsgi.run_once': False,
+        }
+        started = []
+        self.local.error = None
+        result = self.application(
+            environ, lambda status, headers, exc_info=None:
+            started.append(status))
+        try:
+            content = b''.join(result)
+        finally:
+            # Fires request_finished, which closes the DB connection as
+            # after a real request
+            result.close()
+        return int(started[0].split()[0]), content, self.local.error
+
+    def close(self):
+        connection.close()
+
+    def shutdown(self):
+        got_request_exception.disconnect(self._exception)
+
+
+class HTTPTransport(object):
+    """ Keep-alive HTTP connection per client thread to base_url """
+
+    def __init__(self, base_url, timeout=30):
+        url = urlsplit(base_url)
+        if url.scheme != 'http':
+            raise ValueError('Only http:// URLs are supported.')
+        self.host, self.port = url.hostname, url.port or 80
+        self.prefix = url.path.rstrip('/')
+        self.timeout = timeout
+        self.local = threading.local()
+
+    def request(self, method, path, body=b''):
+        """ (status, content, error), status is None when the request
+        failed before getting an answer """
+        client = getattr(self.local, 'client', None)
+        if client is None:
+            client = self.local.client = http.client.HTTPConnection(
+                self.host, self.port, timeout=self.timeout)
+        try:
+            client.request(method, self.prefix + path, body=body or None,
+                           headers={'Accept': 'application/json',
+                                    'Content-Type': 'application/json'})
+            response = client.getresponse()
+            return response.status, response.read(), None
+        except (OSError, http.client.HTTPException) as e:
+            self.close()
+            return None, b'', str(e) or e.__class__.__name__
+
+    def close(self):
+        client = getattr(self.local, 'client', None)
+        if client is not None:
+            client.close()
+            self.local.client = None
+
+    def shutdown(self):
+        pass
+
+
+class Traffic(object):
+    """ Builds the requests of each endpoint from the ids and calendar
+    horizon found in the database.
+
+    PATCHes go to `hot_reservations` reservations only, so some of them hit
+    the per reservation throttle. """
+
+    def __init__(self, hot_reservations=100, sample_size=10000):
+        self.rooms = list(Room.objects.order_by('id')
+                          .values_list('id', 'venue_id')[:sample_size])
+        self.guest_ids = list(Guest.objects.order_by('id')
+                              .values_list('id', flat=True)[:sample_size])
+        self.reservation_ids = list(
+            Reservation.objects.order_by('id')
+            .values_list('id', flat=True)[:hot_reservations])
+        horizon = Calendar.objects.aggregate(first=Min('day'),
+                                             last=Max('day'))
+        self.first_day = horizon['first'] or date.today()
+        self.days = ((horizon['last'] or self.first_day + timedelta(days=30))
+                     - self.first_day).days + 1
+        if not self.rooms or not self.guest_ids:
+            raise ValueError('No rooms or guests, run populatedb first.')
+
+    def _day(self, rng):
+        return self.first_day + timedelta(days=rng.randrange(self.days))
+
+    def _stay(self, rng):
+        checkin = self._day(rng)
+        return checkin, checkin + timedelta(days=rng.randint(1, 4))
+
+    def make(self, endpoint, rng):
+        """ (method, path, body) of a request to `endpoint` """
+        if endpoint == 'availability':
+            checkin, checkout = self._stay(rng)
+            return 'GET', '/api/availability?venue_id=%d&checkin=%s' \
+                '&checkout=%s' % (rng.choice(self.rooms)[1], checkin,
+                                  checkout), b''
+        if endpoint == 'calendar_day':
+            return 'GET', '/api/calendar/%s' % self._day(rng), b''
+        if endpoint == 'book':
+            room_id, venue_id = rng.choice(self.rooms)
+            checkin, checkout = self._stay(rng)
+            # No amount, the API charges the price of the stay
+            body = {'venue_id': venue_id, 'room_id': room_id,
+                    'guest_id': rng.choice(self.guest_ids),
+                    'checkin': str(checkin), 'checkout': str(checkout)}
+            return 'POST', '/api/reservations', json.dumps(body).encode()
+        if endpoint == 'update':
+            if not self.reservation_ids:
+                raise ValueError('No reservations to update.')
+            return 'PATCH', '/api/reservation/%d' % rng.choice(
+                self.reservation_ids), json.dumps(
+                {'amount': rng.randint(100, 999)}).encode()
+        raise ValueError('Unknown endpoint %r.' % endpoint)
+
+
+def percentile(ordered, p):
+    """ Nearest-rank percentile of a sorted list """
+    if not ordered:
+        return None
+    return ordered[max(0, int(math.ceil(p / 100.0 * len(ordered))) - 1)]
+
+
+class EndpointStats(object):
+
+    def __init__(self):
+        self.latencies = []
+        self.statuses = Counter()
+        self.conflicts = 0
+        self.throttled = 0
+        self.lock_errors = 0
+
+    def record(self, latency, status, content, error):
+        self.latencies.append(latency)
+        self.statuses[status or 'error'] += 1
+        if status == 409 or (status == 400 and any(
+                message in content for message in CONFLICT_MESSAGES)):
+            self.conflicts += 1
+        elif status == 429:
+            self.throttled += 1
+        if LOCK_MESSAGE in (error or '') or (
+                status == 500 and LOCK_MESSAGE.encode() in content):
+            self.lock_errors += 1
+
+    def merge(self, other):
+        self.latencies.extend(other.latencies)
+        self.statuses.update(other.statuses)
+        self.conflicts += other.conflicts
+        self.throttled += other.throttled
+        self.lock_errors += other.lock_errors
+
+    def histogram(self):
+        """ [(upper bound in ms or None for the rest, count)] """
+        counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        for latency in self.latencies:
+            milliseconds = latency * 1000
+            i = 0
+            while i < len(LATENCY_BUCKETS) and milliseconds > \
+                    LATENCY_BUCKETS[i]:
+                i += 1
+            counts[i] += 1
+        return list(zip(LATENCY_BUCKETS + (None,), counts))
+
+    def summary(self, elapsed):
+        ordered = sorted(self.latencies)
+        requests = len(ordered)
+
+        def milliseconds(value):
+            return None if value is None else round(value * 1000, 3)
+
+        def rate(count):
+            return round(count / float(requests), 4) if requests else None
+
+        return {
+            'requests': requests,
+            'throughput': round(requests / elapsed, 2) if elapsed else None,
+            'p50_ms': milliseconds(percentile(ordered, 50)),
+            'p90_ms': milliseconds(percentile(ordered, 90)),
+            'p99_ms': milliseconds(percentile(ordered, 99)),
+            'max_ms': milliseconds(ordered[-1] if ordered else None),
+            'statuses': dict((str(code), count) for code, count
+                             in sorted(self.statuses.items(), key=str)),
+            'conflict_rate': rate(self.conflicts),
+            'throttled_rate': rate(self.throttled),
+            'lock_errors': self.lock_errors,
+            'histogram': self.histogram(),
+        }
+
+
+def run(transport, traffic, mix=None, clients=8, duration=10.0,
+        requests=None, seed=0):
+    """ Run `clients` closed-loop clients for `duration` seconds, or until
+    `requests` requests were sent in total. Returns the report as a JSON
+    serializable dict. """
+    mix = mix or DEFAULT_MIX
+    names = [name for name in ENDPOINTS if mix.get(name)]
+    weights = [mix[name] for name in names]
+    sent = iter(range(requests)) if requests else None
+    barrier = threading.Barrier(clients + 1)
+    per_client = [dict((name, EndpointStats()) for name in names)
+                  for _ in range(clients)]
+    deadline = []
+
+    def client(index):
+        rng = random.Random('%s-%d' % (seed, index))
+        stats = per_client[index]
+        barrier.wait()
+        try:
+            while time.perf_counter() < deadline[0]:
+                if sent is not None and next(sent, None) is None:
+                    break
+                name = rng.choices(names, weights)[0]
+                method, path, body = traffic.make(name, rng)
+                start = time.perf_counter()
+                status, content, error = transport.request(method, path,
+                                                           body)
+                stats[name].record(time.perf_counter() - start, status,
+                                   content, error)
+        finally:
+            transport.close()
+
+    threads = [threading.Thread(target=client, args=(i,))
+               for i in range(clients)]
+    for thread in threads:
+        thread.start()
+    deadline.append(time.perf_counter() + duration)
+    start = time.perf_counter()
+    barrier.wait()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    endpoints = dict((name, EndpointStats()) for name in names)
+    total = EndpointStats()
+    for stats in per_client:
+        for name, endpoint in stats.items():
+            endpoints[name].merge(endpoint)
+            total.merge(endpoint)
+    return {
+        'meta': {
+            'clients': clients,
+            'duration': duration,
+            'requests': requests,
+            'mix': dict((name, mix[name]) for name in names),
+            'seed': seed,
+            'elapsed': round(elapsed, 3),
+        },
+        'endpoints': dict((name, endpoints[name].summary(elapsed))
+                          for name in names),
+        'total': total.summary(elapsed),
+    }
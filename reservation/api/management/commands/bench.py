@@ -0,0 +1,72 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import setup_databases, teardown_databases
+
+from api import benchmarks
+
+
+def parse_sizes(value):
+    try:
+        return [int(size) for size in value.split(',')]
+    except ValueError:
+        raise CommandError('Expected comma separated integers: %s' % value)
+
+
+class Command(BaseCommand):
+    help = ('Runs the micro-benchmarks of the booking, throttling and '
+            'serialization hot paths on a throwaway test database, writes '
+            'them as JSON and compares them against a baseline')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=parse_sizes,
+                            default=[1000, 100000],
+                            help='Reservation counts of the overlap check '
+                                 'benchmark, e.g. 1000,100000,1000000.')
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--only', action='append',
+                            help='Only run the benchmarks whose name '
+                                 'contains this, can be repeated.')
+        parser.add_argument('--output', help='Write the results to this '
+                                             'JSON file.')
+        parser.add_argument('--baseline', help='Compare against the results '
+                                               'in this JSON file.')
+        parser.add_argument('--threshold', type=float, default=0.2,
+                            help='Fail when a median is this much slower '
+                                 'than the baseline (0.2 = 20%%).')
+
+    def log(self, name, result):
+        self.stdout.write('%-45s median %10.3fus  min %10.3fus' % (
+            name, result['median'] * 1e6, result['min'] * 1e6))
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options['baseline']:
+            with open(options['baseline']) as f:
+                baseline = json.load(f)
+
+        old_config = setup_databases(0, False)
+        try:
+            results = benchmarks.run(options['sizes'], options['repeat'],
+                                     options['only'], self.log)
+        finally:
+            teardown_databases(old_config, 0)
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(results, f, indent=2, sort_keys=True)
+        if baseline is None:
+            return
+        regressions = []
+        self.stdout.write('\n%-45s %12s %12s %8s' % ('benchmark', 'baseline',
+                                                      'now', 'ratio'))
+        for name, before, after, ratio, regressed in benchmarks.compare(
+                results, baseline, options['threshold']):
+            self.stdout.write('%-45s %10.3fus %10.3fus %7.2fx%s' % (
+                name, before * 1e6, after * 1e6, ratio,
+                '  REGRESSION' if regressed else ''))
+            if regressed:
+                regressions.append(name)
+        if regressions:
+            raise CommandError('%d benchmarks regressed: %s' % (
+                len(regressions), ', '.join(regressions)))
@@ -0,0 +1,193 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import setup_databases, teardown_databases
+
+from api.loadgen import WSGITransport, percentile
+from core.synthetic import generate
+from core.versions import bump_calendar_days
+from reservation.asgi import ReadPathASGIHandler
+
+
+class Gauge(object):
+    """ Number of open connections and its peak, with the peak number of
+    threads of the process """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.open = 0
+        self.peak = 0
+        self.threads = threading.active_count()
+
+    def __enter__(self):
+        with self.lock:
+            self.open += 1
+            self.peak = max(self.peak, self.open)
+            self.threads = max(self.threads, threading.active_count())
+
+    def __exit__(self, *exc_info):
+        with self.lock:
+            self.open -= 1
+            self.threads = max(self.threads, threading.active_count())
+
+
+def summary(gauge, latencies, statuses, elapsed):
+    ordered = sorted(latencies)
+    return {'requests': len(ordered), 'elapsed': elapsed,
+            'peak_connections': gauge.peak, 'peak_threads': gauge.threads,
+            'p50': percentile(ordered, 50), 'p99': percentile(ordered, 99),
+            'statuses': statuses}
+
+
+def wsgi_slow_clients(path, clients, threads, hold):
+    """ Threaded WSGI server: a worker thread writes the response and stays
+    busy until the client has read it, `hold` seconds """
+    transport = WSGITransport()
+    gauge = Gauge()
+    statuses, latencies = {}, []
+
+    def serve(arrival):
+        with gauge:
+            status, _, _ = transport.request('GET', path)
+            time.sleep(hold)
+        with gauge.lock:
+            statuses[status] = statuses.get(status, 0) + 1
+            latencies.append(time.perf_counter() - arrival)
+        transport.close()
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(threads) as pool:
+        for _ in range(clients):
+            pool.submit(serve, time.perf_counter())
+    elapsed = time.perf_counter() - start
+    transport.shutdown()
+    return summary(gauge, latencies, statuses, elapsed)
+
+
+def asgi_request(application, path, headers=(), hold=0):
+    """ Send a GET to the ASGI application, the client takes `hold` seconds
+    to read the body. Returns (status, headers). """
+    path, _, query = path.partition('?')
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1',
+        'method': 'GET', 'scheme': 'http', 'path': path, 'root_path': '',
+        'query_string': query.encode(), 'server': ('localhost', 80),
+        'client': ('127.0.0.1', 0),
+        'headers': [(b'host', b'localhost'),
+                    (b'accept', b'application/json')] + list(headers),
+    }
+    response = {}
+
+    async def receive():
+        if 'request' not in response:
+            response['request'] = True
+            return {'type': 'http.request', 'body': b''}
+        # The client never disconnects
+        await asyncio.Event().wait()
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            response['status'] = message['status']
+            response['headers'] = dict(message['headers'])
+        elif not message.get('more_body'):
+            await asyncio.sleep(hold)
+
+    async def call():
+        await application(scope, receive, send)
+        return response['status'], response['headers']
+
+    return call()
+
+
+def run_async(coroutine):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+def asgi_slow_clients(path, clients, hold, long_poll=None):
+    """ Every client connects at once to the ASGI application. With
+    `long_poll` = (etag, change after seconds), they wait on the calendar
+    day instead and one write wakes them all up. """
+    application = ReadPathASGIHandler()
+    gauge = Gauge()
+    statuses, latencies = {}, []
+
+    async def client():
+        headers = [(b'if-none-match', long_poll[0])] if long_poll else []
+        arrival = time.perf_counter()
+        with gauge:
+            status, _ = await asgi_request(application, path, headers, hold)
+        statuses[status] = statuses.get(status, 0) + 1
+        latencies.append(time.perf_counter() - arrival)
+
+    async def change(day, delay):
+        await asyncio.sleep(delay)
+        await asyncio.get_event_loop().run_in_executor(
+            None, lambda: (bump_calendar_days([day]), connection.close()))
+
+    async def main():
+        tasks = [client() for _ in range(clients)]
+        if long_poll:
+            tasks.append(change(*long_poll[1:]))
+        await asyncio.gather(*tasks)
+
+    start = time.perf_counter()
+    run_async(main())
+    return summary(gauge, latencies, statuses, time.perf_counter() - start)
+
+
+class Command(BaseCommand):
+    help = ('Compares how many slow concurrent clients the WSGI and the '
+            'ASGI (async read views) entry points hold, on a throwaway '
+            'test database')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, default=200)
+        parser.add_argument('--threads', type=int, default=8,
+                            help='Worker threads of the WSGI server.')
+        parser.add_argument('--hold', type=float, default=0.5,
+                            help='Seconds each client takes to read its '
+                                 'response, or long polls for.')
+
+    def handle(self, *args, **options):
+        clients, hold = options['clients'], options['hold']
+        old_config = setup_databases(0, False)
+        try:
+            today = date.today()
+            generate(2, 10, 10, 40, 30, today, seed=0)
+            path = '/api/calendar/%s' % today
+            rows = [
+                ('wsgi, %d threads' % options['threads'],
+                 wsgi_slow_clients(path, clients, options['threads'], hold)),
+                ('asgi, async views', asgi_slow_clients(path, clients, hold)),
+            ]
+            # Clients holding If-None-Match wait for a change of the day
+            poll_path = '%s?wait=%s' % (path, hold * 4)
+            _, headers = run_async(asgi_request(ReadPathASGIHandler(),
+                                                poll_path))
+            rows.append(('asgi, long poll', asgi_slow_clients(
+                poll_path, clients, 0,
+                long_poll=(headers[b'ETag'], today, hold))))
+        finally:
+            teardown_databases(old_config, 0)
+
+        self.stdout.write('%d clients, each reading for %.2fs (the long '
+                          'poll waits for a change after %.2fs)' % (
+                              clients, hold, hold))
+        self.stdout.write('%-20s %9s %12s %9s %9s %9s  %s' % (
+            'entry point', 'elapsed s', 'connections', 'threads', 'p50 s',
+            'p99 s', 'statuses'))
+        for name, result in rows:
+            self.stdout.write('%-20s %9.2f %12d %9d %9.2f %9.2f  %s' % (
+                name, result['elapsed'], result['peak_connections'],
+                result['peak_threads'], result['p50'], result['p99'],
+                ' '.join('%s:%d' % item
+                         for item in sorted(result['statuses'].items()))))
@@ -0,0 +1,84 @@
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.management.base import BaseCommand
+
+from api.throttle_store import CacheThrottleStore, SQLiteThrottleStore
+
+
+def make_store(kind, tmp):
+    if kind == 'file':
+        cache = FileBasedCache(os.path.join(tmp, 'cache'), {})
+        return CacheThrottleStore(cache=cache)
+    return SQLiteThrottleStore(os.path.join(tmp, 'throttle.sqlite3'))
+
+
+def sliding_log(limit, duration):
+    def check(history):
+        now = time.time()
+        history = [t for t in history if t > now - duration]
+        if len(history) >= limit:
+            return history, False
+        return [now] + history, True
+    return check
+
+
+def worker(args):
+    kind, tmp, requests, keys, limit = args
+    store = make_store(kind, tmp)
+    check = sliding_log(limit, 3600)
+    admitted, latencies = 0, []
+    for i in range(requests):
+        start = time.perf_counter()
+        if store.update('reservation_%d' % (i % keys), check, 3600):
+            admitted += 1
+        latencies.append(time.perf_counter() - start)
+    return admitted, latencies
+
+
+class Command(BaseCommand):
+    help = ('Compares the file cache and SQLite throttle stores under '
+            'concurrent worker processes')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4)
+        parser.add_argument('--requests', type=int, default=2000,
+                            help='Throttle checks per worker.')
+        parser.add_argument('--keys', type=int, default=100,
+                            help='Distinct throttled resources.')
+        parser.add_argument('--limit', type=int, default=5,
+                            help='Allowed requests per resource.')
+        parser.add_argument('--stores', default='file,sqlite')
+
+    def handle(self, *args, **options):
+        context = multiprocessing.get_context('fork')
+        allowed = options['keys'] * options['limit']
+        self.stdout.write('%d workers x %d checks, %d keys, %d allowed '
+                          'in total' % (options['workers'],
+                                        options['requests'], options['keys'],
+                                        allowed))
+        for kind in options['stores'].split(','):
+            tmp = tempfile.mkdtemp()
+            try:
+                jobs = [(kind, tmp, options['requests'], options['keys'],
+                         options['limit'])] * options['workers']
+                start = time.perf_counter()
+                with context.Pool(options['workers']) as pool:
+                    results = pool.map(worker, jobs)
+                elapsed = time.perf_counter() - start
+            finally:
+                shutil.rmtree(tmp)
+            admitted = sum(r[0] for r in results)
+            latencies = sorted(l for r in results for l in r[1])
+            total = len(latencies)
+            self.stdout.write(
+                '%-7s %8.0f checks/s  p50 %6.3fms  p99 %6.3fms  '
+                'admitted %d (%+d)' % (
+                    kind, total / elapsed,
+                    latencies[total // 2] * 1000,
+                    latencies[int(total * 0.99)] * 1000,
+                    admitted, admitted - allowed))
@@ -0,0 +1,95 @@
+import json
+import logging
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.loadgen import (DEFAULT_MIX, HTTPTransport, Traffic, WSGITransport,
+                         parse_mix, run)
+
+
+class Command(BaseCommand):
+    help = ('Replays a mix of availability reads, calendar day reads, '
+            'bookings and throttled updates with closed-loop clients and '
+            'reports throughput and latency per endpoint')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', help='Base URL of a running server, '
+                            'e.g. http://localhost:8000. Defaults to calling '
+                            'the WSGI application in-process.')
+        parser.add_argument('--clients', type=int, default=8)
+        parser.add_argument('--duration', type=float, default=10,
+                            help='Seconds to run.')
+        parser.add_argument('--requests', type=int,
+                            help='Stop after this many requests in total.')
+        parser.add_argument('--mix', type=parse_mix, default=DEFAULT_MIX,
+                            help='Endpoint weights, defaults to %s.' %
+                            ','.join('%s=%s' % item
+                                     for item in DEFAULT_MIX.items()))
+        parser.add_argument('--hot-reservations', type=int, default=100,
+                            help='Reservations the updates are spread over.')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--histogram', action='store_true',
+                            help='Also print the latency histograms.')
+        parser.add_argument('--output', help='Write the report as JSON.')
+
+    def handle(self, *args, **options):
+        if options['clients'] < 1:
+            raise CommandError('--clients should be at least 1.')
+        try:
+            traffic = Traffic(options['hot_reservations'])
+            transport = HTTPTransport(options['url']) if options['url'] \
+                else WSGITransport()
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        # Tracebacks of failed requests are counted, not printed
+        logger = logging.getLogger('django.request')
+        level = logger.level
+        logger.setLevel(logging.CRITICAL)
+        try:
+            report = run(transport, traffic, options['mix'],
+                         options['clients'], options['duration'],
+                         options['requests'], options['seed'])
+        finally:
+            logger.setLevel(level)
+            transport.shutdown()
+
+        self._print(report, options['histogram'])
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(report, f, indent=2, sort_keys=True)
+
+    def _print(self, report, histogram):
+        meta = report['meta']
+        self.stdout.write('%d clients, %.1fs, %s' % (
+            meta['clients'], meta['elapsed'], self.style.NOTICE(
+                ' '.join('%s=%g' % item for item in meta['mix'].items()))))
+        self.stdout.write('%-14s %8s %9s %9s %9s %9s %9s %9s %6s %6s' % (
+            'endpoint', 'requests', 'req/s', 'p50 ms', 'p90 ms', 'p99 ms',
+            'max ms', 'conflict', '429', 'locked'))
+        rows = sorted(report['endpoints'].items())
+        rows.append(('total', report['total']))
+        for name, summary in rows:
+            if not summary['requests']:
+                continue
+            self.stdout.write(
+                '%-14s %8d %9.1f %9.2f %9.2f %9.2f %9.2f %8.1f%% %5.1f%% '
+                '%6d' % (name, summary['requests'], summary['throughput'],
+                         summary['p50_ms'], summary['p90_ms'],
+                         summary['p99_ms'], summary['max_ms'],
+                         summary['conflict_rate'] * 100,
+                         summary['throttled_rate'] * 100,
+                         summary['lock_errors']))
+        for name, summary in rows[:-1]:
+            self.stdout.write('%-14s status %s' % (name, ' '.join(
+                '%s:%d' % item for item in summary['statuses'].items())))
+        if not histogram:
+            return
+        for name, summary in rows:
+            self.stdout.write('%s latency histogram' % name)
+            peak = max(count for _, count in summary['histogram']) or 1
+            for bound, count in summary['histogram']:
+                label = '<= %d ms' % bound if bound else '> %d ms' % \
+                    summary['histogram'][-2][0]
+                self.stdout.write('  %-11s %7d %s' % (
+                    label, count, '#' * int(round(40.0 * count / peak))))
@@ -0,0 +1,127 @@
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from functools import reduce
+
+from django.db.models import Q, QuerySet
+from django.utils.encoding import force_str
+
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPaginationMixin(object):
+    """ Opt-in keyset (seek) pagination on top of PageNumberPagination.
+
+    Requests with ?pagination=cursor, or with a ?cursor= from a previous
+    page, are paginated by `keyset_ordering` instead of page number: no
+    COUNT(*) and no OFFSET, each page is `WHERE (key) > (last key) LIMIT n`
+    on an index, so it costs the same at any depth. Cursors are opaque and
+    forward only. Everything else, including the browsable API, keeps the
+    page number behaviour.
+
+    Besides querysets, any sequence with a seek(after, limit) method, a
+    `model` and its own `keyset_ordering` on one field is paginated by
+    cursor, e.g. core.calendar_store.CompactCalendar.
+    """
+    keyset_ordering = ('id',)
+    cursor_query_param = 'cursor'
+    mode_query_param = 'pagination'
+
+    def use_keyset(self, queryset, request):
+        return (isinstance(queryset, QuerySet) or
+                hasattr(queryset, 'seek')) and (
+            self.cursor_query_param in request.query_params or
+            request.query_params.get(self.mode_query_param) == 'cursor')
+
+    def get_keyset_ordering(self, queryset):
+        if isinstance(queryset, QuerySet):
+            return self.keyset_ordering
+        return queryset.keyset_ordering
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = self.use_keyset(queryset, request)
+        if not self.keyset:
+            return super(KeysetPaginationMixin, self).paginate_queryset(
+                queryset, request, view)
+
+        self.request = request
+        page_size = self.get_page_size(request)
+        ordering = self.get_keyset_ordering(queryset)
+        position = self.decode_cursor(queryset, request, ordering)
+        if isinstance(queryset, QuerySet):
+            queryset = queryset.order_by(*ordering)
+            if position is not None:
+                queryset = queryset.filter(self.after(ordering, position))
+            results = list(queryset[:page_size + 1])
+        else:
+            after = None if position is None else position[0]
+            results = queryset.seek(after, page_size + 1)
+        self.has_next = len(results) > page_size
+        results = results[:page_size]
+        self.next_position = None
+        if self.has_next:
+            last = results[-1]
+            self.next_position = [getattr(last, field) for field in ordering]
+        self.display_page_controls = (self.template is not None and
+                                      self.has_next)
+        return results
+
+    def after(self, fields, position):
+        # (a, b) > (x, y)  <=>  a > x OR (a = x AND b > y)
+        clauses = []
+        for i, field in enumerate(fields):
+            equal = dict(zip(fields[:i], position[:i]))
+            equal[field + '__gt'] = position[i]
+            clauses.append(Q(**equal))
+        return reduce(lambda a, b: a | b, clauses)
+
+    def encode_cursor(self, position):
+        raw = json.dumps([str(value) for value in position])
+        return urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+    def decode_cursor(self, queryset, request, ordering):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            values = json.loads(force_str(urlsafe_b64decode(
+                encoded.encode('ascii'))))
+            if len(values) != len(ordering):
+                raise ValueError
+            opts = queryset.model._meta
+            return [opts.get_field(field).to_python(value)
+                    for field, value in zip(ordering, values)]
+        except Exception:
+            raise NotFound('Invalid cursor.')
+
+    def get_next_link(self):
+        if not self.keyset:
+            return super(KeysetPaginationMixin, self).get_next_link()
+        if self.next_position is None:
+            return None
+        url = remove_query_param(self.request.build_absolute_uri(),
+                                 self.mode_query_param)
+        return replace_query_param(url, self.cursor_query_param,
+                                   self.encode_cursor(self.next_position))
+
+    def get_paginated_response(self, data):
+        if not self.keyset:
+            return super(KeysetPaginationMixin, self) \
+                .get_paginated_response(data)
+        return Response({'next': self.get_next_link(), 'results': data})
+
+    def get_html_context(self):
+        if not self.keyset:
+            return super(KeysetPaginationMixin, self).get_html_context()
+        return {'previous_url': None, 'next_url': self.get_next_link(),
+                'page_links': []}
+
+
+class ReservationPagination(KeysetPaginationMixin, PageNumberPagination):
+    keyset_ordering = ('id',)
+
+
+class CalendarPagination(KeysetPaginationMixin, PageNumberPagination):
+    keyset_ordering = ('day', 'id')
@@ -0,0 +1,57 @@
+""" Read-your-writes for the replica routing of core.routers.
+
+PrimaryPinningMiddleware routes the reads of safe requests (GET, HEAD,
+OPTIONS) to a replica. A successful unsafe request gets a pin cookie back,
+valid for REPLICA_LAG_TOLERANCE seconds: until it expires, the requests of
+that client read from the primary, so they see the write even if the
+replicas lag behind by up to that much.
+"""
+import asyncio
+
+from django.conf import settings
+
+from core.routers import routing
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+def pin_cookie():
+    return getattr(settings, 'REPLICA_PIN_COOKIE', 'primary_pin')
+
+
+class PrimaryPinningMiddleware(object):
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = asyncio.iscoroutinefunction(get_response)
+        if self.is_async:
+            # Tells Django to await __call__, as MiddlewareMixin does
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def use_replicas(self, request):
+        return (request.method in SAFE_METHODS and
+                pin_cookie() not in request.COOKIES)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self._acall(request)
+        with routing(self.use_replicas(request)):
+            response = self.get_response(request)
+        return self.pin(request, response)
+
+    async def _acall(self, request):
+        with routing(self.use_replicas(request)):
+            response = await self.get_response(request)
+        return self.pin(request, response)
+
+    def pin(self, request, response):
+        # Not on core.routers.wrote(): the router is also asked for the
+        # write database when a related object is merely assigned
+        tolerance = getattr(settings, 'REPLICA_LAG_TOLERANCE', 0)
+        if (tolerance and request.method not in SAFE_METHODS and
+                response.status_code < 400):
+            response.set_cookie(pin_cookie(), '1', max_age=tolerance,
+                                httponly=True, samesite='Lax')
+        return response
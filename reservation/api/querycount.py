@@ -0,0 +1,203 @@
+""" Query count and SQL time instrumentation.
+
+QueryCountMiddleware records every statement a request runs, on every
+database connection. With DEBUG on it reports them in X-Query-* response
+headers, and it always aggregates them per view in `query_stats`.
+
+settings.QUERY_BUDGETS declares the most queries a view may run per
+method, e.g. {'ReservationList': {'GET': 3}}. Going over budget is logged;
+under BudgetTestRunner (the TEST_RUNNER) it raises QueryBudgetExceeded, so
+any test hitting the view fails.
+
+Under ASGI the middleware runs in async mode and the views run in other
+threads, whose connections it cannot wrap. The async read views
+(api.async_views) record their own queries on request.query_recorder;
+requests to the sync views are not counted there.
+
+Bookings written by core.booking_queue run their queries on its writer
+thread. The request is charged the share of the writer batches of its
+bookings, which the middleware adds to its own count.
+"""
+import asyncio
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+from core.booking_queue import booking_queue
+
+logger = logging.getLogger(__name__)
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+class QueryRecorder(object):
+    """ Context manager collecting (sql, seconds) of every statement run on
+    any connection while it is active """
+
+    def __init__(self):
+        self.queries = []
+        self.other_count = 0
+        self.other_time = 0.0
+        self._stack = None
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append((sql, time.perf_counter() - start))
+
+    def __enter__(self):
+        self._stack = ExitStack()
+        for connection in connections.all():
+            self._stack.enter_context(connection.execute_wrapper(self))
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stack.close()
+
+    def add_other(self, count, seconds):
+        """ Counts queries run for the request on another thread """
+        self.other_count += count
+        self.other_time += seconds
+
+    @property
+    def count(self):
+        return len(self.queries) + self.other_count
+
+    @property
+    def time(self):
+        return sum(duration for sql, duration in self.queries) + \
+            self.other_time
+
+    def slowest(self, n=3):
+        return sorted(self.queries, key=lambda q: q[1], reverse=True)[:n]
+
+
+class QueryStats(object):
+    """ Per view and method totals, kept in-process """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def add(self, view_name, method, recorder):
+        with self._lock:
+            stats = self._stats.setdefault((view_name, method), {
+                'requests': 0, 'queries': 0, 'max_queries': 0,
+                'sql_time': 0.0})
+            stats['requests'] += 1
+            stats['queries'] += recorder.count
+            stats['max_queries'] = max(stats['max_queries'], recorder.count)
+            stats['sql_time'] += recorder.time
+
+    def snapshot(self):
+        with self._lock:
+            return dict((key, dict(value))
+                        for key, value in self._stats.items())
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+
+
+query_stats = QueryStats()
+
+
+def get_budget(view_name, method):
+    budgets = getattr(settings, 'QUERY_BUDGETS', {})
+    return budgets.get(view_name, {}).get(method)
+
+
+class QueryCountMiddleware(object):
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = asyncio.iscoroutinefunction(get_response)
+        if self.is_async:
+            # Tells Django to await __call__, as MiddlewareMixin does
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        view = getattr(view_func, 'view_class', view_func)
+        request.query_view_name = view.__name__
+
+    def __call__(self, request):
+        if self.is_async:
+            return self._acall(request)
+        # Leftovers of code that ran on this thread outside a request
+        booking_queue.writer_queries()
+        with QueryRecorder() as recorder:
+            response = self.get_response(request)
+        recorder.add_other(*booking_queue.writer_queries())
+        return self.record(request, response, recorder)
+
+    async def _acall(self, request):
+        response = await self.get_response(request)
+        recorder = getattr(request, 'query_recorder', None)
+        if recorder is None:
+            return response
+        return self.record(request, response, recorder)
+
+    def record(self, request, response, recorder):
+        view_name = getattr(request, 'query_view_name', None)
+        if view_name is None:
+            return response
+
+        query_stats.add(view_name, request.method, recorder)
+        if settings.DEBUG:
+            response['X-Query-Count'] = str(recorder.count)
+            response['X-Query-Time-Ms'] = '%.2f' % (recorder.time * 1000)
+            slowest = recorder.slowest(1)
+            if slowest:
+                response['X-Query-Slowest-Ms'] = '%.2f' % (slowest[0][1] *
+                                                           1000)
+        budget = get_budget(view_name, request.method)
+        if budget is not None and recorder.count > budget:
+            message = '%s %s ran %d queries, budget is %d. Slowest: %s' % (
+                view_name, request.method, recorder.count, budget,
+                '; '.join(sql for sql, _ in recorder.slowest()))
+            if getattr(settings, 'QUERY_BUDGETS_STRICT', False):
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+        return response
+
+
+class BudgetTestRunner(DiscoverRunner):
+    """ Test runner failing any request that goes over its query budget.
+
+    Tests get their own throttle store and caches: the configured ones live
+    in /var/tmp, shared with the servers running on the host, and tests
+    clear them.
+    """
+
+    def setup_test_environment(self, **kwargs):
+        super(BudgetTestRunner, self).setup_test_environment(**kwargs)
+        settings.QUERY_BUDGETS_STRICT = True
+        self._tmp = tempfile.mkdtemp(prefix='reservation-tests-')
+        locmem = {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}
+        self._isolated = override_settings(
+            THROTTLE_STORE={
+                'BACKEND': 'api.throttle_store.SQLiteThrottleStore',
+                'LOCATION': os.path.join(self._tmp, 'throttle.sqlite3')},
+            CACHES=dict((alias, dict(locmem, LOCATION=alias))
+                        for alias in settings.CACHES))
+        self._isolated.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self._isolated.disable()
+        shutil.rmtree(self._tmp, ignore_errors=True)
+        super(BudgetTestRunner, self).teardown_test_environment(**kwargs)
@@ -0,0 +1,21 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from core.models import Room, Venue
+
+from .view_cache import view_cache
+
+
+# Drop exactly the cached Room and Venue responses a write can change
+@receiver(post_save, sender=Room)
+@receiver(post_delete, sender=Room)
+def room_changed(sender, instance, **kwargs):
+    view_cache.invalidate_on_commit([
+        'rooms', 'rooms:venue:%s' % instance.venue_id,
+        'room:%s' % instance.pk])
+
+
+@receiver(post_save, sender=Venue)
+@receiver(post_delete, sender=Venue)
+def venue_changed(sender, instance, **kwargs):
+    view_cache.invalidate_on_commit(['venues', 'venue:%s' % instance.pk])
@@ -3,3 +3,27 @@ from .guest import *
 from .room import *
 from .reservation import *
 from .calendar import *
+from .interval_index import *
+from .availability import *
+from .calendar_store import *
+from .bulk import *
+from .pagination import *
+from .calendar_builder import *
+from .throttling import *
+from .throttle_store import *
+from .querycount import *
+from .view_cache import *
+from .conditional import *
+from .export import *
+from .calendar_grid import *
+from .analytics import *
+from .pricing import *
+from .booking import *
+from .benchmarks import *
+from .synthetic import *
+from .loadgen import *
+from .async_views import *
+from .replicas import *
+from .booking_queue import *
+from .quotes import *
+from .search import *
@@ -0,0 +1,93 @@
+from datetime import date, timedelta
+
+import numpy as np
+from rest_framework import status
+
+from django.test import TestCase, Client, override_settings
+from django.urls import reverse
+
+from core import analytics
+from core.calendar_builder import build_calendar
+from core.models import Calendar, Guest, Reservation, Room, Venue
+
+client = Client()
+
+
+@override_settings(CACHES={'default': {
+    'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class OccupancyAnalyticsTest(TestCase):
+    """ Test module for the occupancy analytics """
+    venue_fields = ('name', 'address', 'city', 'zipcode', 'country', 'timezone')
+    venue_values = ('Hotel Galaxy', 'Outerspace Ln', 'LA', '10000', 'USA',
+                    'America/Los_Angeles')
+    guest_fields = ('name', 'address', 'city', 'zipcode', 'country')
+    guest_values = ('Superman', 'Outerspace Ln', 'LA', '10000', 'USA')
+
+    today = date.today()
+
+    def setUp(self):
+        self.venue = Venue.objects.create(
+            **dict(zip(self.venue_fields, self.venue_values)))
+        self.room1 = Room.objects.create(venue=self.venue, room_number='1')
+        self.room2 = Room.objects.create(venue=self.venue, room_number='2',
+                                         room_type='Deluxe')
+        self.guest = Guest.objects.create(
+            **dict(zip(self.guest_fields, self.guest_values)))
+        for room, amount, start, end in ((self.room1, 300, -2, 0),
+                                         (self.room1, 200, 0, 2),
+                                         (self.room2, 400, 1, 5)):
+            self._reserve(room, amount, start, end)
+        build_calendar(self.today, self.today + timedelta(days=1))
+        Calendar.objects.filter(room=self.room2).update(price=80)
+        self.end = self.today + timedelta(days=3)
+
+    def _reserve(self, room, amount, start, end):
+        return Reservation.objects.create(
+            venue=self.venue, room=room, guest=self.guest, amount=amount,
+            checkin=self.today + timedelta(days=start),
+            checkout=self.today + timedelta(days=end))
+
+    def test_nightly_counts(self):
+        counts = analytics.nightly_counts(np.array([0, 1, 1]),
+                                          np.array([2, 3, 1]), 4)
+        self.assertEqual(list(counts), [1, 2, 1, 0])
+
+    def test_occupancy(self):
+        response = client.get(reverse('api:analytics_occupancy'), {
+            'venue_id': self.venue.id, 'from': self.today.isoformat(),
+            'to': self.end.isoformat()})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = response.data
+        self.assertEqual(data['available'], [2, 2, 2, 2])
+        self.assertEqual(data['sold'], [1, 2, 1, 1])
+        self.assertEqual(data['occupancy'], [0.5, 1, 0.5, 0.5])
+        self.assertEqual(data['revenue'], [100, 200, 100, 100])
+        self.assertEqual(data['adr'], [100] * 4)
+        self.assertEqual(data['revpar'], [50, 100, 50, 50])
+        self.assertEqual(data['avg_price'], [90, 90, None, None])
+        self.assertEqual(data['summary'], {
+            'available': 8, 'sold': 5, 'occupancy': 0.625, 'revenue': 500,
+            'adr': 100, 'revpar': 62.5})
+
+    def test_room_type(self):
+        data = analytics.occupancy(self.venue.id, self.today, self.end,
+                                   'Deluxe')
+        self.assertEqual(data['available'], [1] * 4)
+        self.assertEqual(data['sold'], [0, 1, 1, 1])
+        self.assertEqual(data['avg_price'], [80, 80, None, None])
+
+    def test_cache(self):
+        first = analytics.occupancy(self.venue.id, self.today, self.end)
+        # Rooms and the fingerprint only
+        with self.assertNumQueries(3):
+            self.assertEqual(analytics.occupancy(
+                self.venue.id, self.today, self.end), first)
+        self._reserve(self.room1, 100, 3, 4)
+        self.assertEqual(analytics.occupancy(
+            self.venue.id, self.today, self.end)['sold'], [1, 2, 1, 2])
+
+    def test_validation(self):
+        response = client.get(reverse('api:analytics_occupancy'), {
+            'venue_id': self.venue.id, 'from': self.end.isoformat(),
+            'to': self.today.isoformat()})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
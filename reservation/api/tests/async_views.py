@@ -0,0 +1,89 @@
+import asyncio
+import time
+from datetime import date
+
+from asgiref.sync import sync_to_async
+from django.test import AsyncClient, Client, TransactionTestCase, \
+    override_settings
+from django.urls import resolve
+
+from api.management.commands.benchasync import asgi_request
+from api.querycount import query_stats
+from api.view_cache import view_cache
+from core.synthetic import generate
+from core.versions import bump_calendar_days
+from reservation.asgi import ReadPathASGIHandler
+
+
+@override_settings(ROOT_URLCONF='reservation.asgi_urls',
+                   ASYNC_LONG_POLL_INTERVAL=0.05)
+class AsyncViewsTest(TransactionTestCase):
+    """ Test module for the async read path of the ASGI entry point """
+    today = date.today()
+
+    def setUp(self):
+        generate(1, 3, 2, 4, 5, self.today, seed=0)
+        view_cache.clear()
+        self.day_url = '/api/calendar/%s' % self.today
+
+    def test_routes(self):
+        for path in ('/api/venues', '/api/venue/1', '/api/calendar',
+                     self.day_url, '/api/availability',
+                     '/api/analytics/occupancy'):
+            self.assertTrue(asyncio.iscoroutinefunction(resolve(
+                path, 'reservation.asgi_urls').func), path)
+        # Writes keep their sync views
+        for path in ('/api/reservations', '/api/reservation/1',
+                     '/api/rooms'):
+            self.assertFalse(asyncio.iscoroutinefunction(resolve(
+                path, 'reservation.asgi_urls').func), path)
+
+    async def test_same_responses(self):
+        sync_client = Client()
+        for path in ('/api/venues', '/api/calendar?venue_id=1&from=%s&to=%s'
+                     % (self.today, self.today), self.day_url):
+            response = await AsyncClient().get(path)
+            expected = await sync_to_async(sync_client.get)(path)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json(), expected.json())
+
+    async def test_query_stats(self):
+        query_stats.reset()
+        response = await AsyncClient().get('/api/venues')
+        self.assertEqual(response.status_code, 200)
+        stats = query_stats.snapshot()[('VenueList', 'GET')]
+        self.assertEqual(stats['requests'], 1)
+        self.assertGreater(stats['queries'], 0)
+
+    async def test_long_poll(self):
+        application = ReadPathASGIHandler()
+        url = self.day_url + '?wait=0.3'
+        _, headers = await asgi_request(application, url)
+        etag = headers[b'ETag']
+        start = time.monotonic()
+        status, _ = await asgi_request(application, url,
+                                       [(b'if-none-match', etag)])
+        self.assertEqual(status, 304)
+        self.assertGreaterEqual(time.monotonic() - start, 0.3)
+
+        async def change():
+            await asyncio.sleep(0.1)
+            await sync_to_async(bump_calendar_days)([self.today])
+
+        start = time.monotonic()
+        (status, headers), _ = await asyncio.gather(
+            asgi_request(application, url, [(b'if-none-match', etag)]),
+            change())
+        self.assertEqual(status, 200)
+        self.assertNotEqual(headers[b'ETag'], etag)
+        self.assertLess(time.monotonic() - start, 0.3)
+
+    async def test_asgi_application(self):
+        application = ReadPathASGIHandler()
+        status, headers = await asgi_request(application, '/api/venues')
+        self.assertEqual(status, 200)
+        status, headers = await asgi_request(application, self.day_url)
+        self.assertEqual(status, 200)
+        status, _ = await asgi_request(
+            application, self.day_url, [(b'if-none-match', headers[b'ETag'])])
+        self.assertEqual(status, 304)
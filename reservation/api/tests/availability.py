@@ -0,0 +1,162 @@
+from datetime import date, timedelta
+from rest_framework import status
+
+from django.db import transaction
+from django.test import TestCase, TransactionTestCase, Client
+from django.urls import reverse
+
+from core.availability import (availability_engine, free_rooms_from_db,
+                               day_mask, VenueAvailability)
+from core.models import Calendar, Room, Venue, Reservation, Guest
+
+client = Client()
+
+
+class AvailabilityMixin(object):
+    venue_values = ('Hotel Galaxy', 'Outerspace Ln', 'LA', '10000', 'USA',
+                    'America/Los_Angeles'),
+    venue_fields = ('name', 'address', 'city', 'zipcode', 'country', 'timezone')
+    venue_args = dict(zip(venue_fields, venue_values))
+
+    guest_fields = ('name', 'address', 'city', 'zipcode', 'country')
+    guest_values = ('Superman', 'Outerspace Ln', 'LA', '10000', 'USA'),
+    guest_args = dict(zip(guest_fields, guest_values))
+
+    today = date.today()
+
+    def setUp(self):
+        availability_engine.invalidate()
+        self.venue = Venue.objects.create(**self.venue_args)
+        self.room1 = Room.objects.create(venue=self.venue, room_number='1')
+        self.room2 = Room.objects.create(venue=self.venue, room_number='2',
+                                         room_type='Suite')
+        self.guest = Guest.objects.create(**self.guest_args)
+        self.reservation = self._create(self.room1, 1, 4)
+
+    def tearDown(self):
+        availability_engine.invalidate()
+
+    def _day(self, n):
+        return self.today + timedelta(days=n)
+
+    def _create(self, room, checkin, checkout):
+        return Reservation.objects.create(
+            venue=self.venue, room=room, guest=self.guest, amount=100,
+            checkin=self._day(checkin), checkout=self._day(checkout))
+
+    def _get(self, checkin, checkout, **params):
+        params.update({'venue_id': self.venue.id,
+                       'checkin': self._day(checkin).strftime('%Y-%m-%d'),
+                       'checkout': self._day(checkout).strftime('%Y-%m-%d')})
+        return client.get(reverse('api:availability'), params)
+
+    def _room_ids(self, response):
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [room['id'] for room in response.data['results']]
+
+
+class AvailabilityTest(AvailabilityMixin, TestCase):
+    """ Test module for the availability endpoint """
+
+    def test_list(self):
+        rooms = [self.room1.id, self.room2.id]
+        self.assertEqual(self._room_ids(self._get(4, 6)), rooms)
+        self.assertEqual(self._room_ids(self._get(0, 2)), [self.room2.id])
+        self.assertEqual(self._room_ids(self._get(0, 9)), [self.room2.id])
+
+    def test_room_type(self):
+        response = self._get(4, 6, room_type='Suite')
+        self.assertEqual(self._room_ids(response), [self.room2.id])
+
+    def test_empty_room_type(self):
+        # Answered by the DB inside the test transaction
+        response = self._get(4, 6, room_type='')
+        self.assertEqual(self._room_ids(response),
+                         [self.room1.id, self.room2.id])
+
+    def test_calendar_booked_day(self):
+        Calendar.objects.create(room=self.room2, venue=self.venue,
+                                day=self._day(10), price=100,
+                                reservation=self.reservation)
+        self.assertEqual(self._room_ids(self._get(9, 11)), [self.room1.id])
+
+    def test_bad_request(self):
+        response = self._get(4, 2)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = client.get(reverse('api:availability'),
+                              {'venue_id': self.venue.id, 'checkin': 'x'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_bitset(self):
+        availability = VenueAvailability(self.today, 30)
+        availability.add_room(1, 'Regular')
+        availability.add_stay(7, 1, self._day(2), self._day(5))
+        self.assertEqual(availability.booked[1], day_mask(2, 5))
+        self.assertEqual(availability.free_rooms(self._day(0), self._day(2)),
+                         [1])
+        self.assertEqual(availability.free_rooms(self._day(4), self._day(6)),
+                         [])
+        availability.discard_stay(7)
+        self.assertEqual(availability.booked[1], 0)
+
+
+class AvailabilityEngineTest(AvailabilityMixin, TransactionTestCase):
+    """ Engine is only used outside of transactions """
+
+    def _check(self, checkin, checkout, expected):
+        engine = availability_engine.free_rooms(
+            self.venue.id, self._day(checkin), self._day(checkout))
+        db = free_rooms_from_db(self.venue.id, self._day(checkin),
+                                self._day(checkout))
+        self.assertEqual(engine, expected)
+        self.assertEqual(db, expected)
+
+    def test_incremental_updates(self):
+        both = [self.room1.id, self.room2.id]
+        self._check(2, 3, [self.room2.id])
+        reservation = self._create(self.room2, 2, 3)
+        self._check(2, 3, [])
+        reservation.checkin, reservation.checkout = self._day(5), self._day(6)
+        reservation.save()
+        self._check(2, 3, [self.room2.id])
+        self._check(5, 6, [self.room1.id])
+        self.reservation.delete()
+        self._check(2, 3, both)
+        room3 = Room.objects.create(venue=self.venue, room_number='3')
+        self._check(2, 3, both + [room3.id])
+
+    def test_patched_on_commit(self):
+        self._check(2, 3, [self.room2.id])
+        loaded = availability_engine._venues[self.venue.id]
+        with transaction.atomic():
+            reservation = self._create(self.room2, 2, 3)
+            pk = reservation.pk
+            # Not answered for until the booking commits
+            self.assertIsNone(availability_engine.free_rooms(
+                self.venue.id, self._day(2), self._day(3)))
+        # The bits of the stay are set, the venue is not reloaded
+        self.assertIs(availability_engine._venues[self.venue.id], loaded)
+        self._check(2, 3, [])
+        with self.assertRaises(RuntimeError):
+            with transaction.atomic():
+                reservation.delete()
+                raise RuntimeError
+        self._check(2, 3, [])
+        Reservation.objects.get(pk=pk).delete()
+        self.assertIs(availability_engine._venues[self.venue.id], loaded)
+        self._check(2, 3, [self.room2.id])
+
+    def test_empty_room_type(self):
+        rooms = [self.room1.id, self.room2.id]
+        for room_type in (None, ''):
+            self.assertEqual(availability_engine.free_rooms(
+                self.venue.id, self._day(4), self._day(6), room_type), rooms)
+            self.assertEqual(free_rooms_from_db(
+                self.venue.id, self._day(4), self._day(6), room_type), rooms)
+        self.assertEqual(self._room_ids(self._get(4, 6, room_type='')), rooms)
+
+    def test_outside_horizon(self):
+        self.assertIsNone(availability_engine.free_rooms(
+            self.venue.id, self._day(-2), self._day(1)))
+        self.assertEqual(self._room_ids(self._get(-2, 1)),
+                         [self.room1.id, self.room2.id])
@@ -0,0 +1,39 @@
+from django.test import TestCase
+
+from api.benchmarks import (Runner, bench_clean, bench_serializers,
+                            compare)
+
+
+class BenchmarksTest(TestCase):
+    """ Test module for the benchmark runner and the baseline comparison """
+
+    def test_measure(self):
+        calls = []
+        runner = Runner(repeat=3, only=['serializer'])
+        runner.measure('serializer', lambda: calls.append(1), number=4,
+                       setup=lambda: calls.append(0))
+        runner.measure('throttle', lambda: calls.append(2))
+        self.assertEqual(calls, [0, 1, 1, 1, 1] * 3)
+        self.assertEqual(list(runner.results), ['serializer'])
+        result = runner.results['serializer']
+        self.assertEqual((result['number'], result['repeat']), (4, 3))
+        self.assertLessEqual(result['min'], result['median'])
+
+    def test_groups(self):
+        runner = Runner(repeat=1)
+        bench_serializers(runner, page_sizes=(10,))
+        bench_clean(runner, [300], probes=10)
+        self.assertEqual(sorted(runner.results), [
+            'CalendarSerializer[10]', 'Reservation.clean[db,300]',
+            'Reservation.clean[index,300]', 'ReservationSerializer[10]'])
+
+    def test_compare(self):
+        def results(**medians):
+            return {'results': dict((name, {'median': median})
+                                    for name, median in medians.items())}
+
+        rows = compare(results(a=1.1, b=1.5, c=1), results(a=1.0, b=1.0),
+                       0.2)
+        self.assertEqual([(name, regressed)
+                          for name, _, _, _, regressed in rows],
+                         [('a', False), ('b', True)])
@@ -0,0 +1,149 @@
+import json
+import threading
+from datetime import date, timedelta
+from rest_framework import status
+from rest_framework.exceptions import ValidationError
+
+from django.db import OperationalError, connection
+from django.test import TestCase, TransactionTestCase, Client, \
+    override_settings
+from django.urls import reverse
+
+from core import bulk
+from core.calendar_builder import build_calendar
+from core.models import Calendar, Guest, Reservation, Room, Venue
+
+client = Client()
+
+
+class BookingFixture(object):
+    venue_fields = ('name', 'address', 'city', 'zipcode', 'country', 'timezone')
+    venue_values = ('Hotel Galaxy', 'Outerspace Ln', 'LA', '10000', 'USA',
+                    'America/Los_Angeles')
+    guest_fields = ('name', 'address', 'city', 'zipcode', 'country')
+    guest_values = ('Superman', 'Outerspace Ln', 'LA', '10000', 'USA')
+
+    today = date.today()
+
+    def setUp(self):
+        self.venue = Venue.objects.create(
+            **dict(zip(self.venue_fields, self.venue_values)))
+        self.room = Room.objects.create(venue=self.venue, room_number='1')
+        self.guest = Guest.objects.create(
+            **dict(zip(self.guest_fields, self.guest_values)))
+        build_calendar(self.today, self.today + timedelta(days=9))
+
+    def _day(self, offset):
+        return self.today + timedelta(days=offset)
+
+    def _reservation(self, start, end):
+        return Reservation(venue=self.venue, room=self.room, guest=self.guest,
+                           amount=100, checkin=self._day(start),
+                           checkout=self._day(end))
+
+    def _record(self, start, end):
+        # Nights cost the default price of the calendar
+        return {'venue_id': self.venue.id, 'room_id': self.room.id,
+                'guest_id': self.guest.id, 'amount': 100 * (end - start),
+                'checkin': self._day(start), 'checkout': self._day(end)}
+
+    def _claimed(self):
+        return dict(Calendar.objects.filter(reservation__isnull=False)
+                    .values_list('day', 'reservation_id'))
+
+
+@override_settings(BOOKING_MODE='claim')
+class ClaimBookingTest(BookingFixture, TestCase):
+    """ Test module for the claim booking mode """
+
+    def test_claim(self):
+        response = client.post(reverse('api:reservations'),
+                               content_type='application/json',
+                               data=json.dumps(self._record(1, 3),
+                                               default=str))
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        pk = response.data['id']
+        self.assertEqual(self._claimed(), {self._day(1): pk,
+                                           self._day(2): pk})
+
+        response = client.post(reverse('api:reservations'),
+                               content_type='application/json',
+                               data=json.dumps(self._record(2, 4),
+                                               default=str))
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(Reservation.objects.count(), 1)
+
+    def test_not_in_calendar(self):
+        with self.assertRaises(ValidationError):
+            self._reservation(8, 12).save()
+        self.assertEqual(Reservation.objects.count(), 0)
+        self.assertEqual(self._claimed(), {})
+
+    def test_change_and_delete(self):
+        reservation = self._reservation(1, 3)
+        reservation.save()
+        reservation.checkin, reservation.checkout = self._day(2), self._day(5)
+        reservation.save()
+        self.assertEqual(sorted(self._claimed()), [self._day(i)
+                                                   for i in (2, 3, 4)])
+        reservation.delete()
+        self.assertEqual(self._claimed(), {})
+
+    def test_bulk(self):
+        records = [self._record(0, 2), self._record(9, 11)]
+        results = bulk.create_reservations(records, bulk.ATOMIC)
+        self.assertEqual([r.status for r in results],
+                         [bulk.SKIPPED, bulk.ERROR])
+        self.assertEqual(Reservation.objects.count(), 0)
+        self.assertEqual(self._claimed(), {})
+
+        results = bulk.create_reservations(records, bulk.BEST_EFFORT)
+        self.assertEqual([r.status for r in results],
+                         [bulk.CREATED, bulk.ERROR])
+        pk = results[0].reservation.pk
+        self.assertEqual(list(Reservation.objects.values_list('pk', flat=True)),
+                         [pk])
+        self.assertEqual(self._claimed(), {self._day(0): pk,
+                                           self._day(1): pk})
+
+
+@override_settings(BOOKING_MODE='claim')
+class ClaimContentionTest(BookingFixture, TransactionTestCase):
+    """ Concurrent bookings of overlapping stays, exactly one must win """
+    threads = 8
+
+    def _book(self, start, barrier, outcomes):
+        try:
+            barrier.wait()
+            while True:
+                try:
+                    self._reservation(start, start + 3).save()
+                    outcomes.append('booked')
+                    return
+                except ValidationError:
+                    outcomes.append('conflict')
+                    return
+                except OperationalError:
+                    # SQLite lets one writer at a time, the others retry
+                    continue
+        finally:
+            connection.close()
+
+    def test_contention(self):
+        barrier = threading.Barrier(self.threads)
+        outcomes = []
+        threads = [threading.Thread(target=self._book,
+                                    args=(i % 3, barrier, outcomes))
+                   for i in range(self.threads)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(sorted(outcomes),
+                         ['booked'] + ['conflict'] * (self.threads - 1))
+        reservation = Reservation.objects.get()
+        claimed = self._claimed()
+        self.assertEqual(sorted(claimed), [
+            reservation.checkin + timedelta(days=i) for i in range(3)])
+        self.assertEqual(set(claimed.values()), set([reservation.pk]))
@@ -0,0 +1,188 @@
+import json
+import threading
+from concurrent.futures import Future
+
+from rest_framework import status
+from rest_framework.exceptions import ValidationError
+
+from django.db import connection
+from django.test import Client, TestCase, TransactionTestCase, \
+    override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from api.querycount import QueryRecorder
+from api.throttle_store import get_throttle_store
+# Aliased, api.tests star-imports this module named booking_queue too
+from core.booking_queue import CREATE, UPDATE, BookingQueue, \
+    booking_queue as shared_queue
+from core.models import Reservation, Room
+from core.serializers import ReservationSerializer
+
+from .booking import BookingFixture
+
+
+class Busy(object):
+    """ An update keeping the writer busy until released """
+
+    def __init__(self):
+        self.started = threading.Event()
+        self.released = threading.Event()
+
+    def save(self):
+        self.started.set()
+        self.released.wait(5)
+
+
+class BookingQueueTest(BookingFixture, TestCase):
+    """ Test module for the group commit of the booking queue """
+
+    def _create(self, start, end):
+        return (CREATE, self._record(start, end), Future())
+
+    def _update(self, reservation, start, end):
+        serializer = ReservationSerializer(
+            reservation, data={'checkin': self._day(start),
+                               'checkout': self._day(end)}, partial=True)
+        self.assertTrue(serializer.is_valid())
+        return (UPDATE, serializer, Future())
+
+    def test_batch(self):
+        queue = BookingQueue()
+        existing = self._reservation(8, 9)
+        existing.save()
+        jobs = [self._create(1, 3), self._create(2, 4), self._create(4, 5),
+                self._update(existing, 4, 6), self._update(existing, 7, 9)]
+        with CaptureQueriesContext(connection) as queries:
+            queue._write(jobs)
+        # The creates share one overlap query and one insert
+        inserts = [q for q in queries.captured_queries
+                   if q['sql'].startswith('INSERT INTO "core_reservation"')]
+        self.assertEqual(len(inserts), 1)
+        created = jobs[0][2].result()
+        self.assertEqual(created.checkin, self._day(1))
+        with self.assertRaises(ValidationError):
+            jobs[1][2].result()
+        self.assertEqual(jobs[2][2].result().checkin, self._day(4))
+        # Overlaps the create of the same batch
+        with self.assertRaises(ValidationError):
+            jobs[3][2].result()
+        self.assertEqual(jobs[4][2].result().checkin, self._day(7))
+        self.assertEqual(sorted(Reservation.objects.values_list(
+            'checkin', flat=True)), [self._day(1), self._day(4),
+                                     self._day(7)])
+        self.assertEqual(queue.stats(), {'batches': 1, 'bookings': 5})
+
+    def test_missing_room(self):
+        queue = BookingQueue()
+        job = self._create(1, 2)
+        job[1]['room_id'] = 0
+        queue._write([job])
+        with self.assertRaises(ValidationError) as raised:
+            job[2].result()
+        self.assertIn('room_id', raised.exception.detail)
+
+    def test_failed_update(self):
+        queue = BookingQueue()
+
+        class Broken(object):
+            def save(self):
+                Reservation.objects.all().delete()
+                raise RuntimeError('broken')
+
+        jobs = [self._create(1, 2), (UPDATE, Broken(), Future())]
+        queue._write(jobs)
+        # Its savepoint is rolled back, the rest of the batch commits
+        with self.assertRaises(RuntimeError):
+            jobs[1][2].result()
+        self.assertEqual(Reservation.objects.get().pk,
+                         jobs[0][2].result().pk)
+
+
+@override_settings(BOOKING_QUEUE_ENABLED=True)
+class BookingQueueWriterTest(BookingFixture, TransactionTestCase):
+    """ Test module for concurrent bookings through the writer thread """
+
+    def setUp(self):
+        super(BookingQueueWriterTest, self).setUp()
+        for number in range(2, 9):
+            Room.objects.create(venue=self.venue, room_number=str(number))
+        shared_queue.reset_stats()
+
+    def tearDown(self):
+        get_throttle_store().clear()
+
+    def test_concurrent_posts(self):
+        rooms = list(Room.objects.values_list('id', flat=True))
+        codes = []
+        barrier = threading.Barrier(len(rooms) * 3)
+
+        def book(room_id):
+            record = dict(self._record(1, 3), room_id=room_id)
+            barrier.wait()
+            response = Client().post(
+                reverse('api:reservations'), content_type='application/json',
+                data=json.dumps(record, default=str))
+            codes.append(response.status_code)
+
+        threads = [threading.Thread(target=book, args=(room_id,))
+                   for room_id in rooms for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        # One booking per room wins, none fails on the database lock
+        self.assertEqual(sorted(codes), [status.HTTP_201_CREATED] *
+                         len(rooms) + [status.HTTP_400_BAD_REQUEST] *
+                         len(rooms) * 2)
+        self.assertEqual(Reservation.objects.count(), len(rooms))
+        stats = shared_queue.stats()
+        self.assertEqual(stats['bookings'], len(threads))
+        self.assertLessEqual(stats['batches'], len(threads))
+
+    def test_patch(self):
+        reservation = self._reservation(1, 2)
+        reservation.save()
+        response = Client().patch(
+            reverse('api:reservation', kwargs={'pk': reservation.pk}),
+            content_type='application/json',
+            data=json.dumps({'checkout': str(self._day(4))}))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['checkout'], str(self._day(4)))
+        reservation.refresh_from_db()
+        self.assertEqual(reservation.checkout, self._day(4))
+        self.assertEqual(shared_queue.stats()['bookings'], 1)
+
+    @override_settings(DEBUG=True)
+    def test_writer_queries(self):
+        reservation = self._reservation(1, 2)
+        reservation.save()
+        with QueryRecorder() as recorder:
+            response = Client().patch(
+                reverse('api:reservation', kwargs={'pk': reservation.pk}),
+                content_type='application/json',
+                data=json.dumps({'checkout': str(self._day(4))}))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        # The queries of the writer thread count for the request
+        self.assertGreater(int(response['X-Query-Count']), recorder.count)
+        self.assertEqual(shared_queue.writer_queries(), (0, 0.0))
+
+    def test_timeout(self):
+        busy = Busy()
+        shared_queue._start()
+        shared_queue._queue.put((UPDATE, busy, Future()))
+        self.assertTrue(busy.started.wait(5))
+        try:
+            with self.settings(BOOKING_QUEUE_TIMEOUT=0.1):
+                response = Client().post(
+                    reverse('api:reservations'),
+                    content_type='application/json',
+                    data=json.dumps(self._record(1, 3), default=str))
+        finally:
+            busy.released.set()
+        self.assertEqual(response.status_code,
+                         status.HTTP_503_SERVICE_UNAVAILABLE)
+        # The writer drops the booking the request gave up on
+        shared_queue.create(self._record(5, 6))
+        self.assertEqual(list(Reservation.objects.values_list(
+            'checkin', flat=True)), [self._day(5)])
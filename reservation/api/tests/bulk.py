@@ -0,0 +1,129 @@
+import json
+from datetime import date, timedelta
+from rest_framework import status
+
+from django.db import connection
+from django.test import TestCase, Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from core.calendar_builder import build_calendar
+from core.models import Room, Venue, Reservation, Guest
+from core.serializers import ReservationSerializer
+
+client = Client()
+
+
+class ReservationBulkTest(TestCase):
+    """ Test module for bulk Reservation creation """
+    venue_values = ('Hotel Galaxy', 'Outerspace Ln', 'LA', '10000', 'USA',
+                    'America/Los_Angeles'),
+    venue_fields = ('name', 'address', 'city', 'zipcode', 'country', 'timezone')
+    venue_args = dict(zip(venue_fields, venue_values))
+
+    guest_fields = ('name', 'address', 'city', 'zipcode', 'country')
+    guest_values = ('Superman', 'Outerspace Ln', 'LA', '10000', 'USA'),
+    guest_args = dict(zip(guest_fields, guest_values))
+
+    today = date.today()
+
+    def setUp(self):
+        self.venue = Venue.objects.create(**self.venue_args)
+        self.room1 = Room.objects.create(venue=self.venue, room_number='1')
+        self.room2 = Room.objects.create(venue=self.venue, room_number='2')
+        self.guest = Guest.objects.create(**self.guest_args)
+        Reservation.objects.create(
+            venue=self.venue, room=self.room1, guest=self.guest, amount=100,
+            checkin=self.today + timedelta(days=1),
+            checkout=self.today + timedelta(days=5))
+
+    def _record(self, room, checkin, checkout):
+        return {'venue_id': self.venue.id, 'room_id': room.id,
+                'guest_id': self.guest.id, 'amount': 100, 'state': 0,
+                'checkin': (self.today + timedelta(days=checkin)).isoformat(),
+                'checkout': (self.today + timedelta(days=checkout)).isoformat()}
+
+    def _post(self, records, mode=None):
+        url = reverse('api:reservations_bulk')
+        if mode:
+            url += '?mode=%s' % mode
+        return client.post(url, content_type='application/json',
+                           data=json.dumps(records))
+
+    def test_post(self):
+        records = [self._record(self.room1, 5, 7),
+                   self._record(self.room2, 1, 3),
+                   self._record(self.room2, 3, 4)]
+        response = self._post(records)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual([r['status'] for r in response.data],
+                         ['created'] * 3)
+        self.assertEqual(Reservation.objects.count(), 4)
+        for item in response.data:
+            reservation = Reservation.objects.get(
+                pk=item['reservation']['id'])
+            self.assertEqual(item['reservation'],
+                             ReservationSerializer(reservation).data)
+
+    def test_atomic(self):
+        records = [self._record(self.room2, 1, 3),
+                   self._record(self.room1, 0, 9)]
+        response = self._post(records)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual([r['status'] for r in response.data],
+                         ['skipped', 'error'])
+        self.assertEqual(Reservation.objects.count(), 1)
+
+    def test_best_effort(self):
+        records = [self._record(self.room2, 1, 3),
+                   self._record(self.room2, 2, 4),
+                   self._record(self.room1, 2, 3),
+                   dict(self._record(self.room2, 5, 6), guest_id=None),
+                   self._record(self.room2, 7, 6)]
+        response = self._post(records, mode='best_effort')
+        self.assertEqual(response.status_code, status.HTTP_207_MULTI_STATUS)
+        self.assertEqual([r['status'] for r in response.data],
+                         ['created', 'error', 'error', 'error', 'error'])
+        self.assertEqual(Reservation.objects.count(), 2)
+
+    def test_amounts(self):
+        # Nights at 100
+        build_calendar(self.today, self.today + timedelta(days=59))
+        records = [self._record(self.room2, day, day + 1)
+                   for day in range(5, 55)]
+        with CaptureQueriesContext(connection) as queries:
+            response = self._post(records)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        # One price query for the whole batch
+        prices = [q for q in queries.captured_queries
+                  if 'FROM "core_calendar"' in q['sql']]
+        self.assertEqual(len(prices), 1)
+        self.assertLess(len(queries), 15)
+
+        unpriced = self._record(self.room1, 70, 71)
+        del unpriced['amount']
+        records = [dict(self._record(self.room1, 55, 57), amount=150),
+                   self._record(self.room1, 57, 58), unpriced]
+        del records[1]['amount']
+        response = self._post(records, mode='best_effort')
+        self.assertEqual(response.status_code, status.HTTP_207_MULTI_STATUS)
+        self.assertEqual([r['status'] for r in response.data],
+                         ['error', 'created', 'error'])
+        self.assertIn('200.00', response.data[0]['errors']['amount'])
+        self.assertEqual(response.data[1]['reservation']['amount'], '100.00')
+        self.assertEqual(response.data[2]['errors'],
+                         {'amount': 'This field is required.'})
+
+    def test_unknown_room(self):
+        other = Venue.objects.create(name='Other', address='1', city='LA',
+                                     zipcode='1', timezone='UTC')
+        room = Room.objects.create(venue=other, room_number='1')
+        response = self._post([self._record(room, 1, 2)])
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('room_id', response.data[0]['errors'])
+
+    def test_bad_request(self):
+        response = self._post({'venue_id': self.venue.id})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self._post([], mode='all')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
@@ -0,0 +1,98 @@
+from datetime import date, timedelta
+from io import StringIO
+
+from django.core.management import CommandError, call_command
+from django.test import TestCase
+
+from core.calendar_builder import _build_partition, build_calendar
+from core.models import Calendar, Room, Venue, Reservation, Guest
+
+
+class CalendarBuilderTest(TestCase):
+    """ Test module for the incremental calendar builder """
+    venue_fields = ('name', 'address', 'city', 'zipcode', 'country', 'timezone')
+    venue1_values = ('Hotel Galaxy', 'Outerspace Ln', 'LA', '10000', 'USA',
+                     'America/Los_Angeles'),
+    venue2_values = ('Hotel Avengers', 'Avengers HQ', 'LA', '90000', 'USA',
+                     'America/Los_Angeles'),
+
+    guest_fields = ('name', 'address', 'city', 'zipcode', 'country')
+    guest_values = ('Superman', 'Outerspace Ln', 'LA', '10000', 'USA'),
+    guest_args = dict(zip(guest_fields, guest_values))
+
+    today = date.today()
+    end = today + timedelta(days=9)
+
+    def setUp(self):
+        self.venue1 = Venue.objects.create(
+            **dict(zip(self.venue_fields, self.venue1_values)))
+        self.venue2 = Venue.objects.create(
+            **dict(zip(self.venue_fields, self.venue2_values)))
+        self.room1 = Room.objects.create(venue=self.venue1, room_number='1')
+        self.room2 = Room.objects.create(venue=self.venue1, room_number='2')
+        self.room3 = Room.objects.create(venue=self.venue2, room_number='1')
+        guest = Guest.objects.create(**self.guest_args)
+        self.reservation = Reservation.objects.create(
+            venue=self.venue1, room=self.room1, guest=guest, amount=300,
+            checkin=self.today + timedelta(days=2),
+            checkout=self.today + timedelta(days=5))
+
+    def _booked(self):
+        return sorted(Calendar.objects.filter(reservation__isnull=False)
+                      .values_list('room_id', 'day', 'reservation_id'))
+
+    def _expected(self, checkin, checkout):
+        return [(self.room1.id, self.today + timedelta(days=i),
+                 self.reservation.id) for i in range(checkin, checkout)]
+
+    def test_build(self):
+        stats = build_calendar(self.today, self.end, batch_size=7)
+        self.assertEqual(stats.created, 30)
+        self.assertEqual(Calendar.objects.count(), 30)
+        self.assertEqual(self._booked(), self._expected(2, 5))
+
+    def test_incremental(self):
+        build_calendar(self.today, self.end)
+        self.reservation.checkin = self.today + timedelta(days=4)
+        self.reservation.checkout = self.today + timedelta(days=7)
+        self.reservation.save()
+        Calendar.objects.filter(room=self.room2, day=self.today).delete()
+        Calendar.objects.filter(room=self.room2).update(price=120)
+        stats = build_calendar(self.today, self.end)
+        self.assertEqual(stats.created, 1)
+        # Days 2, 3, 5 and 6 changed, day 4 stays booked
+        self.assertEqual(stats.updated, 4)
+        self.assertEqual(stats.unchanged, 25)
+        self.assertEqual(self._booked(), self._expected(4, 7))
+        # Prices belong to the pricing job
+        self.assertEqual(
+            Calendar.objects.filter(room=self.room2, price=120).count(), 9)
+
+    def test_command(self):
+        out = StringIO()
+        call_command('buildcalendar', '--venue', str(self.venue2.id),
+                     '--from', self.today.isoformat(),
+                     '--to', self.end.isoformat(), stdout=out)
+        self.assertIn('10 days created', out.getvalue())
+        self.assertEqual(set(Calendar.objects.values_list('room_id',
+                                                          flat=True)),
+                         set([self.room3.id]))
+
+    def test_partition(self):
+        # What each worker process of a parallel build runs
+        stats = _build_partition(
+            [(self.venue1.id, [self.room1.id, self.room2.id]),
+             (self.venue2.id, [self.room3.id])], self.today, self.end, 100,
+            batch_size=7)
+        self.assertEqual((stats.venues, stats.created), (2, 30))
+        self.assertEqual(self._booked(), self._expected(2, 5))
+
+    def test_workers(self):
+        # The in-memory test database cannot be shared with other processes
+        progress = []
+        stats = build_calendar(self.today, self.end, workers=4,
+                               progress=progress.append)
+        self.assertEqual((stats.venues, stats.created), (2, 30))
+        self.assertEqual(len(progress), 2)
+        with self.assertRaises(CommandError):
+            call_command('buildcalendar', '--workers', '0')
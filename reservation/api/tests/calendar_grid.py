@@ -0,0 +1,104 @@
+from datetime import date, timedelta
+from rest_framework import status
+
+from django.db import connection
+from django.test import TestCase, Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from core.calendar_builder import build_calendar
+from core.calendar_store import compact_calendar
+from core.models import Calendar, Guest, Reservation, Room, Venue
+
+client = Client()
+
+
+class CalendarGridTest(TestCase):
+    """ Test module for the calendar range matrix """
+    venue_fields = ('name', 'address', 'city', 'zipcode', 'country', 'timezone')
+    venue_values = ('Hotel Galaxy', 'Outerspace Ln', 'LA', '10000', 'USA',
+                    'America/Los_Angeles')
+    guest_fields = ('name', 'address', 'city', 'zipcode', 'country')
+    guest_values = ('Superman', 'Outerspace Ln', 'LA', '10000', 'USA')
+
+    today = date.today()
+
+    def setUp(self):
+        self.venue = Venue.objects.create(
+            **dict(zip(self.venue_fields, self.venue_values)))
+        self.room1 = Room.objects.create(venue=self.venue, room_number='1')
+        self.room2 = Room.objects.create(venue=self.venue, room_number='2',
+                                         room_type='Deluxe')
+        guest = Guest.objects.create(
+            **dict(zip(self.guest_fields, self.guest_values)))
+        Reservation.objects.create(
+            venue=self.venue, room=self.room1, guest=guest, amount=300,
+            checkin=self.today + timedelta(days=1),
+            checkout=self.today + timedelta(days=3))
+        build_calendar(self.today, self.today + timedelta(days=2))
+        Calendar.objects.filter(room=self.room2).update(price=80)
+        self.params = {'venue_id': self.venue.id,
+                       'from': self.today.isoformat(),
+                       'to': (self.today + timedelta(days=3)).isoformat()}
+
+    def _get(self, **params):
+        query = dict(self.params)
+        query.update(params)
+        return client.get(reverse('api:calendar'), query)
+
+    def test_matrix(self):
+        response = self._get()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = response.data
+        self.assertEqual(len(data['days']), 4)
+        self.assertEqual([room['id'] for room in data['rooms']],
+                         [self.room1.id, self.room2.id])
+        room1 = data['rooms'][0]
+        # Day 3 was never built
+        self.assertEqual(room1['booked'], [False, True, True, None])
+        self.assertEqual(room1['prices'][:3], [100] * 3)
+        self.assertIsNone(room1['prices'][3])
+        self.assertNotIn('aggregates', data)
+
+    def test_aggregates(self):
+        aggregates = self._get(aggregates='true').data['aggregates']
+        self.assertEqual(aggregates['min_price'], [80, 80, 80, None])
+        self.assertEqual(aggregates['free_rooms'], [2, 1, 1, 0])
+        self.assertEqual(aggregates['occupancy'], [0, 0.5, 0.5, None])
+
+    def test_room_type(self):
+        data = self._get(room_type='Deluxe').data
+        self.assertEqual([room['id'] for room in data['rooms']],
+                         [self.room2.id])
+
+    def test_many_rooms(self):
+        # The entries query binds the same parameters whatever the number
+        # of rooms, clear of SQLite's host parameter limit
+        Room.objects.bulk_create([Room(venue=self.venue, room_number=str(n))
+                                  for n in range(3, 1203)])
+        with CaptureQueriesContext(connection) as queries:
+            data = self._get(room_type='Regular').data
+        self.assertEqual(len(data['rooms']), 1201)
+        self.assertEqual(data['rooms'][0]['prices'][:3], [100] * 3)
+        calendar = [q['sql'] for q in queries.captured_queries
+                    if 'FROM "core_calendar"' in q['sql']]
+        self.assertEqual(len(calendar), 1)
+        self.assertNotIn(' IN (', calendar[0])
+
+    def test_compact(self):
+        expected = self._get(aggregates='true').data
+        compact_calendar()
+        with override_settings(CALENDAR_STORAGE='compact'):
+            self.assertEqual(self._get(aggregates='true').data, expected)
+
+    def test_validation(self):
+        self.assertEqual(self._get(venue_id='').status_code,
+                         status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self._get(to=self.today - timedelta(days=1))
+                         .status_code, status.HTTP_400_BAD_REQUEST)
+        with self.settings(CALENDAR_RANGE_MAX_DAYS=3):
+            self.assertEqual(self._get().status_code,
+                             status.HTTP_400_BAD_REQUEST)
+        # Without a range the paginated list is unchanged
+        response = client.get(reverse('api:calendar'))
+        self.assertEqual(response.data['count'], 6)
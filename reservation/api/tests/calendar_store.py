@@ -0,0 +1,178 @@
+from datetime import date, timedelta
+from decimal import Decimal
+from rest_framework import status
+
+from django.test import TestCase, Client, override_settings
+from django.urls import reverse
+
+from core.calendar_builder import build_calendar
+from core.calendar_store import (CompactCalendar, compact_calendar,
+                                 compact_rows, pack, unpack)
+from core.models import Calendar, CalendarMonth, Guest, Reservation, Room, \
+    Venue
+from core.pricing import PricingRules, reprice
+from core.serializers import CalendarSerializer
+
+client = Client()
+
+
+class CompactCalendarTest(TestCase):
+    """ Test module for the compact calendar storage """
+    venue_values = ('Hotel Galaxy', 'Outerspace Ln', 'LA', '10000', 'USA',
+                    'America/Los_Angeles'),
+    venue_fields = ('name', 'address', 'city', 'zipcode', 'country', 'timezone')
+    venue_args = dict(zip(venue_fields, venue_values))
+
+    start = date(2030, 1, 20)
+
+    def setUp(self):
+        venue = Venue.objects.create(**self.venue_args)
+        for number in ('1', '2'):
+            room = Room.objects.create(venue=venue, room_number=number)
+            for i in range(20):
+                Calendar.objects.create(
+                    room=room, venue=venue, price=Decimal('99.50') + i,
+                    day=self.start + timedelta(days=i))
+        compact_calendar()
+
+    def _without_ids(self, data):
+        return [dict(row, id=None) for row in data]
+
+    def test_pack(self):
+        self.assertEqual(list(unpack(pack([-1, 0, 2 ** 40]))),
+                         [-1, 0, 2 ** 40])
+
+    def test_compaction(self):
+        # 2 rooms over January and February
+        self.assertEqual(CalendarMonth.objects.count(), 4)
+        self.assertEqual(CompactCalendar().count(), Calendar.objects.count())
+
+    def test_same_entries(self):
+        rows = CalendarSerializer(
+            Calendar.objects.order_by('room_id', 'day'), many=True).data
+        entries = sorted(CalendarSerializer(CompactCalendar(), many=True).data,
+                         key=lambda row: (row['room_id'], row['day']))
+        self.assertEqual(self._without_ids(entries), self._without_ids(rows))
+
+    def test_slicing(self):
+        entries = list(CompactCalendar())
+        self.assertEqual(len(set(entry.id for entry in entries)), 40)
+        for start, stop in ((0, 10), (10, 20), (25, 35), (35, 45), (19, 21),
+                            (39, 40), (0, 40), (12, 12)):
+            self.assertEqual([e.id for e in CompactCalendar()[start:stop]],
+                             [e.id for e in entries[start:stop]])
+        self.assertEqual(CompactCalendar()[21].id, entries[21].id)
+        # The count, the month holding the first entry, the months of the
+        # slice
+        with self.assertNumQueries(3):
+            CompactCalendar()[30:35]
+
+    def test_seek(self):
+        entries = list(CompactCalendar())
+        self.assertEqual(CompactCalendar().seek(None, 3), entries[:3])
+        self.assertEqual(CompactCalendar().seek(entries[11].id, 15),
+                         entries[12:27])
+        self.assertEqual(CompactCalendar().seek(entries[-1].id, 5), [])
+
+    @override_settings(CALENDAR_STORAGE='compact')
+    def test_list(self):
+        response = client.get(reverse('api:calendar'), {'page': 2})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['count'], 40)
+        self.assertEqual(len(response.data['results']), 10)
+
+    @override_settings(CALENDAR_STORAGE='compact')
+    def test_list_cursor(self):
+        results = []
+        response = client.get(reverse('api:calendar'),
+                              {'pagination': 'cursor'})
+        while True:
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertNotIn('count', response.data)
+            results.extend(response.data['results'])
+            if not response.data['next']:
+                break
+            response = client.get(response.data['next'])
+        self.assertEqual(results, CalendarSerializer(CompactCalendar(),
+                                                     many=True).data)
+        response = client.get(reverse('api:calendar'), {'cursor': 'xyz'})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    @override_settings(CALENDAR_STORAGE='compact')
+    def test_list_date(self):
+        day = self.start + timedelta(days=15)
+        response = client.get(reverse('api:calendar_day',
+                                      args=[day.strftime('%Y-%m-%d')]))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        rows = CalendarSerializer(Calendar.objects.filter(day=day),
+                                  many=True).data
+        self.assertEqual(self._without_ids(response.data['results']),
+                         self._without_ids(rows))
+
+
+@override_settings(CALENDAR_STORAGE='compact')
+class CompactWriteTest(TestCase):
+    """ Test module for the writers keeping the month records in sync """
+    venue_values = CompactCalendarTest.venue_values
+    venue_fields = CompactCalendarTest.venue_fields
+    venue_args = CompactCalendarTest.venue_args
+
+    start = date(2030, 1, 28)
+    end = start + timedelta(days=9)
+
+    def setUp(self):
+        self.venue = Venue.objects.create(**self.venue_args)
+        self.room = Room.objects.create(venue=self.venue, room_number='1')
+        self.guest = Guest.objects.create(
+            name='Superman', address='Outerspace Ln', city='LA',
+            zipcode='10000', country='USA')
+        build_calendar(self.start, self.end)
+        self.record_ids = set(CalendarMonth.objects.values_list('id',
+                                                                flat=True))
+
+    def _assert_in_sync(self):
+        rows = list(Calendar.objects.order_by('room_id', 'day').values_list(
+            'room_id', 'venue_id', 'day', 'price', 'reservation_id'))
+        entries = sorted(row[1:] for row in compact_rows())
+        self.assertEqual(entries, rows)
+
+    def _reservation(self, start, end):
+        return Reservation(venue=self.venue, room=self.room, guest=self.guest,
+                           amount=100, checkin=self.start + timedelta(start),
+                           checkout=self.start + timedelta(end))
+
+    def test_build(self):
+        # Both months were written with the rows, no compaction needed
+        self.assertEqual(len(self.record_ids), 2)
+        self._assert_in_sync()
+        build_calendar(self.start, self.end + timedelta(days=3))
+        self._assert_in_sync()
+        self.assertTrue(self.record_ids.issubset(
+            CalendarMonth.objects.values_list('id', flat=True)))
+
+    def test_calendar_save_delete(self):
+        day = Calendar.objects.get(day=self.start)
+        day.price = Decimal('120.50')
+        day.save()
+        self._assert_in_sync()
+        Calendar.objects.filter(day__gte=date(2030, 2, 1)).delete()
+        self._assert_in_sync()
+        self.assertEqual(CalendarMonth.objects.count(), 1)
+
+    def test_reprice(self):
+        reprice(self.start, self.end,
+                rules=PricingRules(base_rates={'Regular': 150}))
+        self._assert_in_sync()
+
+    def test_claims(self):
+        with override_settings(BOOKING_MODE='claim'):
+            reservation = self._reservation(2, 6)
+            reservation.save()
+            self._assert_in_sync()
+            reservation.checkin = self.start + timedelta(days=1)
+            reservation.save()
+            self._assert_in_sync()
+        reservation.delete()
+        self._assert_in_sync()
+        self.assertEqual(set(CalendarMonth.objects.values_list(
+            'id', flat=True)), self.record_ids)
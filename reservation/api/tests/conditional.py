@@ -0,0 +1,130 @@
+import json
+from datetime import date, timedelta
+from rest_framework import status
+
+from django.test import TestCase, Client
+from django.urls import reverse
+
+from core.calendar_builder import build_calendar
+from core.models import Calendar, Guest, Reservation, Room, Venue
+from core.versions import bump_calendar_days, calendar_day_version
+
+from api.throttle_store import get_throttle_store
+
+client = Client()
+
+
+class ConditionalGetTest(TestCase):
+    """ Test module for ETag / Last-Modified on reservations and calendar
+    days """
+    venue_fields = ('name', 'address', 'city', 'zipcode', 'country', 'timezone')
+    venue_values = ('Hotel Galaxy', 'Outerspace Ln', 'LA', '10000', 'USA',
+                    'America/Los_Angeles')
+    guest_fields = ('name', 'address', 'city', 'zipcode', 'country')
+    guest_values = ('Superman', 'Outerspace Ln', 'LA', '10000', 'USA')
+
+    today = date.today()
+
+    def setUp(self):
+        self.venue = Venue.objects.create(
+            **dict(zip(self.venue_fields, self.venue_values)))
+        self.room = Room.objects.create(venue=self.venue, room_number='1')
+        self.guest = Guest.objects.create(
+            **dict(zip(self.guest_fields, self.guest_values)))
+        self.reservation = Reservation.objects.create(
+            venue=self.venue, room=self.room, guest=self.guest, amount=300,
+            checkin=self.today + timedelta(days=2),
+            checkout=self.today + timedelta(days=4))
+        build_calendar(self.today, self.today + timedelta(days=5))
+        self.day = self.today + timedelta(days=2)
+
+    def tearDown(self):
+        # The PATCH below is throttled per reservation id
+        get_throttle_store().clear()
+
+    def test_bump_calendar_days(self):
+        day = self.today + timedelta(days=30)
+        self.assertEqual(calendar_day_version(day), (0, None))
+        bump_calendar_days([day, day])
+        bump_calendar_days([day])
+        self.assertEqual(calendar_day_version(day)[0], 2)
+
+    def test_reservation(self):
+        url = reverse('api:reservation', args=[self.reservation.id])
+        response = client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        etag = response['ETag']
+        self.assertIn('Last-Modified', response)
+
+        # Only the version is read
+        with self.assertNumQueries(1):
+            response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(response.content, b'')
+
+        response = client.patch(url, content_type='application/json',
+                                data=json.dumps({'amount': 350}))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.data['amount'], '350.00')
+
+    def test_reservation_version(self):
+        # Two copies read the same version, each save still gets its own
+        first = Reservation.objects.get(pk=self.reservation.pk)
+        second = Reservation.objects.get(pk=self.reservation.pk)
+        first.amount = 350
+        first.save()
+        second.amount = 400
+        second.save()
+        self.assertEqual(first.version, self.reservation.version + 1)
+        self.assertEqual(second.version, self.reservation.version + 2)
+        self.assertEqual(Reservation.objects.get(
+            pk=self.reservation.pk).version, second.version)
+
+    def test_reservation_not_found(self):
+        response = client.get(reverse('api:reservation', args=[999]),
+                              HTTP_IF_NONE_MATCH='"reservation-999-v1"')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_calendar_day(self):
+        url = reverse('api:calendar_day', args=[self.day.isoformat()])
+        response = client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        etag = response['ETag']
+
+        with self.assertNumQueries(1):
+            response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        # Other representations have their own
+        response = client.get(url, {'format': 'json'},
+                              HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        # Days that did not change keep theirs
+        other = reverse('api:calendar_day',
+                        args=[(self.today + timedelta(days=5)).isoformat()])
+        other_etag = client.get(other)['ETag']
+
+        # Deleting the reservation frees its days
+        self.reservation.delete()
+        response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIsNone(response.data['results'][0]['reservation_id'])
+        etag = response['ETag']
+        self.assertEqual(client.get(other, HTTP_IF_NONE_MATCH=other_etag)
+                         .status_code, status.HTTP_304_NOT_MODIFIED)
+
+        # Bulk writes bump too
+        Reservation.objects.create(
+            venue=self.venue, room=self.room, guest=self.guest, amount=300,
+            checkin=self.day, checkout=self.day + timedelta(days=1))
+        build_calendar(self.today, self.today + timedelta(days=5))
+        response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIsNotNone(response.data['results'][0]['reservation_id'])
+
+        Calendar.objects.filter(day=self.day).get().delete()
+        self.assertEqual(client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+                         .status_code, status.HTTP_200_OK)
@@ -0,0 +1,114 @@
+import csv
+import json
+from datetime import date, timedelta
+from rest_framework import status
+
+from django.test import TestCase, Client, override_settings
+from django.urls import reverse
+
+from core.calendar_builder import build_calendar
+from core.calendar_store import compact_calendar
+from core.models import Guest, Reservation, Room, Venue
+
+client = Client()
+
+
+def content(response):
+    return b''.join(response.streaming_content).decode('utf-8')
+
+
+class ExportTest(TestCase):
+    """ Test module for the streaming export endpoints """
+    venue_fields = ('name', 'address', 'city', 'zipcode', 'country', 'timezone')
+    venue1_values = ('Hotel Galaxy', 'Outerspace Ln', 'LA', '10000', 'USA',
+                     'America/Los_Angeles')
+    venue2_values = ('Hotel Avengers', 'Avengers HQ', 'LA', '90000', 'USA',
+                     'America/Los_Angeles')
+    guest_fields = ('name', 'address', 'city', 'zipcode', 'country')
+    guest_values = ('Superman', 'Outerspace Ln', 'LA', '10000', 'USA')
+
+    today = date.today()
+
+    def setUp(self):
+        self.venue1 = Venue.objects.create(
+            **dict(zip(self.venue_fields, self.venue1_values)))
+        self.venue2 = Venue.objects.create(
+            **dict(zip(self.venue_fields, self.venue2_values)))
+        room1 = Room.objects.create(venue=self.venue1, room_number='1')
+        room2 = Room.objects.create(venue=self.venue2, room_number='1')
+        guest = Guest.objects.create(
+            **dict(zip(self.guest_fields, self.guest_values)))
+        self.reservations = [
+            Reservation.objects.create(
+                venue=venue, room=room, guest=guest, amount=amount,
+                checkin=self.today + timedelta(days=start),
+                checkout=self.today + timedelta(days=end))
+            for venue, room, amount, start, end in (
+                (self.venue1, room1, 100, 0, 2),
+                (self.venue1, room1, 200, 5, 7),
+                (self.venue2, room2, 300, 1, 3))]
+        build_calendar(self.today, self.today + timedelta(days=9))
+
+    def test_reservations_ndjson(self):
+        response = client.get(reverse('api:reservations_export'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        self.assertTrue(response['Content-Type'].startswith(
+            'application/x-ndjson'))
+        rows = [json.loads(line) for line in content(response).splitlines()]
+        self.assertEqual([row['id'] for row in rows],
+                         [r.id for r in self.reservations])
+        self.assertEqual(rows[0]['amount'], '100.00')
+        self.assertEqual(rows[0]['checkin'], self.today.isoformat())
+
+    def test_reservations_filters(self):
+        day = self.today + timedelta(days=2)
+        response = client.get(reverse('api:reservations_export'), {
+            'venue_id': self.venue1.id, 'from': day.isoformat(),
+            'to': (day + timedelta(days=3)).isoformat()})
+        rows = [json.loads(line) for line in content(response).splitlines()]
+        # The first stay checks out on `from`
+        self.assertEqual([row['id'] for row in rows],
+                         [self.reservations[1].id])
+
+    def test_reservations_invalid_filter(self):
+        response = client.get(reverse('api:reservations_export'),
+                              {'from': 'tomorrow'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = client.get(reverse('api:reservations_export'),
+                              {'venue_id': 'x', 'format': 'csv'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_calendar_csv(self):
+        response = client.get(reverse('api:calendar_export'), {
+            'format': 'csv', 'venue_id': self.venue2.id,
+            'from': self.today.isoformat(),
+            'to': (self.today + timedelta(days=4)).isoformat()})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response['Content-Type'].startswith('text/csv'))
+        self.assertIn('calendar.csv', response['Content-Disposition'])
+        rows = list(csv.DictReader(content(response).splitlines()))
+        self.assertEqual(len(rows), 5)
+        self.assertEqual(set(row['venue_id'] for row in rows),
+                         set([str(self.venue2.id)]))
+        booked = [row['day'] for row in rows if row['reservation_id']]
+        self.assertEqual(booked, [(self.today + timedelta(days=i)).isoformat()
+                                  for i in (1, 2)])
+
+    def test_calendar_compact(self):
+        params = {'from': (self.today + timedelta(days=2)).isoformat(),
+                  'to': (self.today + timedelta(days=6)).isoformat()}
+        rows = content(client.get(reverse('api:calendar_export'), params))
+        compact_calendar()
+        with override_settings(CALENDAR_STORAGE='compact'):
+            compact = content(client.get(reverse('api:calendar_export'),
+                                         params))
+
+        def without_ids(lines):
+            rows = [json.loads(line) for line in lines.splitlines()]
+            for row in rows:
+                del row['id']
+            return sorted(rows, key=lambda r: (r['day'], r['room_id']))
+
+        self.assertEqual(len(rows.splitlines()), 10)
+        self.assertEqual(without_ids(rows), without_ids(compact))
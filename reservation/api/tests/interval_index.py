@@ -0,0 +1,161 @@
+from datetime import date, timedelta
+from rest_framework import status
+from rest_framework.exceptions import ValidationError
+
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase, Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from core.interval_index import RoomIntervals, reservation_index
+from core.models import Room, Venue, Reservation, Guest
+
+client = Client()
+
+
+class RoomIntervalsTest(TestCase):
+    """ Test module for the per-room interval lists """
+    today = date.today()
+
+    def _day(self, n):
+        return self.today + timedelta(days=n)
+
+    def setUp(self):
+        self.intervals = RoomIntervals([(self._day(1), self._day(5), 1),
+                                        (self._day(6), self._day(8), 2)])
+
+    def test_overlaps(self):
+        self.assertTrue(self.intervals.overlaps(self._day(0), self._day(2)))
+        self.assertTrue(self.intervals.overlaps(self._day(4), self._day(7)))
+        self.assertTrue(self.intervals.overlaps(self._day(7), self._day(9)))
+
+    def test_contains_existing_stay(self):
+        self.assertTrue(self.intervals.overlaps(self._day(0), self._day(9)))
+
+    def test_same_day_turnover(self):
+        self.assertFalse(self.intervals.overlaps(self._day(5), self._day(6)))
+        self.assertFalse(self.intervals.overlaps(self._day(8), self._day(9)))
+
+    def test_exclude(self):
+        self.assertFalse(self.intervals.overlaps(self._day(2), self._day(6),
+                                                 exclude=1))
+        self.assertTrue(self.intervals.overlaps(self._day(2), self._day(7),
+                                                exclude=1))
+
+    def test_add_discard(self):
+        self.intervals.add(3, self._day(5), self._day(6))
+        self.assertTrue(self.intervals.overlaps(self._day(5), self._day(6)))
+        self.intervals.discard(3)
+        self.assertFalse(self.intervals.overlaps(self._day(5), self._day(6)))
+        self.assertEqual(len(self.intervals), 2)
+
+
+class ReservationIndexTest(TransactionTestCase):
+    """ Index runs outside of transactions, so no TestCase here """
+    venue_values = ('Hotel Galaxy', 'Outerspace Ln', 'LA', '10000', 'USA',
+                    'America/Los_Angeles'),
+    venue_fields = ('name', 'address', 'city', 'zipcode', 'country', 'timezone')
+    venue_args = dict(zip(venue_fields, venue_values))
+
+    guest_fields = ('name', 'address', 'city', 'zipcode', 'country')
+    guest_values = ('Superman', 'Outerspace Ln', 'LA', '10000', 'USA'),
+    guest_args = dict(zip(guest_fields, guest_values))
+
+    today = date.today()
+
+    def setUp(self):
+        reservation_index.invalidate()
+        self.venue = Venue.objects.create(**self.venue_args)
+        self.room = Room.objects.create(venue=self.venue, room_number='1A')
+        self.guest = Guest.objects.create(**self.guest_args)
+
+    def tearDown(self):
+        reservation_index.invalidate()
+
+    def _create(self, checkin, checkout, room=None):
+        return Reservation.objects.create(
+            venue=self.venue, room=room or self.room, guest=self.guest,
+            amount=100, checkin=self.today + timedelta(days=checkin),
+            checkout=self.today + timedelta(days=checkout))
+
+    def _overlap(self, checkin, checkout):
+        return reservation_index.find_overlap(
+            self.venue.id, self.room.id, self.today + timedelta(days=checkin),
+            self.today + timedelta(days=checkout))
+
+    def test_signals_keep_index_in_sync(self):
+        self.assertFalse(self._overlap(1, 3))
+        reservation = self._create(1, 3)
+        self.assertTrue(self._overlap(0, 5))
+        reservation.checkin = self.today + timedelta(days=10)
+        reservation.checkout = self.today + timedelta(days=12)
+        reservation.save()
+        self.assertFalse(self._overlap(0, 5))
+        self.assertTrue(self._overlap(11, 12))
+        reservation.delete()
+        self.assertFalse(self._overlap(11, 12))
+        self.assertEqual(reservation_index.verify(), [])
+
+    def test_room_change(self):
+        other = Room.objects.create(venue=self.venue, room_number='1B')
+        reservation = self._create(1, 3)
+        self.assertTrue(self._overlap(1, 3))
+        reservation.room = other
+        reservation.save()
+        self.assertFalse(self._overlap(1, 3))
+        self.assertEqual(reservation_index.verify(), [])
+
+    def test_verify_detects_stale_room(self):
+        self._create(1, 3)
+        self.assertTrue(self._overlap(1, 3))
+        # Bypass the signals, like another process would
+        Reservation.objects.update(checkin=self.today + timedelta(days=20),
+                                   checkout=self.today + timedelta(days=22))
+        problems = reservation_index.verify()
+        self.assertEqual(len(problems), 1)
+        self.assertTrue(self._overlap(20, 21))
+        self.assertEqual(reservation_index.verify(), [])
+
+    def test_other_process(self):
+        self.assertFalse(self._overlap(1, 3))
+        # Booked by another process: bulk_create bypasses the signals
+        Reservation.objects.bulk_create([Reservation(
+            venue=self.venue, room=self.room, guest=self.guest, amount=100,
+            checkin=self.today + timedelta(days=1),
+            checkout=self.today + timedelta(days=3))])
+        self.assertFalse(self._overlap(1, 3))
+        # Free in the index, but the database is asked before writing
+        with self.assertRaises(ValidationError):
+            self._create(2, 4)
+        self.assertEqual(Reservation.objects.count(), 1)
+
+    def test_write_path(self):
+        self._create(1, 3)
+        # Loaded before the transaction of the save, patched once committed
+        self.assertEqual(len(reservation_index._rooms[
+            (self.venue.id, self.room.id)]), 1)
+        with CaptureQueriesContext(connection) as queries:
+            with self.assertRaises(ValidationError):
+                self._create(2, 4)
+        # Rejected by the index, the database is not asked
+        self.assertFalse([q for q in queries.captured_queries
+                          if 'FROM "core_reservation"' in q['sql']])
+
+    def test_rolled_back(self):
+        with self.assertRaises(RuntimeError):
+            with transaction.atomic():
+                self._create(1, 3)
+                # Written by this transaction, the database answers
+                self.assertIsNone(self._overlap(1, 3))
+                raise RuntimeError
+        self.assertFalse(self._overlap(1, 3))
+        self.assertEqual(reservation_index.verify(), [])
+
+    def test_post_containing_stay(self):
+        self._create(2, 3)
+        record = {'venue_id': self.venue.id, 'room_id': self.room.id,
+                  'guest_id': self.guest.id, 'amount': 100, 'state': 0,
+                  'checkin': self.today + timedelta(days=1),
+                  'checkout': self.today + timedelta(days=5)}
+        response = client.post(reverse('api:reservations'), data=record)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
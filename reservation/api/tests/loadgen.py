@@ -0,0 +1,129 @@
+import json
+import os
+import tempfile
+from datetime import date
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase, TransactionTestCase
+
+from api.loadgen import (EndpointStats, Traffic, WSGITransport, parse_mix,
+                         percentile, run)
+from api.throttle_store import get_throttle_store
+from core.models import Reservation
+from core.synthetic import generate
+
+
+class FakeTransport(object):
+    """ Answers every request with the same response """
+
+    def __init__(self, status, content=b'', error=None):
+        self.response = (status, content, error)
+        self.requests = []
+
+    def request(self, method, path, body=b''):
+        self.requests.append((method, path, body))
+        return self.response
+
+    def close(self):
+        pass
+
+
+class LoadgenStatsTest(TestCase):
+    """ Test module for the load generator statistics """
+
+    def test_parse_mix(self):
+        self.assertEqual(parse_mix('availability=2,book=1'),
+                         {'availability': 2, 'book': 1})
+        for value in ('nope=1', 'book=x', 'book=-1', 'book=0'):
+            with self.assertRaises(ValueError):
+                parse_mix(value)
+
+    def test_percentile(self):
+        ordered = list(range(1, 101))
+        self.assertEqual(percentile(ordered, 50), 50)
+        self.assertEqual(percentile(ordered, 99), 99)
+        self.assertEqual(percentile(ordered, 100), 100)
+        self.assertEqual(percentile([7], 99), 7)
+        self.assertIsNone(percentile([], 50))
+
+    def test_record(self):
+        stats = EndpointStats()
+        stats.record(0.0005, 201, b'{}', None)
+        stats.record(0.003, 400, b'{"error": "There is an existing '
+                                 b'reservation for this Room"}', None)
+        stats.record(0.003, 400, b'{"checkin": "bad"}', None)
+        stats.record(0.030, 429, b'', None)
+        stats.record(0.030, 500, b'OperationalError', 'database is locked')
+        stats.record(7, None, b'', 'timed out')
+        summary = stats.summary(2)
+        self.assertEqual(summary['requests'], 6)
+        self.assertEqual(summary['throughput'], 3)
+        self.assertEqual(summary['statuses'], {
+            '201': 1, '400': 2, '429': 1, '500': 1, 'error': 1})
+        self.assertEqual(summary['conflict_rate'], round(1 / 6.0, 4))
+        self.assertEqual(summary['throttled_rate'], round(1 / 6.0, 4))
+        self.assertEqual(summary['lock_errors'], 1)
+        self.assertEqual(summary['max_ms'], 7000)
+        histogram = dict(summary['histogram'])
+        self.assertEqual((histogram[1], histogram[5], histogram[50],
+                          histogram[None]), (1, 2, 2, 1))
+
+
+class LoadgenTest(TransactionTestCase):
+    """ Test module for the load generator, in-process """
+
+    def setUp(self):
+        generate(2, 3, 4, 12, 10, date.today(), seed=1)
+
+    def tearDown(self):
+        get_throttle_store().clear()
+
+    def test_fake_transport(self):
+        transport = FakeTransport(200)
+        report = run(transport, Traffic(), {'availability': 1, 'book': 1},
+                     clients=3, duration=60, requests=40)
+        self.assertEqual(len(transport.requests), 40)
+        self.assertEqual(report['total']['requests'], 40)
+        self.assertEqual(sorted(report['endpoints']),
+                         ['availability', 'book'])
+        methods = set(method for method, _, _ in transport.requests)
+        self.assertEqual(methods, set(['GET', 'POST']))
+
+    def test_wsgi(self):
+        transport = WSGITransport()
+        try:
+            report = run(transport, Traffic(hot_reservations=2), clients=2,
+                         duration=60, requests=60, seed=5)
+        finally:
+            transport.shutdown()
+        endpoints = report['endpoints']
+        self.assertEqual(report['total']['requests'], 60)
+        self.assertEqual(sum(s['requests'] for s in endpoints.values()), 60)
+        self.assertEqual(list(endpoints['availability']['statuses']),
+                         ['200'])
+        self.assertEqual(list(endpoints['calendar_day']['statuses']),
+                         ['200'])
+        booked = endpoints['book']['statuses'].get('201', 0)
+        self.assertEqual(Reservation.objects.count(), 12 + booked)
+        # Two hot reservations, the second update of each is throttled
+        update = endpoints['update']
+        self.assertEqual(set(update['statuses']) - set(['200', '429']),
+                         set())
+        self.assertLessEqual(update['statuses'].get('200', 0), 2)
+
+    def test_command(self):
+        out = StringIO()
+        fd, output = tempfile.mkstemp(suffix='.json')
+        os.close(fd)
+        self.addCleanup(os.remove, output)
+        call_command('loadgen', '--clients', '2', '--requests', '20',
+                     '--mix', 'calendar_day=1', '--histogram', '--output',
+                     output, stdout=out)
+        self.assertIn('calendar_day', out.getvalue())
+        self.assertIn('latency histogram', out.getvalue())
+        with open(output) as f:
+            report = json.load(f)
+        self.assertEqual(report['endpoints']['calendar_day']['statuses'],
+                         {'200': 20})
+
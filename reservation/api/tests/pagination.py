@@ -0,0 +1,77 @@
+from datetime import date, timedelta
+from rest_framework import status
+
+from django.test import TestCase, Client
+from django.urls import reverse
+
+from core.models import Calendar, Room, Venue, Reservation, Guest
+from core.serializers import CalendarSerializer, ReservationSerializer
+
+client = Client()
+
+
+class KeysetPaginationTest(TestCase):
+    """ Test module for cursor pagination of the list endpoints """
+    venue_values = ('Hotel Galaxy', 'Outerspace Ln', 'LA', '10000', 'USA',
+                    'America/Los_Angeles'),
+    venue_fields = ('name', 'address', 'city', 'zipcode', 'country', 'timezone')
+    venue_args = dict(zip(venue_fields, venue_values))
+
+    guest_fields = ('name', 'address', 'city', 'zipcode', 'country')
+    guest_values = ('Superman', 'Outerspace Ln', 'LA', '10000', 'USA'),
+    guest_args = dict(zip(guest_fields, guest_values))
+
+    today = date.today()
+
+    def setUp(self):
+        venue = Venue.objects.create(**self.venue_args)
+        guest = Guest.objects.create(**self.guest_args)
+        rooms = [Room.objects.create(venue=venue, room_number=str(i))
+                 for i in range(3)]
+        for i in range(25):
+            Reservation.objects.create(
+                venue=venue, room=rooms[0], guest=guest, amount=100,
+                checkin=self.today + timedelta(days=i),
+                checkout=self.today + timedelta(days=i + 1))
+        # Rooms created in reverse so (day, id) differs from id order
+        for i in range(8):
+            for room in reversed(rooms):
+                Calendar.objects.create(room=room, venue=venue, price=100,
+                                        day=self.today + timedelta(days=7 - i))
+
+    def _walk(self, url, params):
+        results, pages = [], 0
+        response = client.get(url, params)
+        while True:
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertNotIn('count', response.data)
+            results.extend(response.data['results'])
+            pages += 1
+            if not response.data['next']:
+                return results, pages
+            response = client.get(response.data['next'])
+
+    def test_reservations(self):
+        results, pages = self._walk(reverse('api:reservations'),
+                                    {'pagination': 'cursor'})
+        serializer = ReservationSerializer(Reservation.objects.all(),
+                                           many=True)
+        self.assertEqual(results, serializer.data)
+        self.assertEqual(pages, 3)
+
+    def test_calendar(self):
+        results, pages = self._walk(reverse('api:calendar'),
+                                    {'pagination': 'cursor'})
+        serializer = CalendarSerializer(
+            Calendar.objects.order_by('day', 'id'), many=True)
+        self.assertEqual(results, serializer.data)
+        self.assertEqual(pages, 3)
+
+    def test_page_number_default(self):
+        response = client.get(reverse('api:reservations'), {'page': 2})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['count'], 25)
+
+    def test_invalid_cursor(self):
+        response = client.get(reverse('api:reservations'), {'cursor': 'xyz'})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
@@ -0,0 +1,132 @@
+from datetime import date, timedelta
+from decimal import Decimal
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+
+from core.calendar_builder import build_calendar
+from core.models import Calendar, CalendarDayVersion, Guest, Reservation, \
+    Room, Venue
+from core.pricing import PricingRules, reprice
+
+
+class PricingTest(TestCase):
+    """ Test module for the pricing engine """
+    venue_fields = ('name', 'address', 'city', 'zipcode', 'country', 'timezone')
+    venue_values = ('Hotel Galaxy', 'Outerspace Ln', 'LA', '10000', 'USA',
+                    'America/Los_Angeles')
+    guest_fields = ('name', 'address', 'city', 'zipcode', 'country')
+    guest_values = ('Superman', 'Outerspace Ln', 'LA', '10000', 'USA')
+
+    # A Monday
+    start = date(2030, 6, 10)
+    end = start + timedelta(days=6)
+    rules = PricingRules(
+        base_rates={'Regular': 100, 'Deluxe': 200},
+        weekday_multipliers=[1, 1, 1, 1, 1, 1.5, 1.5],
+        seasons=[('06-15', '06-30', 1.2), ('12-20', '01-05', 2)],
+        occupancy_uplift=[(0.5, 1.1), (1, 1.5)])
+
+    def setUp(self):
+        self.venue = Venue.objects.create(
+            **dict(zip(self.venue_fields, self.venue_values)))
+        self.room1 = Room.objects.create(venue=self.venue, room_number='1')
+        self.room2 = Room.objects.create(venue=self.venue, room_number='2',
+                                         room_type='Deluxe')
+        guest = Guest.objects.create(
+            **dict(zip(self.guest_fields, self.guest_values)))
+        # Books the room1 on Tuesday
+        self.reservation = Reservation.objects.create(
+            venue=self.venue, room=self.room1, guest=guest, amount=100,
+            checkin=self.start + timedelta(days=1),
+            checkout=self.start + timedelta(days=2))
+        build_calendar(self.start, self.end, price=100)
+
+    def _prices(self, room):
+        return [float(price) for price in Calendar.objects.filter(room=room)
+                .order_by('day').values_list('price', flat=True)]
+
+    def test_day_multipliers(self):
+        multipliers = self.rules.day_multipliers(date(2030, 12, 30), 4)
+        # Mon, Tue, Wed and Thu in the new year season
+        self.assertEqual(list(multipliers), [2, 2, 2, 2])
+        multipliers = self.rules.day_multipliers(self.start, 7)
+        self.assertEqual(list(multipliers.round(6)),
+                         [1, 1, 1, 1, 1, 1.8, 1.8])
+
+    def test_reprice(self):
+        stats = reprice(self.start, self.end, rules=self.rules)
+        self.assertEqual((stats.days, stats.booked), (14, 1))
+        # The booked Tuesday keeps its price, its occupancy uplifts the
+        # Deluxe room that day
+        self.assertEqual(self._prices(self.room1),
+                         [100, 100, 100, 100, 100, 180, 180])
+        self.assertEqual(self._prices(self.room2),
+                         [200, 220, 200, 200, 200, 360, 360])
+        self.assertEqual(stats.changed, 2 + 7)
+        self.assertTrue(CalendarDayVersion.objects.filter(
+            day=self.start + timedelta(days=5)).exists())
+
+        # Nothing left to change
+        stats = reprice(self.start, self.end, rules=self.rules)
+        self.assertEqual((stats.changed, stats.unchanged), (0, 13))
+        self.assertEqual(Calendar.objects.get(
+            room=self.room1, day=self.start + timedelta(days=1)).price, 100)
+
+    def test_booked_during_reprice(self):
+        saturday = self.start + timedelta(days=5)
+        reservation = self.reservation
+
+        class BookingRules(PricingRules):
+            # Books the Saturday of room1 between the read and the write
+            def room_rates(self, room_types):
+                Calendar.objects.filter(room=reservation.room,
+                                        day=saturday) \
+                    .update(reservation=reservation)
+                return super(BookingRules, self).room_rates(room_types)
+
+        rules = BookingRules(
+            base_rates=self.rules.base_rates,
+            weekday_multipliers=[1, 1, 1, 1, 1, 1.5, 1.5])
+        reprice(self.start, self.end, rules=rules)
+        self.assertEqual(Calendar.objects.get(
+            room=self.room1, day=saturday).price, 100)
+        self.assertEqual(Calendar.objects.get(
+            room=self.room2, day=saturday).price, 300)
+
+    def test_moved_room(self):
+        # The room2 has moved to another venue but keeps its calendar rows
+        other = Venue.objects.create(
+            **dict(zip(self.venue_fields, self.venue_values)))
+        Room.objects.filter(pk=self.room2.pk).update(venue=other)
+        stats = reprice(self.start, self.end, rules=self.rules)
+        self.assertEqual(stats.skipped, 7)
+        self.assertIn('7 skipped', str(stats))
+        self.assertEqual(self._prices(self.room1),
+                         [100, 100, 100, 100, 100, 180, 180])
+        self.assertEqual(self._prices(self.room2), [100] * 7)
+
+    def test_dry_run(self):
+        stats = reprice(self.start, self.end, rules=self.rules,
+                        dry_run=True, sample_size=2)
+        self.assertEqual(stats.changed, 9)
+        self.assertEqual(len(stats.sample), 2)
+        # Saturday of room1 comes first
+        self.assertEqual(stats.sample[0][2:], (
+            self.start + timedelta(days=5), Decimal('100.00'),
+            Decimal('180.00')))
+        self.assertEqual(self._prices(self.room2), [100] * 7)
+
+    def test_command(self):
+        out = StringIO()
+        with self.settings(PRICING_RULES={'base_rates': {'Regular': 90}}):
+            call_command('reprice', '--from', str(self.start), '--to',
+                         str(self.end), '--dry-run', '--show', '1',
+                         stdout=out)
+            self.assertIn('... and 5 more', out.getvalue())
+            self.assertIn('6 changed', out.getvalue())
+            call_command('reprice', '--from', str(self.start), '--to',
+                         str(self.end), stdout=StringIO())
+        self.assertEqual(self._prices(self.room1),
+                         [90, 100, 90, 90, 90, 90, 90])
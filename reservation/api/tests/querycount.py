@@ -0,0 +1,71 @@
+from datetime import date, timedelta
+from rest_framework import status
+
+from django.test import TestCase, Client, override_settings
+from django.urls import reverse
+
+from core.models import Room, Venue, Reservation, Guest
+
+from api.querycount import (QueryBudgetExceeded, QueryRecorder, get_budget,
+                            query_stats)
+
+client = Client()
+
+
+class QueryCountTest(TestCase):
+    """ Test module for the query count middleware and budgets """
+    venue_values = ('Hotel Galaxy', 'Outerspace Ln', 'LA', '10000', 'USA',
+                    'America/Los_Angeles'),
+    venue_fields = ('name', 'address', 'city', 'zipcode', 'country', 'timezone')
+    venue_args = dict(zip(venue_fields, venue_values))
+
+    guest_fields = ('name', 'address', 'city', 'zipcode', 'country')
+    guest_values = ('Superman', 'Outerspace Ln', 'LA', '10000', 'USA'),
+    guest_args = dict(zip(guest_fields, guest_values))
+
+    def setUp(self):
+        venue = Venue.objects.create(**self.venue_args)
+        guest = Guest.objects.create(**self.guest_args)
+        today = date.today()
+        # A full page of rows, so per-row queries would show up
+        for i in range(10):
+            room = Room.objects.create(venue=venue, room_number=str(i))
+            Reservation.objects.create(
+                venue=venue, room=room, guest=guest, amount=100,
+                checkin=today, checkout=today + timedelta(days=1))
+
+    def _count(self, url):
+        with QueryRecorder() as recorder:
+            response = client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return recorder.count
+
+    def test_list_pages_within_budget(self):
+        self.assertLessEqual(self._count(reverse('api:reservations')),
+                             get_budget('ReservationList', 'GET'))
+        self.assertLessEqual(self._count(reverse('api:rooms')),
+                             get_budget('RoomList', 'GET'))
+
+    def test_no_query_per_row(self):
+        self.assertEqual(self._count(reverse('api:reservations')), 2)
+        self.assertEqual(self._count(reverse('api:rooms')), 2)
+
+    @override_settings(QUERY_BUDGETS={'RoomList': {'GET': 1}})
+    def test_budget_exceeded(self):
+        with self.assertRaises(QueryBudgetExceeded):
+            client.get(reverse('api:rooms'))
+
+    @override_settings(DEBUG=True)
+    def test_headers(self):
+        response = client.get(reverse('api:rooms'))
+        self.assertEqual(response['X-Query-Count'], '2')
+        self.assertIn('X-Query-Time-Ms', response)
+
+    def test_stats(self):
+        query_stats.reset()
+        client.get(reverse('api:rooms'))
+        client.get(reverse('api:rooms'))
+        stats = query_stats.snapshot()[('RoomList', 'GET')]
+        self.assertEqual(stats['requests'], 2)
+        self.assertEqual(stats['queries'], 4)
+        self.assertEqual(stats['max_queries'], 2)
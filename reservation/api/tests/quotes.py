@@ -0,0 +1,191 @@
+import json
+from datetime import date, timedelta
+from decimal import Decimal
+
+from rest_framework import status
+
+from django.test import Client, TestCase, TransactionTestCase, \
+    override_settings
+from django.urls import reverse
+
+from api.throttle_store import get_throttle_store
+from core.calendar_builder import build_calendar
+from core.calendar_store import compact_calendar
+from core.models import Calendar, Reservation
+from core.pricing import PricingRules, reprice
+from core.quotes import RoomPrices, quote, quote_cache
+
+from .booking import BookingFixture
+
+client = Client()
+
+
+class RoomPricesTest(TestCase):
+    """ Test module for the running totals of the stay quotes """
+    first = date(2030, 1, 1)
+
+    def _day(self, offset):
+        return self.first + timedelta(days=offset)
+
+    def test_quote(self):
+        prices = RoomPrices(dict((self._day(i), 1000 * (i + 1))
+                                 for i in range(5)))
+        self.assertEqual(prices.quote(self._day(0), self._day(1)), 1000)
+        self.assertEqual(prices.quote(self._day(1), self._day(4)), 9000)
+        self.assertEqual(prices.quote(self._day(0), self._day(5)), 15000)
+        # Outside of the calendar
+        self.assertIsNone(prices.quote(self._day(-1), self._day(2)))
+        self.assertIsNone(prices.quote(self._day(3), self._day(6)))
+        self.assertIsNone(prices.quote(self._day(2), self._day(2)))
+
+    def test_gap(self):
+        prices = RoomPrices({self._day(0): 500, self._day(2): 700})
+        self.assertEqual(prices.quote(self._day(0), self._day(1)), 500)
+        self.assertEqual(prices.quote(self._day(2), self._day(3)), 700)
+        self.assertIsNone(prices.quote(self._day(0), self._day(3)))
+
+    def test_empty(self):
+        self.assertIsNone(RoomPrices({}).quote(self._day(0), self._day(1)))
+
+
+class QuoteTest(BookingFixture, TransactionTestCase):
+    """ Test module for the stay quotes and the quote endpoint """
+
+    def setUp(self):
+        super(QuoteTest, self).setUp()
+        quote_cache.invalidate()
+
+    def tearDown(self):
+        quote_cache.invalidate()
+        get_throttle_store().clear()
+
+    def _post(self, stays):
+        return client.post(reverse('api:quote'),
+                           content_type='application/json',
+                           data=json.dumps(stays, default=str))
+
+    def _stay(self, start, end, room_id=None):
+        return {'room_id': room_id or self.room.id,
+                'checkin': self._day(start), 'checkout': self._day(end)}
+
+    def test_quote(self):
+        self.assertEqual(quote(self.room.id, self._day(1), self._day(4)),
+                         30000)
+        # Past the calendar
+        self.assertIsNone(quote(self.room.id, self._day(8), self._day(11)))
+        self.assertIsNone(quote(0, self._day(1), self._day(2)))
+
+    def test_cached(self):
+        quote(self.room.id, self._day(1), self._day(2))
+        with self.assertNumQueries(0):
+            self.assertEqual(quote(self.room.id, self._day(2), self._day(5)),
+                             30000)
+
+    def test_reprice(self):
+        quote(self.room.id, self._day(1), self._day(2))
+        rules = PricingRules(base_rates={'Regular': 150})
+        reprice(self._day(0), self._day(9), rules=rules)
+        self.assertEqual(quote(self.room.id, self._day(1), self._day(3)),
+                         30000)
+
+    def test_calendar_save(self):
+        quote(self.room.id, self._day(1), self._day(2))
+        day = Calendar.objects.get(room=self.room, day=self._day(1))
+        day.price = Decimal('120.50')
+        day.save()
+        self.assertEqual(quote(self.room.id, self._day(1), self._day(3)),
+                         22050)
+
+    def test_build_calendar(self):
+        self.assertIsNone(quote(self.room.id, self._day(8), self._day(11)))
+        build_calendar(self._day(10), self._day(11))
+        self.assertEqual(quote(self.room.id, self._day(8), self._day(11)),
+                         30000)
+
+    @override_settings(CALENDAR_STORAGE='compact')
+    def test_compact(self):
+        compact_calendar()
+        quote_cache.invalidate()
+        self.assertEqual(quote(self.room.id, self._day(1), self._day(4)),
+                         30000)
+        # Repricing rewrites the month records too
+        reprice(self._day(0), self._day(9),
+                rules=PricingRules(base_rates={'Regular': 150}))
+        self.assertEqual(quote(self.room.id, self._day(1), self._day(4)),
+                         45000)
+
+    def test_endpoint(self):
+        response = self._post([self._stay(1, 3), self._stay(2, 5)])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, [
+            {'index': 0, 'room_id': self.room.id, 'checkin': self._day(1),
+             'checkout': self._day(3), 'nights': 2, 'amount': '200.00'},
+            {'index': 1, 'room_id': self.room.id, 'checkin': self._day(2),
+             'checkout': self._day(5), 'nights': 3, 'amount': '300.00'}])
+
+    def test_endpoint_errors(self):
+        response = self._post([self._stay(1, 3), self._stay(3, 1),
+                               self._stay(8, 11), {'room_id': 'x'}])
+        self.assertEqual(response.status_code, status.HTTP_207_MULTI_STATUS)
+        self.assertEqual(response.data[0]['amount'], '200.00')
+        self.assertIn('error', response.data[1]['errors'])
+        self.assertIn('error', response.data[2]['errors'])
+        self.assertIn('checkin', response.data[3]['errors'])
+
+        response = self._post([self._stay(3, 1)])
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self._post(self._stay(1, 3))
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        with override_settings(QUOTE_MAX_STAYS=1):
+            response = self._post([self._stay(1, 3)] * 2)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_booking_amount(self):
+        record = self._record(1, 3)
+        del record['amount']
+        response = client.post(reverse('api:reservations'),
+                               content_type='application/json',
+                               data=json.dumps(record, default=str))
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Reservation.objects.get().amount, Decimal('200'))
+
+        record = dict(self._record(4, 6), amount=150)
+        response = client.post(reverse('api:reservations'),
+                               content_type='application/json',
+                               data=json.dumps(record, default=str))
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('amount', response.data)
+
+        # Nights outside the calendar take the amount given
+        record = self._record(8, 11)
+        del record['amount']
+        response = client.post(reverse('api:reservations'),
+                               content_type='application/json',
+                               data=json.dumps(record, default=str))
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('amount', response.data)
+        response = client.post(reverse('api:reservations'),
+                               content_type='application/json',
+                               data=json.dumps(self._record(8, 11),
+                                               default=str))
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+    def test_booking_amount_stale_cache(self):
+        self.assertEqual(quote(self.room.id, self._day(1), self._day(3)),
+                         20000)
+        # Repriced by another process, this one's cache is not told
+        Calendar.objects.filter(room=self.room).update(price=150)
+        self.assertEqual(quote(self.room.id, self._day(1), self._day(3)),
+                         20000)
+        response = client.post(reverse('api:reservations'),
+                               content_type='application/json',
+                               data=json.dumps(self._record(1, 3),
+                                               default=str))
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data['amount'],
+                         'Expected 300.00, the price of the stay.')
+        record = dict(self._record(1, 3), amount=300)
+        response = client.post(reverse('api:reservations'),
+                               content_type='application/json',
+                               data=json.dumps(record, default=str))
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
@@ -0,0 +1,154 @@
+import json
+import os
+import tempfile
+from io import StringIO
+
+from asgiref.sync import sync_to_async
+from rest_framework import status
+
+from django.core.management import call_command
+from django.db import connections, transaction
+from django.test import AsyncClient, Client, SimpleTestCase, \
+    TransactionTestCase, override_settings
+from django.urls import reverse
+
+from api.view_cache import view_cache
+from core.models import Calendar, Reservation, Venue
+from core.routers import ReplicaRouter, primary, routing, sync_replica, \
+    wrote
+
+from .booking import BookingFixture
+
+
+@override_settings(DATABASE_REPLICAS=['replica'])
+class ReplicaRouterTest(SimpleTestCase):
+    """ Test module for the read replica router """
+    router = ReplicaRouter()
+
+    def test_routing(self):
+        self.assertEqual(self.router.db_for_read(Reservation), 'default')
+        with routing(False):
+            self.assertEqual(self.router.db_for_read(Reservation), 'default')
+        with routing(True):
+            self.assertEqual(self.router.db_for_read(Reservation), 'replica')
+            with primary():
+                self.assertEqual(self.router.db_for_read(Reservation),
+                                 'default')
+            self.assertEqual(self.router.db_for_read(Reservation), 'replica')
+        self.assertEqual(self.router.db_for_read(Reservation), 'default')
+
+    def test_read_your_writes(self):
+        with routing(True):
+            self.assertFalse(wrote())
+            self.assertEqual(self.router.db_for_write(Reservation), 'default')
+            self.assertTrue(wrote())
+            self.assertEqual(self.router.db_for_read(Reservation), 'default')
+        with routing(True):
+            self.assertFalse(wrote())
+
+    def test_no_replicas(self):
+        with override_settings(DATABASE_REPLICAS=[]), routing(True):
+            self.assertEqual(self.router.db_for_read(Reservation), 'default')
+
+    def test_allow_migrate(self):
+        self.assertFalse(self.router.allow_migrate('replica', 'core'))
+        self.assertIsNone(self.router.allow_migrate('default', 'core'))
+
+
+@override_settings(DATABASE_REPLICAS=['replica'], REPLICA_LAG_TOLERANCE=5)
+class ReplicaTest(BookingFixture, TransactionTestCase):
+    """ Test module for API reads served by an SQLite replica """
+    # 'replica' is only added by setUpClass, after the runner checked them
+    databases = '__all__'
+
+    @classmethod
+    def setUpClass(cls):
+        fd, cls.replica_path = tempfile.mkstemp(suffix='.sqlite3')
+        os.close(fd)
+        connections.databases['replica'] = dict(
+            connections.databases['default'], NAME=cls.replica_path,
+            TEST={})
+        super(ReplicaTest, cls).setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super(ReplicaTest, cls).tearDownClass()
+        connections['replica'].close()
+        del connections.databases['replica']
+        del connections._connections.replica
+        os.remove(cls.replica_path)
+
+    def setUp(self):
+        super(ReplicaTest, self).setUp()
+        self._reservation(1, 2).save()
+        sync_replica('replica')
+        # Not copied to the replica yet
+        self._reservation(3, 4).save()
+
+    def _count(self, client):
+        response = client.get(reverse('api:reservations'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data['count']
+
+    def test_stale_replica(self):
+        self.assertEqual(self._count(Client()), 1)
+        # Writes and conflict checks go to the primary
+        client = Client()
+        response = client.post(reverse('api:reservations'),
+                               content_type='application/json',
+                               data=json.dumps(self._record(3, 5),
+                                               default=str))
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertNotIn('primary_pin', response.cookies)
+
+    def test_read_your_writes(self):
+        client = Client()
+        response = client.post(reverse('api:reservations'),
+                               content_type='application/json',
+                               data=json.dumps(self._record(5, 6),
+                                               default=str))
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.cookies['primary_pin']['max-age'], 5)
+        # Pinned to the primary for the lag tolerance
+        self.assertEqual(self._count(client), 3)
+        self.assertEqual(self._count(Client()), 1)
+
+        sync_replica('replica')
+        self.assertEqual(self._count(Client()), 3)
+
+    def test_transaction(self):
+        with routing(True):
+            self.assertEqual(Reservation.objects.count(), 1)
+            with transaction.atomic():
+                self.assertEqual(Reservation.objects.count(), 2)
+
+    def test_view_cache(self):
+        Venue.objects.create(**dict(zip(self.venue_fields,
+                                        self.venue_values)))
+        view_cache.clear()
+        response = Client().get(reverse('api:venues'))
+        self.assertEqual(response.data['count'], 2)
+
+    async def test_async(self):
+        # Async read views run the DRF view in executor threads
+        await sync_to_async(Calendar.objects.filter(day=self._day(0)).delete)()
+        with override_settings(ROOT_URLCONF='reservation.asgi_urls'):
+            response = await AsyncClient().get(
+                '/api/calendar/%s' % self._day(0))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.json()['results']), 1)
+        client = AsyncClient()
+        response = await client.post(reverse('api:reservations'),
+                                     content_type='application/json',
+                                     data=json.dumps(self._record(5, 6),
+                                                     default=str))
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertIn('primary_pin', response.cookies)
+
+    def test_command(self):
+        self._reservation(5, 6).save()
+        out = StringIO()
+        call_command('syncreplica', stdout=out)
+        self.assertIn('replica', out.getvalue())
+        with routing(True):
+            self.assertEqual(Reservation.objects.count(), 3)
@@ -0,0 +1,169 @@
+from decimal import Decimal
+
+from rest_framework import status
+
+from django.test import Client, TestCase, TransactionTestCase
+from django.urls import reverse
+
+from core.availability import availability_engine
+from core.calendar_builder import build_calendar
+from core.models import Calendar, Room, Venue
+from core.quotes import quote_cache
+from core.search import cheapest_rooms
+
+from .booking import BookingFixture
+
+client = Client()
+
+
+class SearchFixture(BookingFixture):
+
+    def setUp(self):
+        super(SearchFixture, self).setUp()
+        availability_engine.invalidate()
+        quote_cache.invalidate()
+        # Hotel Galaxy (LA): room 1 at 100, room 2 at 80, suite 3 at 300
+        self.room2 = Room.objects.create(venue=self.venue, room_number='2')
+        self.suite = Room.objects.create(venue=self.venue, room_number='3',
+                                         room_type='Suite')
+        # Another LA venue, room 1 at 90, and a disabled one at 10
+        self.other = Venue.objects.create(**dict(
+            zip(self.venue_fields, self.venue_values), name='Hotel Nova'))
+        self.other_room = Room.objects.create(venue=self.other,
+                                              room_number='1')
+        self.closed = Venue.objects.create(**dict(
+            zip(self.venue_fields, self.venue_values), name='Hotel Closed',
+            disabled=True))
+        self.closed_room = Room.objects.create(venue=self.closed,
+                                               room_number='1')
+        # Elsewhere, at 10
+        self.away = Venue.objects.create(**dict(
+            zip(self.venue_fields, self.venue_values), name='Hotel Away',
+            city='SF'))
+        self.away_room = Room.objects.create(venue=self.away,
+                                             room_number='1')
+        build_calendar(self.today, self._day(9))
+        for room, price in ((self.room2, 80), (self.suite, 300),
+                            (self.other_room, 90), (self.closed_room, 10),
+                            (self.away_room, 10)):
+            Calendar.objects.filter(room=room).update(price=price)
+
+    def tearDown(self):
+        availability_engine.wait_warm()
+        availability_engine.invalidate()
+        quote_cache.invalidate()
+
+
+class SearchTest(SearchFixture, TestCase):
+    """ Test module for the cheapest rooms search """
+
+    def _search(self, limit=10, room_type=None, start=1, end=3):
+        return cheapest_rooms('LA', self._day(start), self._day(end),
+                              room_type, limit)
+
+    def test_cheapest(self):
+        self.assertEqual(self._search(), [
+            (16000, self.room2.id), (18000, self.other_room.id),
+            (20000, self.room.id), (60000, self.suite.id)])
+        self.assertEqual(self._search(limit=2), [
+            (16000, self.room2.id), (18000, self.other_room.id)])
+        self.assertEqual(self._search(room_type='Suite'),
+                         [(60000, self.suite.id)])
+        self.assertEqual(cheapest_rooms('Nowhere', self._day(1),
+                                        self._day(3)), [])
+
+    def test_booked(self):
+        self._reservation(2, 4).save()
+        room2 = self._reservation(0, 2)
+        room2.room = self.room2
+        room2.save()
+        self.assertEqual(self._search(), [
+            (18000, self.other_room.id), (60000, self.suite.id)])
+
+    def test_not_priced(self):
+        # Past the calendar
+        self.assertEqual(self._search(start=8, end=11), [])
+
+    def test_endpoint(self):
+        response = client.get(reverse('api:search'), {
+            'city': 'LA', 'checkin': self._day(1), 'checkout': self._day(3),
+            'limit': 2})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [(item['id'], item['venue_id'], item['nights'], item['amount'])
+             for item in response.data],
+            [(self.room2.id, self.venue.id, 2, '160.00'),
+             (self.other_room.id, self.other.id, 2, '180.00')])
+
+    def test_empty_room_type(self):
+        response = client.get(reverse('api:search'), {
+            'city': 'LA', 'checkin': self._day(1), 'checkout': self._day(3),
+            'room_type': ''})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data), 4)
+
+    def test_endpoint_errors(self):
+        url = reverse('api:search')
+        for params in ({'checkin': self._day(1), 'checkout': self._day(3)},
+                       {'city': 'LA', 'checkin': self._day(3),
+                        'checkout': self._day(1)},
+                       {'city': 'LA', 'checkin': 'x',
+                        'checkout': self._day(1)},
+                       {'city': 'LA', 'checkin': self._day(1),
+                        'checkout': self._day(3), 'limit': 1000},
+                       {'city': 'LA', 'checkin': self._day(1),
+                        'checkout': self._day(3), 'limit': 0}):
+            response = client.get(url, params)
+            self.assertEqual(response.status_code,
+                             status.HTTP_400_BAD_REQUEST)
+
+
+class SearchEngineTest(SearchFixture, TransactionTestCase):
+    """ Test module for the search answered by the availability bitsets """
+
+    def test_cached(self):
+        checkin, checkout = self._day(1), self._day(3)
+        # Both venues are cold: venues, their free rooms and the quotes
+        with self.assertNumQueries(3):
+            self.assertEqual(len(cheapest_rooms('LA', checkin, checkout)), 4)
+        availability_engine.wait_warm()
+        # Venues and rooms are in memory now, only the venues are read
+        with self.assertNumQueries(1):
+            self.assertEqual(cheapest_rooms('LA', checkin, checkout,
+                                            limit=1),
+                             [(16000, self.room2.id)])
+        self._reservation(0, 2).save()
+        Calendar.objects.filter(room=self.room2, day=self._day(2)) \
+            .update(price=Decimal('200'))
+        quote_cache.invalidate([self.room2.id])
+        self.assertEqual(cheapest_rooms('LA', checkin, checkout), [
+            (18000, self.other_room.id), (28000, self.room2.id),
+            (60000, self.suite.id)])
+
+    def test_cold_venues(self):
+        # A third LA venue, none of them loaded
+        third = Venue.objects.create(**dict(
+            zip(self.venue_fields, self.venue_values), name='Hotel Nadir'))
+        Room.objects.create(venue=third, room_number='1')
+        checkin, checkout = self._day(1), self._day(3)
+        response = client.get(reverse('api:search'), {
+            'city': 'LA', 'checkin': checkin, 'checkout': checkout})
+        # Within the RoomSearch query budget
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data), 4)
+        availability_engine.wait_warm()
+        for venue in (self.venue, self.other, third):
+            self.assertIsNotNone(availability_engine.free_rooms(
+                venue.id, checkin, checkout, load=False))
+
+    def test_changed_while_warming(self):
+        availability_engine.warm_later([self.other.id])
+        # Saved while the warmer may be reading the venue
+        reservation = self._reservation(1, 3)
+        reservation.venue, reservation.room = self.other, self.other_room
+        reservation.save()
+        availability_engine.wait_warm()
+        free = availability_engine.free_rooms(self.other.id, self._day(1),
+                                              self._day(3))
+        self.assertEqual(free, [])
+
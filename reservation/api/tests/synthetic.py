@@ -0,0 +1,84 @@
+import random
+from datetime import date, timedelta
+from io import StringIO
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+
+from core.models import Calendar, Guest, Reservation, Room, Venue
+from core.synthetic import generate, plan_stays
+
+
+class SyntheticDataTest(TestCase):
+    """ Test module for the synthetic data generator behind populatedb """
+    start = date.today()
+
+    def _stays(self, venue_ids):
+        return list(Reservation.objects.filter(venue__id__in=venue_ids)
+                    .order_by('id').values_list(
+                        'room__room_number', 'room__room_type', 'checkin',
+                        'checkout', 'amount'))
+
+    def test_plan_stays(self):
+        rng = random.Random(1)
+        for count, days in ((1, 1), (5, 5), (7, 30), (30, 365)):
+            stays = plan_stays(rng, count, days)
+            self.assertEqual(len(stays), count)
+            end = 0
+            for first, nights in stays:
+                self.assertGreaterEqual(first, end)
+                self.assertGreaterEqual(nights, 1)
+                end = first + nights
+            self.assertLessEqual(end, days)
+        with self.assertRaises(ValueError):
+            plan_stays(rng, 3, 2)
+
+    def test_generate(self):
+        stats = generate(2, 4, 5, 30, 20, self.start, seed=7)
+        self.assertEqual((stats.venues, stats.rooms, stats.guests,
+                          stats.reservations), (2, 8, 5, 30))
+        self.assertEqual(Reservation.objects.count(), 30)
+        for reservation in Reservation.objects.all():
+            self.assertLess(reservation.checkin, reservation.checkout)
+            self.assertLessEqual(reservation.checkout,
+                                 self.start + timedelta(days=20))
+            self.assertFalse(reservation.overlapping().exists())
+        # The calendar covers the horizon, booked nights point at the stays
+        self.assertEqual(Calendar.objects.count(), 8 * 20)
+        nights = sum((r.checkout - r.checkin).days
+                     for r in Reservation.objects.all())
+        self.assertEqual(Calendar.objects.filter(
+            reservation__isnull=False).count(), nights)
+
+    def test_deterministic(self):
+        generate(1, 3, 2, 12, 10, self.start, seed=3)
+        first = list(Venue.objects.values_list('id', flat=True))
+        generate(1, 3, 2, 12, 10, self.start, seed=3)
+        second = list(Venue.objects.exclude(id__in=first)
+                      .values_list('id', flat=True))
+        self.assertEqual(self._stays(first), self._stays(second))
+        generate(1, 3, 2, 12, 10, self.start, seed=4)
+        third = list(Venue.objects.exclude(id__in=first + second)
+                     .values_list('id', flat=True))
+        self.assertNotEqual(self._stays(first), self._stays(third))
+
+    def test_command(self):
+        out = StringIO()
+        call_command('populatedb', '--venues', '2', '--rooms-per-venue', '3',
+                     '--guests', '4', '--reservations', '10', '--days', '7',
+                     '--batch-size', '2', stdout=out)
+        self.assertIn('2 venues, 6 rooms, 4 guests, 10 reservations',
+                      out.getvalue())
+        self.assertEqual(Room.objects.count(), 6)
+        self.assertEqual(Guest.objects.count(), 4)
+        self.assertEqual(Calendar.objects.count(), 6 * 7)
+
+    def test_command_errors(self):
+        with self.assertRaises(CommandError):
+            call_command('populatedb', '--rooms-per-venue', '1',
+                         '--reservations', '8', '--days', '7',
+                         stdout=StringIO())
+        with self.assertRaises(CommandError):
+            call_command('populatedb', '--venues', '-1', stdout=StringIO())
+        self.assertFalse(Venue.objects.exists())
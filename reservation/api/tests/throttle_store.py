@@ -0,0 +1,71 @@
+import multiprocessing
+import os
+import shutil
+import tempfile
+
+from django.test import SimpleTestCase
+
+from api.throttle_store import (CacheThrottleStore, SQLiteThrottleStore,
+                                get_throttle_store, pack, unpack)
+
+
+def increment(state):
+    count = (state[0] if state else 0) + 1
+    return (count,), count
+
+
+def hammer(location, times):
+    store = SQLiteThrottleStore(location)
+    for _ in range(times):
+        store.update('key', increment, 60)
+
+
+class ThrottleStoreTest(SimpleTestCase):
+    """ Test module for the throttle stores """
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.location = os.path.join(self.tmp, 'throttle.sqlite3')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_isolated_from_servers(self):
+        # BudgetTestRunner swaps the store of the host for a temporary one
+        self.assertTrue(get_throttle_store().location.startswith(
+            tempfile.gettempdir()))
+        self.assertNotEqual(get_throttle_store().location,
+                            '/var/tmp/reservation_throttle.sqlite3')
+
+    def test_pack(self):
+        self.assertEqual(unpack(pack((1.5, 2.0, 3.0))), (1.5, 2.0, 3.0))
+        self.assertEqual(unpack(pack(())), ())
+
+    def test_sqlite_update(self):
+        store = SQLiteThrottleStore(self.location)
+        self.assertEqual(store.update('a', increment, 60), 1)
+        self.assertEqual(store.update('a', increment, 60), 2)
+        self.assertEqual(store.update('b', increment, 60), 1)
+        # Expired states start over
+        self.assertEqual(store.update('a', increment, -1), 3)
+        self.assertEqual(store.update('a', increment, 60), 1)
+        store.clear()
+        self.assertEqual(store.update('b', increment, 60), 1)
+
+    def test_sqlite_atomic_across_processes(self):
+        context = multiprocessing.get_context('fork')
+        workers = [context.Process(target=hammer, args=(self.location, 50))
+                   for _ in range(4)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        store = SQLiteThrottleStore(self.location)
+        self.assertEqual(store.update('key', increment, 60), 201)
+
+    def test_cache_update(self):
+        store = CacheThrottleStore('api')
+        store.clear()
+        self.assertEqual(store.update('a', increment, 60), 1)
+        self.assertEqual(store.update('a', increment, 60), 2)
+        store.clear()
@@ -1,15 +1,19 @@
 import json
 from datetime import date, timedelta
-from random import randint
 
 from rest_framework import status
 from rest_framework.test import APITestCase
+from rest_framework.throttling import SimpleRateThrottle
 
+from django.core.exceptions import ImproperlyConfigured
 from django.test import TestCase, Client, override_settings
 from django.urls import reverse
 
 from core.models import Room, Venue, Reservation, Guest
-from core.serializers import ReservationSerializer
+
+from api.throttle_store import get_throttle_store
+from api.throttling import (ResourceBasedScopedRateThrottle, SlidingLog,
+                            SlidingWindowCounter)
 
 client = Client()
 
@@ -33,15 +37,13 @@ class ThrottlingTest(APITestCase):
         venue = Venue.objects.create(**self.venue_args)
         room_args = {'venue': venue}
         room_args.update(self.room_args)
-        room = Room.objects.create(**room_args)
-        guest = Guest.objects.create(**self.guest_args)
+        Room.objects.create(**room_args)
+        Guest.objects.create(**self.guest_args)
 
     def tearDown(self):
-        # HACK: clear the cache because we cannot override the throttling
-        # settings
-        from django.core.cache import caches
-        api_cache = caches._caches.caches['api']
-        api_cache.clear()
+        # HACK: clear the throttle store because we cannot override the
+        # throttling settings
+        get_throttle_store().clear()
 
     def _create_reservation_dict(self, checkin, checkout):
         venue = Venue.objects.order_by('?').first()
@@ -77,3 +79,109 @@ class ThrottlingTest(APITestCase):
                               data=json.dumps(put_record))
         self.assertEqual(response.status_code,
                          status.HTTP_429_TOO_MANY_REQUESTS)
+
+
+class SlidingWindowCounterTest(TestCase):
+    """ Test module for the throttle algorithms """
+
+    def _run(self, algorithm, rate, now, state):
+        num_requests, duration = SimpleRateThrottle.parse_rate(None, rate)
+        self.algorithm = algorithm(num_requests, duration, now)
+        return self.algorithm.check(state)
+
+    def test_sliding_log(self):
+        state, allowed = self._run(SlidingLog, '1/minute', 10, [])
+        self.assertTrue(allowed)
+        state, allowed = self._run(SlidingLog, '1/minute', 69, state)
+        self.assertFalse(allowed)
+        self.assertAlmostEqual(self.algorithm.wait(), 1)
+        # Exactly one minute after the last call
+        state, allowed = self._run(SlidingLog, '1/minute', 70.5, state)
+        self.assertTrue(allowed)
+
+    def test_limit(self):
+        state = ()
+        for now in (60, 61, 62, 63):
+            state, allowed = self._run(SlidingWindowCounter, '4/minute', now,
+                                       state)
+            self.assertTrue(allowed)
+        self.assertEqual(state, (60, 4, 0))
+        state, allowed = self._run(SlidingWindowCounter, '4/minute', 64,
+                                   state)
+        self.assertFalse(allowed)
+        # Next window, once 4 * (1 - elapsed) + 1 <= 4 at 135
+        self.assertAlmostEqual(self.algorithm.wait(), 135 - 64)
+
+    def test_previous_window_weight(self):
+        state = (60, 4, 0)
+        # At 150 half of the previous window is still counted: 2 + 0
+        state, allowed = self._run(SlidingWindowCounter, '4/minute', 150,
+                                   state)
+        self.assertTrue(allowed)
+        self.assertEqual(state, (120, 1, 4))
+        state, allowed = self._run(SlidingWindowCounter, '4/minute', 150,
+                                   state)
+        self.assertTrue(allowed)
+        # 2 + 2 + 1 > 4
+        state, allowed = self._run(SlidingWindowCounter, '4/minute', 150,
+                                   state)
+        self.assertFalse(allowed)
+        # Room for one more once 4 * (1 - elapsed) <= 1
+        self.assertAlmostEqual(self.algorithm.wait(), 165 - 150)
+        state, allowed = self._run(SlidingWindowCounter, '4/minute', 165,
+                                   state)
+        self.assertTrue(allowed)
+
+    def test_small_limit(self):
+        state, allowed = self._run(SlidingWindowCounter, '1/minute', 50, ())
+        self.assertTrue(allowed)
+        self.assertEqual(state, [50])
+        # Next fixed window: the weighted count would let this one through
+        state, allowed = self._run(SlidingWindowCounter, '1/minute', 61,
+                                   state)
+        self.assertFalse(allowed)
+        self.assertAlmostEqual(self.algorithm.wait(), 49)
+        state, allowed = self._run(SlidingWindowCounter, '1/minute', 110,
+                                   state)
+        self.assertTrue(allowed)
+
+    def test_stale_windows_forgotten(self):
+        state, allowed = self._run(SlidingWindowCounter, '4/minute', 300,
+                                   (60, 4, 4))
+        self.assertTrue(allowed)
+        self.assertEqual(state, (300, 1, 0))
+
+    def test_algorithm_setting(self):
+        throttle = ResourceBasedScopedRateThrottle(1)
+        throttle.scope = 'state_change'
+        for rate, small in (('1/minute', True), ('100/minute', False)):
+            throttle.num_requests, throttle.duration = \
+                throttle.parse_rate(rate)
+            algorithm = throttle.get_algorithm()
+            self.assertIsInstance(algorithm, SlidingWindowCounter)
+            self.assertEqual(algorithm.small, small)
+        with override_settings(THROTTLE_ALGORITHMS={'state_change': 'x'}):
+            with self.assertRaises(ImproperlyConfigured):
+                throttle.get_algorithm()
+
+    def test_retry_after(self):
+        venue = Venue.objects.create(**ThrottlingTest.venue_args)
+        room = Room.objects.create(venue=venue, room_number='1')
+        guest = Guest.objects.create(**ThrottlingTest.guest_args)
+        reservation = Reservation.objects.create(
+            venue=venue, room=room, guest=guest, amount=100,
+            checkin=date.today(), checkout=date.today() + timedelta(days=1))
+        url = reverse('api:reservation', args=[reservation.pk])
+        try:
+            response = client.patch(url, content_type='application/json',
+                                    data=json.dumps({'state': 1}))
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            response = client.patch(url, content_type='application/json',
+                                    data=json.dumps({'state': 2}))
+            self.assertEqual(response.status_code,
+                             status.HTTP_429_TOO_MANY_REQUESTS)
+            # The published 1 call/minute, not up to two minutes
+            self.assertGreater(int(response['Retry-After']), 55)
+            self.assertLessEqual(int(response['Retry-After']), 60)
+        finally:
+            get_throttle_store().clear()
@@ -0,0 +1,102 @@
+import json
+from rest_framework import status
+
+from django.test import TestCase, TransactionTestCase, Client
+from django.urls import reverse
+
+from core.models import Room, Venue
+
+from api.view_cache import LRUResponseCache, view_cache
+
+client = Client()
+
+
+class LRUResponseCacheTest(TestCase):
+    """ Test module for the LRU with tags """
+
+    def test_lru(self):
+        cache = LRUResponseCache(max_entries=2)
+        cache.set('a', 1, ['x'], cache.generation)
+        cache.set('b', 2, ['y'], cache.generation)
+        self.assertEqual(cache.get('a'), 1)
+        cache.set('c', 3, ['y'], cache.generation)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.stats(), {'entries': 2, 'hits': 1,
+                                         'misses': 1, 'evictions': 1})
+
+    def test_invalidate(self):
+        cache = LRUResponseCache(max_entries=10)
+        cache.set('a', 1, ['x', 'z'], cache.generation)
+        cache.set('b', 2, ['y'], cache.generation)
+        cache.invalidate(['z'])
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.get('b'), 2)
+
+    def test_stale_generation(self):
+        cache = LRUResponseCache(max_entries=10)
+        generation = cache.generation
+        cache.invalidate(['x'])
+        cache.set('a', 1, ['x'], generation)
+        self.assertIsNone(cache.get('a'))
+
+
+class ViewCacheTest(TransactionTestCase):
+    """ Responses are only cached outside of transactions """
+    venue_fields = ('name', 'address', 'city', 'zipcode', 'country', 'timezone')
+
+    def setUp(self):
+        view_cache.clear()
+        view_cache.reset_stats()
+        self.venue1 = Venue.objects.create(**dict(zip(
+            self.venue_fields, ('Hotel Galaxy', 'Outerspace Ln', 'LA',
+                                '10000', 'USA', 'America/Los_Angeles'))))
+        self.venue2 = Venue.objects.create(**dict(zip(
+            self.venue_fields, ('Hotel Avengers', 'Avengers HQ', 'LA',
+                                '90000', 'USA', 'America/Los_Angeles'))))
+        self.room1 = Room.objects.create(venue=self.venue1, room_number='1')
+        self.room2 = Room.objects.create(venue=self.venue2, room_number='1')
+
+    def tearDown(self):
+        view_cache.clear()
+
+    def _rooms(self, venue):
+        response = client.get(reverse('api:rooms'), {'venue_id': venue.id})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [room['id'] for room in response.data['results']]
+
+    def test_hits(self):
+        for _ in range(3):
+            client.get(reverse('api:venues'))
+            client.get(reverse('api:venue', args=[self.venue1.id]))
+        stats = view_cache.stats()
+        self.assertEqual((stats['hits'], stats['misses']), (4, 2))
+
+    def test_precise_invalidation(self):
+        self.assertEqual(self._rooms(self.venue1), [self.room1.id])
+        self.assertEqual(self._rooms(self.venue2), [self.room2.id])
+        room3 = Room.objects.create(venue=self.venue1, room_number='3')
+        # Venue 2 list is still cached, venue 1 list is rebuilt
+        view_cache.reset_stats()
+        self.assertEqual(self._rooms(self.venue2), [self.room2.id])
+        self.assertEqual(self._rooms(self.venue1), [self.room1.id, room3.id])
+        self.assertEqual(view_cache.stats()['hits'], 1)
+
+    def test_room_moved(self):
+        self.assertEqual(self._rooms(self.venue1), [self.room1.id])
+        response = client.patch(reverse('api:room', args=[self.room1.id]),
+                                content_type='application/json',
+                                data=json.dumps({'venue_id': self.venue2.id,
+                                                 'room_number': '2'}))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self._rooms(self.venue1), [])
+        self.assertEqual(self._rooms(self.venue2),
+                         [self.room1.id, self.room2.id])
+
+    def test_detail(self):
+        url = reverse('api:room', args=[self.room1.id])
+        client.get(url)
+        Room.objects.filter(pk=self.room1.id).update(room_desc='stale')
+        self.assertEqual(client.get(url).data['room_desc'], '')
+        self.room1.room_desc = 'Sea view'
+        self.room1.save()
+        self.assertEqual(client.get(url).data['room_desc'], 'Sea view')
@@ -0,0 +1,125 @@
+""" Storage backends for the throttles in api.throttling.
+
+A store keeps a small tuple of numbers per throttle key and offers one
+operation, update(key, func, ttl): read the state, let func compute the new
+state and a result, write it back, return the result. Throttle algorithms
+are written against that, so the store decides how atomic it is.
+
+- CacheThrottleStore keeps the states in a Django cache. get/set is only
+  atomic within a process, which is what DRF throttles always did.
+- SQLiteThrottleStore keeps them in a WAL-mode SQLite file and wraps every
+  update in BEGIN IMMEDIATE, so it is atomic across every worker process
+  on the host.
+
+The store is selected with settings.THROTTLE_STORE.
+"""
+import os
+import sqlite3
+import struct
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+
+def pack(state):
+    return struct.pack('<%dd' % len(state), *state)
+
+
+def unpack(value):
+    return struct.unpack('<%dd' % (len(value) // 8), value)
+
+
+class CacheThrottleStore(object):
+
+    def __init__(self, location='api', cache=None):
+        self.cache = cache if cache is not None else caches[location]
+        self._lock = threading.Lock()
+
+    def update(self, key, func, ttl):
+        with self._lock:
+            state, result = func(tuple(self.cache.get(key, ())))
+            self.cache.set(key, tuple(state), ttl)
+        return result
+
+    def clear(self):
+        self.cache.clear()
+
+
+class SQLiteThrottleStore(object):
+    # Expired keys are deleted once every CULL_EVERY updates
+    CULL_EVERY = 1000
+
+    def __init__(self, location):
+        self.location = location
+        self._local = threading.local()
+        self._updates = 0
+
+    def _connection(self):
+        # sqlite3 connections belong to one thread, and must not survive a
+        # fork into the worker processes
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.location, timeout=10,
+                                   isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('CREATE TABLE IF NOT EXISTS throttle ('
+                         'key TEXT PRIMARY KEY, value BLOB NOT NULL, '
+                         'expires REAL NOT NULL)')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def update(self, key, func, ttl):
+        conn = self._connection()
+        now = time.time()
+        # IMMEDIATE takes the write lock up front, so the read below cannot
+        # race with another process
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute(
+                'SELECT value FROM throttle WHERE key = ? AND expires > ?',
+                (key, now)).fetchone()
+            state, result = func(unpack(row[0]) if row else ())
+            conn.execute(
+                'INSERT INTO throttle (key, value, expires) VALUES (?, ?, ?) '
+                'ON CONFLICT(key) DO UPDATE SET value = excluded.value, '
+                'expires = excluded.expires',
+                (key, pack(state), now + ttl))
+            self._updates += 1
+            if self._updates % self.CULL_EVERY == 0:
+                conn.execute('DELETE FROM throttle WHERE expires <= ?',
+                             (now,))
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        return result
+
+    def clear(self):
+        self._connection().execute('DELETE FROM throttle')
+
+
+_store = None
+
+
+def get_throttle_store():
+    global _store
+    if _store is None:
+        config = dict(getattr(settings, 'THROTTLE_STORE', {}))
+        backend = import_string(config.pop(
+            'BACKEND', 'api.throttle_store.CacheThrottleStore'))
+        _store = backend(**dict((k.lower(), v) for k, v in config.items()))
+    return _store
+
+
+@receiver(setting_changed)
+def reset_throttle_store(setting, **kwargs):
+    global _store
+    if setting == 'THROTTLE_STORE':
+        _store = None
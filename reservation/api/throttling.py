@@ -1,22 +1,143 @@
-from django.core.cache import caches
+from django.conf import settings
 from django.core.exceptions import ImproperlyConfigured
 
 from rest_framework.throttling import ScopedRateThrottle
 
+from .throttle_store import get_throttle_store
+
+
+class SlidingLog(object):
+    """ A timestamp per request of the last `duration` seconds, the same
+    sliding log as SimpleRateThrottle. Exact at any rate. """
+    name = 'sliding_log'
+
+    def __init__(self, num_requests, duration, now):
+        self.num_requests = num_requests
+        self.duration = duration
+        self.now = now
+
+    @property
+    def state_name(self):
+        """ Name of the shape of the stored state """
+        return self.name
+
+    def check(self, history):
+        self.history = [t for t in history if t > self.now - self.duration]
+        if len(self.history) >= self.num_requests:
+            return self.history, False
+        return [self.now] + self.history, True
+
+    def wait(self):
+        """ Seconds until the oldest logged request leaves the window """
+        return self.history[-1] + self.duration - self.now
+
+
+class SlidingWindowCounter(SlidingLog):
+    """ Sliding window counter: instead of a timestamp per request, keep the
+    number of requests in the current and the previous fixed window and
+    weigh the previous one by how much of it still overlaps the sliding
+    window. The stored state is (window start, current, previous), 24 bytes
+    per throttled resource whatever the rate.
+
+    The weighting makes it an approximation: a limit of N can hold a client
+    back for up to one extra window, and let one through early right after a
+    window rolls over, which matters at small limits. Below MIN_REQUESTS it
+    keeps the timestamps of the last num_requests requests instead: exact,
+    and no bigger than the counters (8 bytes at 1/minute).
+    """
+    name = 'sliding_window_counter'
+    MIN_REQUESTS = 4
+
+    def __init__(self, num_requests, duration, now):
+        super(SlidingWindowCounter, self).__init__(num_requests, duration, now)
+        self.small = num_requests < self.MIN_REQUESTS
+
+    @property
+    def state_name(self):
+        return self.name + '_small' if self.small else self.name
+
+    def check(self, state):
+        if self.small:
+            return super(SlidingWindowCounter, self).check(state or ())
+        window = self.now - self.now % self.duration
+        start, current, previous = state or (window, 0, 0)
+        if start != window:
+            # Roll over, the old current window is only "previous" when it
+            # is the one right before this one
+            previous = current if window - start == self.duration else 0
+            start, current = window, 0
+        self.counts = (window, current, previous)
+        elapsed = (self.now - window) / self.duration
+        if previous * (1 - elapsed) + current + 1 > self.num_requests:
+            return (start, current, previous), False
+        return (start, current + 1, previous), True
+
+    def wait(self):
+        """ Seconds until the weighted count leaves room for one request """
+        if self.small:
+            return super(SlidingWindowCounter, self).wait()
+        window, current, previous = self.counts
+        limit = self.num_requests - 1
+        if current <= limit:
+            # previous * (1 - elapsed) has to drop to limit - current
+            if not previous:
+                return 0
+            elapsed = 1 - float(limit - current) / previous
+            return window + elapsed * self.duration - self.now
+        # Only the next window can help, where current becomes previous
+        elapsed = 1 - float(limit) / current
+        return window + (1 + elapsed) * self.duration - self.now
+
+
+ALGORITHMS = dict((algorithm.name, algorithm)
+                  for algorithm in (SlidingLog, SlidingWindowCounter))
+
 
 class ResourceBasedScopedRateThrottle(ScopedRateThrottle):
-    cache = caches['api']
+    # Request history is kept in the configured throttle store
+    # (settings.THROTTLE_STORE) instead of a cache, with the algorithm of
+    # the scope in settings.THROTTLE_ALGORITHMS
 
     def __init__(self, resource_id, get_method_group_id=lambda x: x):
         self.resource_id = resource_id
         self.get_method_group_id = get_method_group_id
+        self.store = get_throttle_store()
         super(ResourceBasedScopedRateThrottle, self).__init__()
 
+    def get_algorithm(self):
+        name = getattr(settings, 'THROTTLE_ALGORITHMS', {}).get(
+            self.scope, SlidingLog.name)
+        try:
+            algorithm = ALGORITHMS[name]
+        except KeyError:
+            raise ImproperlyConfigured('Unknown throttle algorithm %r for '
+                                       'the %r scope.' % (name, self.scope))
+        return algorithm(self.num_requests, self.duration, self.timer())
+
+    def allow_request(self, request, view):
+        self.scope = getattr(view, self.scope_attr, None)
+        if not self.scope:
+            return True
+        self.rate = self.get_rate()
+        self.num_requests, self.duration = self.parse_rate(self.rate)
+        self.algorithm = self.get_algorithm()
+        self.key = self.get_cache_key(request, view)
+        if self.key is None:
+            return True
+        return self.store.update(self.key, self.algorithm.check,
+                                 self.duration)
+
+    def wait(self):
+        return self.algorithm.wait()
+
     def get_cache_key(self, request, view):
         method = self.get_method_group_id(request.method.lower())
         view_name = view.get_view_name().lower().replace(' ', '_')
         scope = '{}_{}_{}_{}'.format(
             self.scope, view_name, method, self.resource_id)
+        if self.algorithm.state_name != SlidingLog.name:
+            # Its state does not read as a log, should the setting change
+            scope = '{}_{}'.format(scope, self.algorithm.state_name)
 
         return self.cache_format % {
             'scope': scope,
@@ -6,6 +6,10 @@ urlpatterns = [
     path('guests', views.GuestList.as_view(), name='guests'),
     path('guest/<int:pk>', views.GuestDetail.as_view(), name='guest'),
     path('reservations', views.ReservationList.as_view(), name='reservations'),
+    path('reservations/bulk', views.ReservationBulkCreate.as_view(),
+         name='reservations_bulk'),
+    path('reservations/export', views.ReservationExport.as_view(),
+         name='reservations_export'),
     path('reservation/<int:pk>', views.ReservationDetail.as_view(),
          name='reservation'),
     path('rooms', views.RoomList.as_view(), name='rooms'),
@@ -14,6 +18,14 @@ urlpatterns = [
     path('venues', views.VenueList.as_view(), name='venues'),
     path('venue/<int:pk>', views.VenueDetail.as_view(), name='venue'),
     path('calendar', views.CalendarList.as_view(), name='calendar'),
+    path('calendar/export', views.CalendarExport.as_view(),
+         name='calendar_export'),
     re_path(r'calendar/(?P<date>\d{4}-\d{2}-\d{2})',
             views.CalendarDayList.as_view(), name='calendar_day'),
+    path('availability', views.AvailabilityList.as_view(),
+         name='availability'),
+    path('quote', views.StayQuote.as_view(), name='quote'),
+    path('search', views.RoomSearch.as_view(), name='search'),
+    path('analytics/occupancy', views.OccupancyAnalytics.as_view(),
+         name='analytics_occupancy'),
 ]
@@ -0,0 +1,137 @@
+""" In-process read-through cache for the Venue and Room endpoints.
+
+Responses data is cached per view and full path in a bounded LRU. Every entry
+carries tags such as 'venues', 'room:7' or 'rooms:venue:3', and the Venue
+and Room signals (see api.signals) drop exactly the entries tagged with
+what changed. VIEW_CACHE_TIMEOUT bounds how long writes made by other
+processes can go unseen.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db import transaction
+
+from rest_framework.response import Response
+
+from core.routers import primary
+from core.utils import in_transaction
+
+
+class LRUResponseCache(object):
+
+    def __init__(self, max_entries=None, timeout=None):
+        self._max_entries = max_entries
+        self._timeout = timeout
+        self._entries = OrderedDict()
+        self._tags = {}
+        self._lock = threading.Lock()
+        # Bumped by every invalidation, a response computed across one is
+        # not stored
+        self.generation = 0
+        self.hits = self.misses = self.evictions = 0
+
+    @property
+    def max_entries(self):
+        if self._max_entries is not None:
+            return self._max_entries
+        return getattr(settings, 'VIEW_CACHE_MAX_ENTRIES', 1000)
+
+    @property
+    def timeout(self):
+        if self._timeout is not None:
+            return self._timeout
+        return getattr(settings, 'VIEW_CACHE_TIMEOUT', None)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self.timeout is not None and \
+                    time.monotonic() - entry[2] > self.timeout:
+                self._remove(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, data, tags, generation):
+        with self._lock:
+            if generation != self.generation:
+                return
+            self._remove(key)
+            self._entries[key] = (data, tags, time.monotonic())
+            for tag in tags:
+                self._tags.setdefault(tag, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            for tag in entry[1]:
+                keys = self._tags.get(tag)
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+    def invalidate(self, tags):
+        with self._lock:
+            self.generation += 1
+            for tag in tags:
+                for key in list(self._tags.get(tag, ())):
+                    self._remove(key)
+
+    def invalidate_on_commit(self, tags):
+        """ Drop entries now, and again once the surrounding transaction (if
+        any) commits """
+        tags = list(tags)
+        self.invalidate(tags)
+        if in_transaction():
+            transaction.on_commit(lambda: self.invalidate(tags))
+
+    def clear(self):
+        with self._lock:
+            self.generation += 1
+            self._entries.clear()
+            self._tags.clear()
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'hits': self.hits,
+                    'misses': self.misses, 'evictions': self.evictions}
+
+    def reset_stats(self):
+        with self._lock:
+            self.hits = self.misses = self.evictions = 0
+
+
+view_cache = LRUResponseCache()
+
+
+class CachedGetMixin(object):
+    """ Serve GET from view_cache. Views list their tags in get_cache_tags """
+
+    def get_cache_tags(self, data):
+        raise NotImplementedError('.get_cache_tags() must be overridden')
+
+    def get(self, request, *args, **kwargs):
+        key = (type(self).__name__, request.get_host(),
+               request.get_full_path())
+        data = view_cache.get(key)
+        if data is not None:
+            return Response(data)
+        generation = view_cache.generation
+        # Cached for the whole process, never from a lagging replica
+        with primary():
+            response = super(CachedGetMixin, self).get(request, *args,
+                                                       **kwargs)
+        # Data read inside a transaction may still be rolled back
+        if response.status_code == 200 and not in_transaction():
+            view_cache.set(key, response.data, self.get_cache_tags(
+                response.data), generation)
+        return response
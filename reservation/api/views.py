@@ -1,4 +1,5 @@
 from datetime import datetime as dt
+from django.conf import settings
 from django.http import Http404
 
 from rest_framework.views import APIView
@@ -6,15 +7,54 @@ from rest_framework.response import Response
 from rest_framework import status, generics, mixins
 from rest_framework.exceptions import ValidationError
 
+from core import analytics, bulk
+from core.availability import free_rooms
+from core.booking_queue import booking_queue
+from core.calendar_grid import calendar_matrix
+from core.calendar_store import (CompactCalendar, compact_rows,
+                                 compact_storage, from_cents)
 from core.models import Guest, Reservation, Room, Calendar, Venue
+from core.quotes import quote_stays
+from core.search import cheapest_rooms
+from core.versions import calendar_day_version
 from core.serializers import (GuestSerializer, ReservationSerializer,
                               RoomSerializer, CalendarSerializer,
-                              VenueSerializer)
+                              StaySerializer, VenueSerializer)
 
+from .conditional import ConditionalGetMixin
+from .export import CHUNK_SIZE, ExportView
+from .pagination import CalendarPagination, ReservationPagination
+from .view_cache import CachedGetMixin
 from .throttling import MethodBasedThrottlingMixin
 from .exception_handler import api_exception_handler
 
 
+def parse_date(query_params, name):
+    value = query_params.get(name)
+    try:
+        return dt.strptime(value, '%Y-%m-%d').date()
+    except (TypeError, ValueError):
+        raise ValidationError({name: 'Expected a date in YYYY-MM-DD format.'})
+
+
+def parse_optional(parse, query_params, name):
+    if query_params.get(name) in (None, ''):
+        return None
+    return parse(query_params, name)
+
+
+def parse_room_type(query_params):
+    """ room_type filter, None when missing or empty (?room_type=) """
+    return query_params.get('room_type') or None
+
+
+def parse_int(query_params, name):
+    try:
+        return int(query_params.get(name))
+    except (TypeError, ValueError):
+        raise ValidationError({name: 'Expected an integer.'})
+
+
 # Guest API
 class GuestList(generics.ListCreateAPIView):
     queryset = Guest.objects.all()
@@ -27,14 +67,28 @@ class GuestDetail(generics.RetrieveUpdateDestroyAPIView):
 
 
 # Room API
-class RoomDetail(generics.RetrieveUpdateDestroyAPIView):
+# Room and Venue GETs are served from api.view_cache, api.signals drops the
+# entries when a room or venue changes
+class RoomDetail(CachedGetMixin, generics.RetrieveUpdateDestroyAPIView):
     queryset = Room.objects.all()
     serializer_class = RoomSerializer
 
+    def get_cache_tags(self, data):
+        return ['room:%s' % data['id']]
+
 
-class RoomList(generics.ListCreateAPIView):
+class RoomList(CachedGetMixin, generics.ListCreateAPIView):
     serializer_class = RoomSerializer
 
+    def get_cache_tags(self, data):
+        # Tagged with every room listed, so a room moving to another venue
+        # drops the lists it used to be in
+        venue_id = self.request.query_params.get('venue_id', None)
+        tags = ['rooms:venue:%s' % venue_id if venue_id else 'rooms']
+        results = data['results'] if isinstance(data, dict) else data
+        tags.extend('room:%s' % room['id'] for room in results)
+        return tags
+
     def get_queryset(self):
         queryset = Room.objects.all()
         query_params = self.request.query_params
@@ -50,14 +104,94 @@ class RoomList(generics.ListCreateAPIView):
         return queryset
 
 
+# POST and the updates of ReservationDetail are written by the writer thread
+# of core.booking_queue, which group-commits concurrent bookings
 class ReservationList(generics.ListCreateAPIView):
     queryset = Reservation.objects.all()
     serializer_class = ReservationSerializer
+    pagination_class = ReservationPagination
+
+    def get_serializer_context(self):
+        context = super(ReservationList, self).get_serializer_context()
+        # Amounts are checked by core.bulk, with the rest of the batch
+        context['check_amount'] = False
+        return context
+
+    def perform_create(self, serializer):
+        serializer.instance = booking_queue.create(serializer.to_record())
+
+
+# Creates many reservations in one call, for channel-manager imports.
+# ?mode=atomic (default) creates all or nothing, ?mode=best_effort creates
+# every valid item. Responds with one result per item, in order.
+class ReservationBulkCreate(APIView):
+
+    def post(self, request, format=None):
+        mode = request.query_params.get('mode', bulk.ATOMIC)
+        if mode not in bulk.MODES:
+            raise ValidationError({'mode': 'Expected one of %s.' %
+                                           ', '.join(bulk.MODES)})
+        if not isinstance(request.data, list):
+            raise ValidationError({'error': 'Expected a list of '
+                                            'reservations.'})
+        records, errors = [], {}
+        for i, item in enumerate(request.data):
+            # Amounts are checked by core.bulk, with one query for all items
+            serializer = ReservationSerializer(
+                data=item, context={'check_amount': False})
+            if serializer.is_valid():
+                records.append(serializer.to_record())
+            else:
+                records.append(None)
+                errors[i] = serializer.errors
+        results = bulk.create_reservations(records, mode, errors)
+
+        data = []
+        for result in results:
+            item = {'index': result.index, 'status': result.status}
+            if result.status == bulk.CREATED:
+                item['reservation'] = ReservationSerializer(
+                    result.reservation).data
+            elif result.status == bulk.ERROR:
+                item['errors'] = result.errors
+            data.append(item)
+        created = sum(1 for r in results if r.status == bulk.CREATED)
+        if created == len(results):
+            code = status.HTTP_201_CREATED
+        elif created:
+            code = status.HTTP_207_MULTI_STATUS
+        else:
+            code = status.HTTP_400_BAD_REQUEST
+        return Response(data, status=code)
+
+
+# Streams every reservation as NDJSON (default) or CSV (?format=csv).
+# Filters: venue_id, and from / to keeping the stays that overlap the range
+class ReservationExport(ExportView):
+    fields = ('id', 'venue_id', 'room_id', 'guest_id', 'checkin', 'checkout',
+              'amount', 'state', 'created_at', 'updated_at')
+    filename = 'reservations'
+
+    def get_rows(self):
+        query_params = self.request.query_params
+        venue_id = parse_optional(parse_int, query_params, 'venue_id')
+        start = parse_optional(parse_date, query_params, 'from')
+        end = parse_optional(parse_date, query_params, 'to')
+        queryset = Reservation.objects.order_by('id')
+        if venue_id is not None:
+            queryset = queryset.filter(venue__id=venue_id)
+        if start is not None:
+            queryset = queryset.filter(checkout__gt=start)
+        if end is not None:
+            queryset = queryset.filter(checkin__lte=end)
+        return queryset.values_list(*self.fields) \
+            .iterator(chunk_size=CHUNK_SIZE)
 
 
 # Update methods are throttled to 1 call/minute only if updated in last 1 min.
 # state_change is configurable in settings.py
-class ReservationDetail(MethodBasedThrottlingMixin,
+# GET answers If-None-Match with 304 after reading the version column only
+class ReservationDetail(ConditionalGetMixin, MethodBasedThrottlingMixin,
                         generics.RetrieveUpdateDestroyAPIView):
     queryset = Reservation.objects.all()
     serializer_class = ReservationSerializer
@@ -65,45 +199,241 @@ class ReservationDetail(MethodBasedThrottlingMixin,
     THROTTLED_METHODS = set(['put', 'patch'])
     resource_id_field = 'pk'
 
+    validators_from_object = True
+
     # Put 'put' and 'patch' into one group
     def get_method_group_id(self, method):
         if method in ['put', 'patch']:
             return 'update'
         return method
 
+    def get_validators(self, instance=None):
+        if instance is None:
+            instance = self.get_queryset().filter(pk=self.kwargs['pk']) \
+                .only('id', 'version', 'updated_at').first()
+            if instance is None:
+                return None
+        return ('reservation-%s-v%d' % (instance.pk, instance.version),
+                instance.updated_at)
+
+    def perform_update(self, serializer):
+        booking_queue.update(serializer)
+
 
 # Only allow venue retrieval by id and list
 # Because adding a venue can have such an huge business impact, so we're not
 # allowing unsafe methods via api
-class VenueList(generics.ListAPIView):
+class VenueList(CachedGetMixin, generics.ListAPIView):
     queryset = Venue.objects.all()
     serializer_class = VenueSerializer
 
+    def get_cache_tags(self, data):
+        return ['venues']
 
-class VenueDetail(generics.RetrieveAPIView):
+
+class VenueDetail(CachedGetMixin, generics.RetrieveAPIView):
     queryset = Venue.objects.all()
     serializer_class = VenueSerializer
 
+    def get_cache_tags(self, data):
+        return ['venue:%s' % data['id']]
+
 
 # ********************************************************
 # Calendar/Booking needs custom end-points
 # Only list and detail endpoints are allowed
 # Delete and update are suppose to be done by back-end job
 # ********************************************************
+# With CALENDAR_STORAGE = 'compact' the calendar is read from CalendarMonth,
+# the response shape stays the same.
+# ?venue_id=&from=&to=[&room_type=][&aggregates=true] returns the room x day
+# matrix of the venue instead, see core.calendar_grid
 class CalendarList(generics.ListAPIView):
-    queryset = Calendar.objects.all()
     serializer_class = CalendarSerializer
+    pagination_class = CalendarPagination
 
+    def get_queryset(self):
+        if compact_storage():
+            return CompactCalendar()
+        return Calendar.objects.all()
+
+    def list(self, request, *args, **kwargs):
+        query_params = request.query_params
+        if 'from' not in query_params and 'to' not in query_params:
+            return super(CalendarList, self).list(request, *args, **kwargs)
+        venue_id = parse_int(query_params, 'venue_id')
+        start = parse_date(query_params, 'from')
+        end = parse_date(query_params, 'to')
+        if start > end:
+            raise ValidationError({'error': 'from should not be after to.'})
+        max_days = getattr(settings, 'CALENDAR_RANGE_MAX_DAYS', 366)
+        if (end - start).days >= max_days:
+            raise ValidationError({'error': 'At most %d days can be '
+                                            'requested.' % max_days})
+        aggregates = query_params.get('aggregates', '').lower() in (
+            '1', 'true', 'yes')
+        return Response(calendar_matrix(
+            venue_id, start, end, parse_room_type(query_params),
+            aggregates))
 
-class CalendarDayList(generics.ListAPIView):
+
+# Versioned per day (core.versions), If-None-Match is answered with 304
+# after reading the day counter only
+class CalendarDayList(ConditionalGetMixin, generics.ListAPIView):
     serializer_class = CalendarSerializer
 
+    def get_day(self):
+        return dt.strptime(self.kwargs['date'], '%Y-%m-%d').date()
+
+    def get_validators(self, instance=None):
+        day = self.get_day()
+        version, updated_at = calendar_day_version(day)
+        # Both storages serve the same day with different entry ids
+        storage = 'compact' if compact_storage() else 'rows'
+        return 'calendar-%s-%s-v%d' % (day, storage, version), updated_at
+
     def get_queryset(self):
-        data = self.kwargs['date']
-        day = dt.strptime(data, '%Y-%m-%d').date()
+        day = self.get_day()
+        if compact_storage():
+            return CompactCalendar(day=day)
         return Calendar.objects.filter(day=day)
 
 
+# Streams the calendar as NDJSON (default) or CSV (?format=csv).
+# Filters: venue_id, and from / to on the day (both inclusive)
+class CalendarExport(ExportView):
+    fields = ('id', 'room_id', 'venue_id', 'day', 'price', 'reservation_id')
+    filename = 'calendar'
+
+    def get_rows(self):
+        query_params = self.request.query_params
+        venue_id = parse_optional(parse_int, query_params, 'venue_id')
+        start = parse_optional(parse_date, query_params, 'from')
+        end = parse_optional(parse_date, query_params, 'to')
+        if compact_storage():
+            return compact_rows(start, end, venue_id, chunk_size=CHUNK_SIZE)
+        queryset = Calendar.objects.order_by('id')
+        if venue_id is not None:
+            queryset = queryset.filter(venue__id=venue_id)
+        if start is not None:
+            queryset = queryset.filter(day__gte=start)
+        if end is not None:
+            queryset = queryset.filter(day__lte=end)
+        return queryset.values_list(*self.fields) \
+            .iterator(chunk_size=CHUNK_SIZE)
+
+
 class CalendarDetail(generics.RetrieveAPIView):
     queryset = Calendar.objects.all()
     serializer_class = CalendarSerializer
+
+
+# Prices many stays in one call: POST a list of {room_id, checkin, checkout}.
+# Responds with one result per item, in order, with the amount of the stay or
+# the errors. Answered from the running totals of core.quotes.
+class StayQuote(APIView):
+
+    def post(self, request, format=None):
+        if not isinstance(request.data, list):
+            raise ValidationError({'error': 'Expected a list of stays.'})
+        max_stays = getattr(settings, 'QUOTE_MAX_STAYS', 1000)
+        if len(request.data) > max_stays:
+            raise ValidationError({'error': 'At most %d stays can be '
+                                            'quoted at once.' % max_stays})
+        data, stays = [], []
+        for i, item in enumerate(request.data):
+            serializer = StaySerializer(data=item)
+            if serializer.is_valid():
+                stay = serializer.validated_data
+                stays.append((i, stay))
+                data.append({'index': i, 'room_id': stay['room_id'],
+                             'checkin': stay['checkin'],
+                             'checkout': stay['checkout']})
+            else:
+                data.append({'index': i, 'errors': serializer.errors})
+        quotes = quote_stays([(stay['room_id'], stay['checkin'],
+                               stay['checkout']) for _, stay in stays])
+        for (i, stay), cents in zip(stays, quotes):
+            if cents is None:
+                data[i]['errors'] = {'error': 'Some nights are not in the '
+                                              'calendar.'}
+            else:
+                data[i]['nights'] = (stay['checkout'] - stay['checkin']).days
+                data[i]['amount'] = str(from_cents(cents))
+
+        quoted = sum(1 for item in data if 'amount' in item)
+        if quoted == len(data):
+            code = status.HTTP_200_OK
+        elif quoted:
+            code = status.HTTP_207_MULTI_STATUS
+        else:
+            code = status.HTTP_400_BAD_REQUEST
+        return Response(data, status=code)
+
+
+# Rooms of a venue that are free for every night from checkin to checkout
+class AvailabilityList(generics.ListAPIView):
+    serializer_class = RoomSerializer
+
+    def get_queryset(self):
+        query_params = self.request.query_params
+        venue_id = parse_int(query_params, 'venue_id')
+        checkin = parse_date(query_params, 'checkin')
+        checkout = parse_date(query_params, 'checkout')
+        if checkin >= checkout:
+            raise ValidationError({'error': 'checkin date should be less '
+                                            'than checkout date.'})
+        room_type = parse_room_type(query_params)
+        room_ids = free_rooms(venue_id, checkin, checkout, room_type)
+        return Room.objects.filter(pk__in=room_ids)
+
+
+# The cheapest rooms of a city free for the whole stay, see core.search.
+# Filters: city, checkin, checkout, room_type; limit is the number of rooms
+class RoomSearch(APIView):
+
+    def get(self, request, format=None):
+        query_params = request.query_params
+        city = query_params.get('city')
+        if not city:
+            raise ValidationError({'city': 'This field is required.'})
+        checkin = parse_date(query_params, 'checkin')
+        checkout = parse_date(query_params, 'checkout')
+        if checkin >= checkout:
+            raise ValidationError({'error': 'checkin date should be less '
+                                            'than checkout date.'})
+        max_results = getattr(settings, 'SEARCH_MAX_RESULTS', 100)
+        limit = parse_optional(parse_int, query_params, 'limit')
+        if limit is None:
+            limit = 10
+        if not 0 < limit <= max_results:
+            raise ValidationError({'limit': 'Expected an integer from 1 to '
+                                            '%d.' % max_results})
+        found = cheapest_rooms(city, checkin, checkout,
+                               parse_room_type(query_params), limit)
+        rooms = Room.objects.in_bulk([room_id for _, room_id in found])
+        nights = (checkout - checkin).days
+        data = []
+        for cents, room_id in found:
+            item = RoomSerializer(rooms[room_id]).data
+            item.update(nights=nights, amount=str(from_cents(cents)))
+            data.append(item)
+        return Response(data)
+
+
+# Nightly occupancy, revenue, ADR and RevPAR of a venue, see core.analytics
+class OccupancyAnalytics(APIView):
+
+    def get(self, request, format=None):
+        query_params = request.query_params
+        venue_id = parse_int(query_params, 'venue_id')
+        start = parse_date(query_params, 'from')
+        end = parse_date(query_params, 'to')
+        if start > end:
+            raise ValidationError({'error': 'from should not be after to.'})
+        max_days = getattr(settings, 'ANALYTICS_MAX_DAYS', 731)
+        if (end - start).days >= max_days:
+            raise ValidationError({'error': 'At most %d days can be '
+                                            'requested.' % max_days})
+        return Response(analytics.occupancy(
+            venue_id, start, end, parse_room_type(query_params)))
@@ -1,8 +1,10 @@
 from django.contrib import admin
-from .models import Venue, Guest, Reservation, Room, Calendar
+from .models import (Venue, Guest, Reservation, Room, Calendar,
+                     CalendarMonth)
 
 admin.site.register(Venue)
 admin.site.register(Guest)
 admin.site.register(Reservation)
 admin.site.register(Room)
 admin.site.register(Calendar)
+admin.site.register(CalendarMonth)
@@ -0,0 +1,152 @@
+""" Occupancy and revenue analytics of a venue over a day range.
+
+Reservations are loaded as arrays of (first night, last night + 1) offsets
+into the range and expanded into nightly counts with difference arrays:
++1 at the first night, -1 after the last one, np.add.at to accumulate, then
+a cumulative sum. Revenue uses the same arrays weighted by each stay's
+nightly rate (amount / nights). Calendar prices are summed per day with
+np.bincount. Nothing loops over nights in Python.
+
+Results are cached in settings.ANALYTICS_CACHE under a fingerprint of the
+data they were computed from, read with two aggregate queries, so a
+repeated dashboard load skips the loading and the computation and any
+write to the venue's reservations or calendar days misses the cache.
+"""
+import hashlib
+from datetime import timedelta
+
+import numpy as np
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import Count, Max, Sum
+
+from .models import Calendar, CalendarDayVersion, Reservation, Room
+
+
+def _ordinals(dates):
+    return np.fromiter((d.toordinal() for d in dates), dtype=np.int64,
+                       count=len(dates))
+
+
+def nightly_counts(starts, ends, days, weights=None):
+    """ Sum of `weights` (1 by default) over the stays covering each day.
+
+    starts and ends are day offsets, ends exclusive, already clipped to
+    [0, days]. """
+    diff = np.zeros(days + 1)
+    np.add.at(diff, starts, 1 if weights is None else weights)
+    np.add.at(diff, ends, -1 if weights is None else -weights)
+    return np.cumsum(diff[:days])
+
+
+def ratio(numerator, denominator, digits=2):
+    """ numerator / denominator rounded, None where the denominator is 0 """
+    result = np.divide(numerator, denominator,
+                       out=np.zeros(len(numerator)), where=denominator != 0)
+    return [round(float(value), digits) if ok else None
+            for value, ok in zip(result, denominator != 0)]
+
+
+def _reservations(venue_id, room_ids, start, end):
+    return Reservation.objects.filter(
+        venue__id=venue_id, room__id__in=room_ids, checkin__lte=end,
+        checkout__gt=start)
+
+
+def _calendar_days(start, end):
+    return CalendarDayVersion.objects.filter(day__gte=start, day__lte=end)
+
+
+def data_fingerprint(venue_id, rooms, start, end):
+    """ Changes whenever a write can change the analytics of the range """
+    room_ids = [room_id for room_id, _ in rooms]
+    reservations = _reservations(venue_id, room_ids, start, end).aggregate(
+        count=Count('id'), last_id=Max('id'), versions=Sum('version'),
+        updated_at=Max('updated_at'))
+    calendar = _calendar_days(start, end).aggregate(
+        versions=Sum('version'), updated_at=Max('updated_at'))
+    raw = repr((rooms, sorted(reservations.items()),
+                sorted(calendar.items())))
+    return hashlib.md5(raw.encode('utf-8')).hexdigest()
+
+
+def compute_occupancy(venue_id, room_ids, start, end):
+    days = (end - start).days + 1
+    origin = start.toordinal()
+
+    stays = list(_reservations(venue_id, room_ids, start, end)
+                 .values_list('checkin', 'checkout', 'amount'))
+    sold = revenue = np.zeros(days)
+    if stays:
+        checkins, checkouts, amounts = zip(*stays)
+        first, last = _ordinals(checkins), _ordinals(checkouts)
+        rates = np.array(amounts, dtype=float) / (last - first)
+        starts = np.clip(first - origin, 0, days)
+        ends = np.clip(last - origin, 0, days)
+        sold = nightly_counts(starts, ends, days)
+        revenue = nightly_counts(starts, ends, days, rates)
+
+    prices = list(Calendar.objects.filter(
+        venue__id=venue_id, room__id__in=room_ids, day__gte=start,
+        day__lte=end).values_list('day', 'price'))
+    price_sum = price_count = np.zeros(days)
+    if prices:
+        calendar_days, amounts = zip(*prices)
+        index = _ordinals(calendar_days) - origin
+        price_sum = np.bincount(index, weights=np.array(amounts, dtype=float),
+                                minlength=days)
+        price_count = np.bincount(index, minlength=days).astype(float)
+
+    available = np.full(days, float(len(room_ids)))
+    total_available = available.sum()
+    total_sold = sold.sum()
+    total_revenue = revenue.sum()
+    return {
+        'days': [start + timedelta(days=i) for i in range(days)],
+        'available': [int(value) for value in available],
+        'sold': [int(round(value)) for value in sold],
+        'occupancy': ratio(sold, available, 4),
+        'revenue': [round(float(value), 2) for value in revenue],
+        'adr': ratio(revenue, sold),
+        'revpar': ratio(revenue, available),
+        'avg_price': ratio(price_sum, price_count),
+        'summary': {
+            'available': int(total_available),
+            'sold': int(round(total_sold)),
+            'occupancy': ratio(np.array([total_sold]),
+                               np.array([total_available]), 4)[0],
+            'revenue': round(float(total_revenue), 2),
+            'adr': ratio(np.array([total_revenue]),
+                         np.array([total_sold]))[0],
+            'revpar': ratio(np.array([total_revenue]),
+                            np.array([total_available]))[0],
+        },
+    }
+
+
+def occupancy(venue_id, start, end, room_type=None):
+    """ Nightly available and sold rooms, occupancy, revenue, ADR (revenue
+    per sold room), RevPAR (revenue per available room) and average listed
+    price of the venue from start to end (both inclusive), with totals in
+    'summary'. Revenue spreads each reservation amount evenly over its
+    nights. """
+    rooms = Room.objects.filter(venue__id=venue_id).order_by('id')
+    if room_type:
+        rooms = rooms.filter(room_type=room_type)
+    rooms = list(rooms.values_list('id', 'room_type'))
+
+    cache = caches[getattr(settings, 'ANALYTICS_CACHE', 'default')]
+    key = 'analytics:occupancy:%s:%s:%s:%s:%s' % (
+        venue_id, room_type or '', start, end,
+        data_fingerprint(venue_id, rooms, start, end))
+    data = cache.get(key)
+    if data is None:
+        data = compute_occupancy(venue_id, [room_id for room_id, _ in rooms],
+                                 start, end)
+        cache.set(key, data, getattr(settings, 'ANALYTICS_CACHE_TIMEOUT',
+                                     300))
+    result = {'venue_id': venue_id, 'room_type': room_type, 'from': start,
+              'to': end}
+    result.update(data)
+    return result
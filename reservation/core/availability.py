@@ -0,0 +1,318 @@
+import threading
+import time
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+
+from .routers import primary
+from .utils import in_transaction
+
+
+def day_mask(start, end):
+    """ Bits start..end-1 set """
+    return ((1 << (end - start)) - 1) << start
+
+
+class VenueAvailability(object):
+    """ Booked nights of every room of a venue, one int bitset per room.
+
+    Bit i of a room is set when night `origin + i` is taken. Python ints are
+    arbitrary precision, so testing a stay is a single AND of two machine-word
+    arrays no matter how many nights it spans.
+    """
+
+    def __init__(self, origin, horizon):
+        self.origin = origin
+        self.horizon = horizon
+        self.room_types = {}
+        self.booked = {}
+        # reservation id -> (room id, bits it sets)
+        self.stays = {}
+        self.loaded_at = time.monotonic()
+
+    def offsets(self, checkin, checkout):
+        start = max((checkin - self.origin).days, 0)
+        end = min((checkout - self.origin).days, self.horizon)
+        return start, end
+
+    def covers(self, checkin, checkout):
+        return (checkin >= self.origin and
+                (checkout - self.origin).days <= self.horizon)
+
+    def add_room(self, room_id, room_type):
+        self.room_types[room_id] = room_type
+        self.booked.setdefault(room_id, 0)
+
+    def _set(self, pk, room_id, mask):
+        if room_id not in self.booked or not mask:
+            return
+        stay_room_id, stay_mask = self.stays.get(pk, (room_id, 0))
+        if stay_room_id != room_id:
+            return
+        self.stays[pk] = (room_id, stay_mask | mask)
+        self.booked[room_id] |= mask
+
+    def add_stay(self, pk, room_id, checkin, checkout):
+        self.discard_stay(pk)
+        start, end = self.offsets(checkin, checkout)
+        if start < end:
+            self._set(pk, room_id, day_mask(start, end))
+
+    def add_calendar_day(self, pk, room_id, day):
+        # Calendar rows point at their reservation, so a booked day is folded
+        # into that reservation's bits and cleared together with them
+        if self.covers(day, day):
+            self._set(pk, room_id, 1 << (day - self.origin).days)
+
+    def discard_stay(self, pk):
+        stay = self.stays.pop(pk, None)
+        if stay is not None:
+            room_id, mask = stay
+            # Stays of a room never overlap, so the bits are ours alone
+            self.booked[room_id] &= ~mask
+
+    def free_rooms(self, checkin, checkout, room_type=None):
+        mask = day_mask(*self.offsets(checkin, checkout))
+        return sorted(
+            room_id for room_id, bits in self.booked.items()
+            if not bits & mask and
+            (not room_type or self.room_types[room_id] == room_type))
+
+
+class AvailabilityEngine(object):
+    """ Per-process availability bitsets, loaded per venue on first use.
+
+    A venue is seeded from Room, Reservation and the booked Calendar rows
+    over a rolling horizon starting today and is then patched by the
+    Reservation signals (see core.signals). A write made inside a
+    transaction is patched in once it commits. Inside a transaction nothing
+    is loaded or answered, callers get None and fall back to the database,
+    which sees the uncommitted rows of their transaction.
+
+    warm_later() loads venues in a background thread instead, without holding
+    the lock while it reads them; a venue changed meanwhile is not kept.
+    """
+
+    def __init__(self):
+        self._venues = {}
+        # venue id -> True once changed while a warm-up reads it
+        self._loading = {}
+        self._warmer = None
+        self._lock = threading.RLock()
+
+    @property
+    def horizon(self):
+        return getattr(settings, 'AVAILABILITY_HORIZON_DAYS', 730)
+
+    @property
+    def max_age(self):
+        return getattr(settings, 'AVAILABILITY_MAX_AGE', None)
+
+    def _load(self, venue_id):
+        # Shared by the whole process, never filled from a lagging replica
+        with primary():
+            return self._fill(venue_id)
+
+    def _fill(self, venue_id):
+        from .models import Calendar, Reservation, Room
+
+        availability = VenueAvailability(date.today(), self.horizon)
+        end = availability.origin + timedelta(days=availability.horizon)
+        rooms = Room.objects.filter(venue__id=venue_id)
+        for room_id, room_type in rooms.values_list('id', 'room_type'):
+            availability.add_room(room_id, room_type)
+        reservations = Reservation.objects.filter(
+            venue__id=venue_id, checkin__lt=end,
+            checkout__gt=availability.origin)
+        for pk, room_id, checkin, checkout in reservations.values_list(
+                'id', 'room_id', 'checkin', 'checkout'):
+            availability.add_stay(pk, room_id, checkin, checkout)
+        calendar = Calendar.objects.filter(
+            venue__id=venue_id, day__gte=availability.origin, day__lt=end,
+            reservation__isnull=False)
+        for pk, room_id, day in calendar.values_list(
+                'reservation_id', 'room_id', 'day'):
+            availability.add_calendar_day(pk, room_id, day)
+        return availability
+
+    def _get(self, venue_id):
+        availability = self._venues.get(venue_id)
+        if availability is not None and (
+                availability.origin != date.today() or
+                (self.max_age is not None and
+                 time.monotonic() - availability.loaded_at > self.max_age)):
+            del self._venues[venue_id]
+            availability = None
+        return availability
+
+    def free_rooms(self, venue_id, checkin, checkout, room_type=None,
+                   load=True):
+        """ Sorted ids of the free rooms, or None when the caller has to
+        ask the DB. A venue not loaded yet is loaded unless `load` is
+        False """
+        if in_transaction():
+            return None
+        with self._lock:
+            availability = self._get(venue_id)
+            if availability is None:
+                if not load:
+                    return None
+                availability = self._venues[venue_id] = self._load(venue_id)
+            if not availability.covers(checkin, checkout):
+                return None
+            return availability.free_rooms(checkin, checkout, room_type)
+
+    def warm(self, venue_ids):
+        """ Load the given venues that are not loaded yet """
+        for venue_id in venue_ids:
+            with self._lock:
+                if self._get(venue_id) is not None:
+                    self._loading.pop(venue_id, None)
+                    continue
+                self._loading[venue_id] = False
+            availability = None
+            try:
+                availability = self._load(venue_id)
+            finally:
+                with self._lock:
+                    changed = self._loading.pop(venue_id, True)
+                    if availability is not None and not changed:
+                        self._venues[venue_id] = availability
+
+    def warm_later(self, venue_ids):
+        """ Load the given venues in a background thread, for the next
+        requests """
+        if in_transaction():
+            return
+        with self._lock:
+            venue_ids = [venue_id for venue_id in venue_ids
+                         if venue_id not in self._loading]
+            if not venue_ids:
+                return
+            self._loading.update((venue_id, False) for venue_id in venue_ids)
+            self._warmer = threading.Thread(
+                target=self._warm_thread, args=(venue_ids,),
+                name='availability-warmer', daemon=True)
+            self._warmer.start()
+
+    def _warm_thread(self, venue_ids):
+        try:
+            self.warm(venue_ids)
+        finally:
+            connection.close()
+
+    def wait_warm(self, timeout=None):
+        """ Wait for the last warm_later() to finish """
+        warmer = self._warmer
+        if warmer is not None:
+            warmer.join(timeout)
+
+    def _changed(self, venue_ids):
+        for venue_id in venue_ids:
+            if venue_id in self._loading:
+                self._loading[venue_id] = True
+
+    def _holding(self, pk):
+        return [venue_id for venue_id, availability in self._venues.items()
+                if pk in availability.stays]
+
+    def _on_commit(self, venue_ids, patch):
+        """ Patch the loaded venues now, or once the open transaction
+        commits """
+        def committed():
+            with self._lock:
+                self._changed(venue_ids)
+                patch()
+        transaction.on_commit(committed)
+
+    def _add(self, pk, venue_id, room_id, checkin, checkout):
+        for holding in self._holding(pk):
+            self._venues[holding].discard_stay(pk)
+        availability = self._venues.get(venue_id)
+        if availability is not None:
+            availability.add_stay(pk, room_id, checkin, checkout)
+
+    def _discard(self, pk):
+        for holding in self._holding(pk):
+            self._venues[holding].discard_stay(pk)
+
+    def reservation_saved(self, instance):
+        stay = (instance.pk, instance.venue_id, instance.room_id,
+                instance.checkin, instance.checkout)
+        self._on_commit([instance.venue_id], lambda: self._add(*stay))
+
+    def reservations_created(self, reservations):
+        """ Reservations inserted in bulk, see core.bulk """
+        stays = [(r.pk, r.venue_id, r.room_id, r.checkin, r.checkout)
+                 for r in reservations]
+
+        def patch():
+            for stay in stays:
+                self._add(*stay)
+        self._on_commit(set(stay[1] for stay in stays), patch)
+
+    def reservation_deleted(self, instance):
+        pk = instance.pk
+        self._on_commit([instance.venue_id], lambda: self._discard(pk))
+
+    def room_changed(self, instance):
+        with self._lock:
+            self.invalidate_on_commit([venue_id for venue_id, availability
+                             in self._venues.items()
+                             if instance.pk in availability.room_types] +
+                            [instance.venue_id])
+
+    def invalidate(self, venue_ids=None):
+        """ Forget the given venues, or everything """
+        with self._lock:
+            if venue_ids is None:
+                self._venues.clear()
+                self._changed(list(self._loading))
+                return
+            venue_ids = list(venue_ids)
+            self._changed(venue_ids)
+            for venue_id in venue_ids:
+                self._venues.pop(venue_id, None)
+
+    def invalidate_on_commit(self, venue_ids):
+        """ Forget venues now and again once the transaction commits, in
+        case another thread reloaded them in between """
+        venue_ids = list(venue_ids)
+        self.invalidate(venue_ids)
+        transaction.on_commit(lambda: self.invalidate(venue_ids))
+
+
+availability_engine = AvailabilityEngine()
+
+
+def free_rooms_from_db(venue_id, checkin, checkout, room_type=None):
+    return venues_free_rooms_from_db([venue_id], checkin, checkout,
+                                     room_type)
+
+
+def venues_free_rooms_from_db(venue_ids, checkin, checkout, room_type=None):
+    """ Sorted ids of the free rooms of all the given venues, in one
+    query """
+    from .models import Calendar, Reservation, Room
+
+    rooms = Room.objects.filter(venue__id__in=venue_ids)
+    if room_type:
+        rooms = rooms.filter(room_type=room_type)
+    booked = Reservation.objects.filter(
+        venue__id__in=venue_ids, checkin__lt=checkout, checkout__gt=checkin)
+    booked_days = Calendar.objects.filter(
+        venue__id__in=venue_ids, day__gte=checkin, day__lt=checkout,
+        reservation__isnull=False)
+    rooms = rooms.exclude(pk__in=booked.values('room_id')) \
+        .exclude(pk__in=booked_days.values('room_id'))
+    return list(rooms.order_by('id').values_list('id', flat=True))
+
+
+def free_rooms(venue_id, checkin, checkout, room_type=None):
+    """ Ids of the rooms of a venue free for every night of the stay """
+    room_ids = availability_engine.free_rooms(venue_id, checkin, checkout,
+                                              room_type)
+    if room_ids is None:
+        room_ids = free_rooms_from_db(venue_id, checkin, checkout, room_type)
+    return room_ids
@@ -0,0 +1,98 @@
+""" Atomic night claims, used when settings.BOOKING_MODE is 'claim'.
+
+In 'check' mode, the default, Reservation.clean looks for an overlapping
+stay and save() inserts afterwards: two concurrent bookings of the same
+room can both pass the check and double-book it.
+
+In 'claim' mode the Calendar is the inventory. Reservation.save inserts the
+reservation and, in the same transaction, claims its nights with a single
+conditional UPDATE on the (venue, room, day) index:
+
+    UPDATE core_calendar SET reservation_id = <id>
+    WHERE venue_id = ... AND room_id = ... AND day >= checkin
+      AND day < checkout AND reservation_id IS NULL
+
+The database serializes competing UPDATEs on the rows themselves, so the
+row count is exact: when it is short of the number of nights, a night was
+taken or is not in the calendar, and the whole booking rolls back.
+"""
+from django.conf import settings
+from django.db.models import Q
+
+from rest_framework.exceptions import ValidationError
+
+from .calendar_store import sync_months
+from .models import Calendar
+from .versions import bump_calendar_days, stay_days
+
+CHECK, CLAIM = 'check', 'claim'
+
+UNAVAILABLE = {'error': 'Some nights are already booked or not open for '
+                        'booking.'}
+
+
+def claim_mode():
+    return getattr(settings, 'BOOKING_MODE', CHECK) == CLAIM
+
+
+def stay_nights(reservation):
+    """ Calendar entries of the nights of the stay """
+    return Calendar.objects.filter(
+        venue__id=reservation.venue_id, room__id=reservation.room_id,
+        day__gte=reservation.checkin, day__lt=reservation.checkout)
+
+
+def claim_nights(reservation, created):
+    """ Point the nights of the stay at the saved reservation, and release
+    the ones it held before a change of room or dates.
+
+    Raises ValidationError when a night is held by another reservation or
+    missing from the calendar. Must run in the transaction that saved the
+    reservation, for the caller to roll it back.
+    """
+    released_cells = []
+    if not created:
+        released = Calendar.objects.filter(reservation_id=reservation.pk) \
+            .exclude(room__id=reservation.room_id,
+                     day__gte=reservation.checkin,
+                     day__lt=reservation.checkout)
+        released_cells = list(released.values_list('room_id', 'day'))
+        released.update(reservation=None)
+    claimed = stay_nights(reservation).filter(
+        Q(reservation__isnull=True) | Q(reservation_id=reservation.pk)) \
+        .update(reservation_id=reservation.pk)
+    if claimed != (reservation.checkout - reservation.checkin).days:
+        raise ValidationError(UNAVAILABLE)
+    cells = released_cells + [
+        (reservation.room_id, day)
+        for day in stay_days(reservation.checkin, reservation.checkout)]
+    bump_calendar_days(day for _, day in cells)
+    sync_months(cells)
+
+
+def release_nights(reservations):
+    """ Free the nights held by `reservations`, a list of saved instances """
+    released = Calendar.objects.filter(
+        reservation_id__in=[r.pk for r in reservations])
+    cells = list(released.values_list('room_id', 'day'))
+    released.update(reservation=None)
+    bump_calendar_days(day for _, day in cells)
+    sync_months(cells)
+
+
+def claim_bulk(reservations):
+    """ Claim the nights of reservations inserted in bulk. Returns the ones
+    that could not claim every night; their claims are released. """
+    failed = []
+    for reservation in reservations:
+        claimed = stay_nights(reservation).filter(reservation__isnull=True) \
+            .update(reservation_id=reservation.pk)
+        if claimed != (reservation.checkout - reservation.checkin).days:
+            failed.append(reservation)
+    if failed:
+        release_nights(failed)
+    cells = [(r.room_id, day) for r in reservations if r not in failed
+             for day in stay_days(r.checkin, r.checkout)]
+    bump_calendar_days(day for _, day in cells)
+    sync_months(cells)
+    return failed
@@ -0,0 +1,258 @@
+""" Single-writer booking queue.
+
+With SQLite, concurrent requests writing reservations line up on the
+database write lock and fail with "database is locked" once they waited
+longer than the busy timeout. BookingQueue funnels the reservation writes
+of the API (ReservationList POST, ReservationDetail PUT and PATCH) through
+one writer thread per process, and the requests wait on a Future for their
+own outcome.
+
+The writer group-commits: it takes every booking queued while it was busy,
+up to BOOKING_QUEUE_MAX_BATCH, and writes them in one transaction. The
+creates of a batch go through core.bulk, with one overlap query and one
+insert for all of them. Each update is saved in its own savepoint, so a
+rejected one does not undo the others. Futures are resolved once the batch
+committed.
+
+A request gives up on its booking after BOOKING_QUEUE_TIMEOUT seconds and
+responds with a 503. Its job is cancelled first, and the writer drops the
+cancelled jobs it takes, so a booking reported as failed is never written
+later. A job the writer already took is waited for instead.
+
+Callers inside a transaction write inline: the writer thread could not see
+their uncommitted rows.
+
+The writer counts the queries of each batch and charges every booking of
+the batch its share. writer_queries() hands the share of the bookings a
+thread submitted to api.querycount, which adds it to the request.
+"""
+import itertools
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import close_old_connections, connections, transaction
+
+from rest_framework import status
+from rest_framework.exceptions import APIException, ValidationError
+
+from .bulk import BEST_EFFORT, CREATED, create_reservations
+from .interval_index import reservation_index
+from .utils import in_transaction
+
+CREATE, UPDATE = 'create', 'update'
+
+
+class BookingTimeout(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'The booking could not be written in time, try again.'
+    default_code = 'booking_timeout'
+
+
+class QueryCounter(object):
+    """ Counts the statements a batch runs on the writer thread """
+
+    def __init__(self):
+        self.count = 0
+        self.time = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.time += time.perf_counter() - start
+
+
+class BookingQueue(object):
+
+    def __init__(self):
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._thread = None
+        self._pid = None
+        self.batches = self.bookings = 0
+
+    @property
+    def enabled(self):
+        return getattr(settings, 'BOOKING_QUEUE_ENABLED', False)
+
+    @property
+    def max_batch(self):
+        return getattr(settings, 'BOOKING_QUEUE_MAX_BATCH', 64)
+
+    @property
+    def linger(self):
+        return getattr(settings, 'BOOKING_QUEUE_LINGER', 0)
+
+    @property
+    def timeout(self):
+        return getattr(settings, 'BOOKING_QUEUE_TIMEOUT', None)
+
+    def create(self, record):
+        """ Create a reservation from a core.bulk record. Returns it, or
+        raises ValidationError when it cannot be booked. """
+        return self._submit(CREATE, record)
+
+    def update(self, serializer):
+        """ Save a validated ReservationSerializer bound to a reservation """
+        return self._submit(UPDATE, serializer)
+
+    def _submit(self, kind, payload):
+        job = (kind, payload, Future())
+        if not self.enabled or in_transaction():
+            self._write([job])
+        else:
+            self._start()
+            self._queue.put(job)
+        future = job[2]
+        try:
+            return future.result(self.timeout)
+        except TimeoutError:
+            if future.cancel():
+                raise BookingTimeout()
+            # The writer has taken it meanwhile
+            return future.result()
+        finally:
+            count, seconds = getattr(future, 'writer_queries', (0, 0.0))
+            total = getattr(self._local, 'writer_queries', (0, 0.0))
+            self._local.writer_queries = (total[0] + count,
+                                          total[1] + seconds)
+
+    def writer_queries(self):
+        """ (count, seconds) of the queries the writer thread ran for the
+        bookings of this thread since the last call """
+        total = getattr(self._local, 'writer_queries', (0, 0.0))
+        self._local.writer_queries = (0, 0.0)
+        return total
+
+    def _start(self):
+        with self._lock:
+            if (self._pid == os.getpid() and self._thread is not None and
+                    self._thread.is_alive()):
+                return
+            if self._pid != os.getpid():
+                # Forked worker process, the writer of the parent is not
+                # running here
+                self._queue = queue.Queue()
+                self._pid = os.getpid()
+            self._thread = threading.Thread(
+                target=self._writer, name='booking-writer', daemon=True)
+            self._thread.start()
+
+    def _writer(self):
+        while True:
+            jobs = [self._queue.get()]
+            deadline = time.monotonic() + self.linger
+            while len(jobs) < self.max_batch:
+                try:
+                    jobs.append(self._queue.get(
+                        timeout=max(0, deadline - time.monotonic())))
+                except queue.Empty:
+                    break
+            # What request_started and request_finished do for the
+            # connection of a request, in this thread
+            close_old_connections()
+            counter = QueryCounter()
+            try:
+                with ExitStack() as stack:
+                    for connection in connections.all():
+                        stack.enter_context(
+                            connection.execute_wrapper(counter))
+                    self._write(jobs, counter)
+            finally:
+                close_old_connections()
+
+    def _write(self, jobs, counter=None):
+        """ Write the jobs in one transaction, then resolve their futures.
+        `counter` counts the queries when they run on the writer thread. """
+        # Drops the jobs their request gave up on
+        jobs = [job for job in jobs if job[2].set_running_or_notify_cancel()]
+        if not jobs:
+            return
+        for kind, serializer, _ in jobs:
+            if kind == UPDATE:
+                self._preload(serializer)
+        outcomes = []
+        try:
+            with transaction.atomic():
+                for kind, run in itertools.groupby(jobs, lambda j: j[0]):
+                    run = list(run)
+                    if kind == CREATE:
+                        outcomes.extend(self._create(run))
+                    else:
+                        outcomes.extend(self._update(job) for job in run)
+        except Exception as e:
+            self._charge(jobs, counter)
+            for _, _, future in jobs:
+                future.set_exception(e)
+            return
+        with self._lock:
+            self.batches += 1
+            self.bookings += len(jobs)
+        self._charge(jobs, counter)
+        for future, result, error in outcomes:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+    def _charge(self, jobs, counter):
+        # Each booking is charged its share of the batch, before its request
+        # is woken up
+        if counter is None:
+            return
+        share = (-(-counter.count // len(jobs)), counter.time / len(jobs))
+        for _, _, future in jobs:
+            future.writer_queries = share
+
+    def _create(self, jobs):
+        try:
+            with transaction.atomic():
+                results = create_reservations([j[1] for j in jobs],
+                                              BEST_EFFORT)
+        except Exception as e:
+            return [(future, None, e) for _, _, future in jobs]
+        outcomes = []
+        for (_, _, future), result in zip(jobs, results):
+            if result.status == CREATED:
+                outcomes.append((future, result.reservation, None))
+            else:
+                outcomes.append((future, None, ValidationError(
+                    result.errors)))
+        return outcomes
+
+    def _preload(self, serializer):
+        # The overlap check of Reservation.save runs inside the batch
+        # transaction, the rooms it needs are loaded into the index before
+        instance = getattr(serializer, 'instance', None)
+        if instance is None:
+            return
+        data = serializer.validated_data
+        reservation_index.preload(data.get('venue_id', instance.venue_id),
+                                  data.get('room_id', instance.room_id))
+
+    def _update(self, job):
+        _, serializer, future = job
+        try:
+            with transaction.atomic():
+                return future, serializer.save(), None
+        except Exception as e:
+            return future, None, e
+
+    def stats(self):
+        with self._lock:
+            return {'batches': self.batches, 'bookings': self.bookings}
+
+    def reset_stats(self):
+        with self._lock:
+            self.batches = self.bookings = 0
+
+
+booking_queue = BookingQueue()
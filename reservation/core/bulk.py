@@ -0,0 +1,197 @@
+""" Bulk reservation creation with a single batched conflict check.
+
+Foreign keys are resolved with one query per model, amounts are checked
+against the calendar prices with one query, overlaps are checked against
+the database with one query and against the rest of the batch in memory,
+and the accepted reservations are written with bulk_create.
+"""
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+
+from .booking import UNAVAILABLE, claim_bulk, claim_mode
+from .calendar_store import from_cents, to_cents
+from .interval_index import RoomIntervals
+from .models import Calendar, Guest, Reservation, Room, Venue
+from .quotes import RoomPrices
+from .signals import reservations_created
+
+ATOMIC, BEST_EFFORT = 'atomic', 'best_effort'
+MODES = (ATOMIC, BEST_EFFORT)
+
+CREATED, ERROR, SKIPPED = 'created', 'error', 'skipped'
+
+
+class BulkResult(object):
+    """ Outcome of one item of a bulk request """
+
+    def __init__(self, index, record):
+        self.index = index
+        self.record = record
+        self.status = None
+        self.errors = None
+        self.reservation = None
+
+    def fail(self, errors):
+        self.status = ERROR
+        self.errors = errors
+
+
+def _resolve(results):
+    """ Attach venue, guest and room to every record, one query per model """
+    pending = [r for r in results if r.status is None]
+    venues = Venue.objects.in_bulk(set(r.record['venue_id'] for r in pending))
+    guests = Guest.objects.in_bulk(set(r.record['guest_id'] for r in pending))
+    rooms = Room.objects.in_bulk(set(r.record['room_id'] for r in pending))
+    for result in pending:
+        record = result.record
+        venue = venues.get(record['venue_id'])
+        guest = guests.get(record['guest_id'])
+        room = rooms.get(record['room_id'])
+        if venue is None:
+            result.fail({'venue_id': 'Venue does not exist.'})
+        elif guest is None:
+            result.fail({'guest_id': 'Guest does not exist.'})
+        elif room is None or room.venue_id != venue.id:
+            result.fail({'room_id': 'Room does not exist in this venue.'})
+        elif record['checkin'] >= record['checkout']:
+            result.fail({'error': 'checkin date should be less than '
+                                  'checkout date.'})
+        else:
+            result.reservation = Reservation(
+                venue=venue, guest=guest, room=room,
+                amount=record.get('amount'), checkin=record['checkin'],
+                checkout=record['checkout'],
+                state=record.get('state', Reservation.FUTURE))
+
+
+def _check_amounts(results):
+    """ Give every item without an amount the price of its nights and reject
+    a different one, as ReservationSerializer does for a single booking,
+    with a single query on the Calendar rows """
+    pending = [r for r in results if r.status is None]
+    if not pending:
+        return
+    days = defaultdict(dict)
+    if getattr(settings, 'QUOTE_CHECK_AMOUNT', False):
+        rows = Calendar.objects.filter(
+            room_id__in=set(r.reservation.room_id for r in pending),
+            day__gte=min(r.reservation.checkin for r in pending),
+            day__lt=max(r.reservation.checkout for r in pending))
+        for room_id, day, price in rows.order_by().values_list(
+                'room_id', 'day', 'price'):
+            days[room_id][day] = to_cents(price)
+    rooms = {}
+    for result in pending:
+        reservation = result.reservation
+        if reservation.room_id not in rooms:
+            rooms[reservation.room_id] = RoomPrices(days[reservation.room_id])
+        cents = rooms[reservation.room_id].quote(reservation.checkin,
+                                                 reservation.checkout)
+        if cents is None:
+            if reservation.amount is None:
+                result.fail({'amount': 'This field is required.'})
+        elif reservation.amount is None:
+            reservation.amount = from_cents(cents)
+        elif to_cents(reservation.amount) != cents:
+            result.fail({'amount': 'Expected %s, the price of the stay.' %
+                                   from_cents(cents)})
+
+
+def _check_overlaps(results):
+    """ Reject items overlapping an existing reservation or an earlier item
+    of the same batch, with a single query """
+    pending = [r for r in results if r.status is None]
+    if not pending:
+        return
+    stays = defaultdict(list)
+    existing = Reservation.objects.filter(
+        room_id__in=set(r.reservation.room_id for r in pending),
+        checkin__lt=max(r.reservation.checkout for r in pending),
+        checkout__gt=min(r.reservation.checkin for r in pending))
+    for venue_id, room_id, checkin, checkout, pk in existing.values_list(
+            'venue_id', 'room_id', 'checkin', 'checkout', 'pk'):
+        stays[(venue_id, room_id)].append((checkin, checkout, pk))
+    rooms = {}
+    for result in pending:
+        reservation = result.reservation
+        key = (reservation.venue_id, reservation.room_id)
+        if key not in rooms:
+            rooms[key] = RoomIntervals(stays[key])
+        if rooms[key].overlaps(reservation.checkin, reservation.checkout):
+            result.fail({'error': 'There is an existing reservation '
+                                  'for this Room'})
+        else:
+            # Negative keys never clash with a database id
+            rooms[key].add(-result.index - 1, reservation.checkin,
+                           reservation.checkout)
+
+
+def _insert(accepted, batch_size):
+    reservations = [r.reservation for r in accepted]
+    Reservation.objects.bulk_create(reservations, batch_size=batch_size)
+    if reservations and reservations[0].pk is None:
+        # The backend does not return ids from bulk inserts. Stays of a room
+        # never overlap, so (venue, room, checkin) identifies each of them.
+        created = Reservation.objects.filter(
+            room_id__in=set(r.room_id for r in reservations),
+            checkin__in=set(r.checkin for r in reservations))
+        ids = dict(((venue_id, room_id, checkin), pk)
+                   for venue_id, room_id, checkin, pk in created.values_list(
+                       'venue_id', 'room_id', 'checkin', 'pk'))
+        for reservation in reservations:
+            reservation.pk = ids[(reservation.venue_id, reservation.room_id,
+                                  reservation.checkin)]
+    for result in accepted:
+        result.status = CREATED
+    reservations_created.send(sender=Reservation, reservations=reservations)
+
+
+def _claim(accepted, mode):
+    """ Claim the Calendar nights of the inserted reservations, see
+    core.booking """
+    failed = set(r.pk for r in claim_bulk([r.reservation for r in accepted]))
+    if not failed:
+        return
+    for result in accepted:
+        if result.reservation.pk in failed:
+            result.fail(UNAVAILABLE)
+            result.reservation = None
+        elif mode == ATOMIC:
+            result.status = SKIPPED
+            result.reservation = None
+    if mode == ATOMIC:
+        transaction.set_rollback(True)
+    else:
+        Reservation.objects.filter(pk__in=failed).delete()
+
+
+def create_reservations(records, mode=ATOMIC, errors=None, batch_size=500):
+    """ Create reservations from a list of dicts with venue_id, guest_id,
+    room_id, amount, state, checkin and checkout.
+
+    `errors` maps item indexes to validation errors found by the caller.
+    In ATOMIC mode nothing is written when any item fails and the other
+    items are reported as SKIPPED; in BEST_EFFORT mode every valid item is
+    created. Returns one BulkResult per record, in order.
+    """
+    errors = errors or {}
+    results = [BulkResult(i, record) for i, record in enumerate(records)]
+    for result in results:
+        if result.index in errors:
+            result.fail(errors[result.index])
+    with transaction.atomic():
+        _resolve(results)
+        _check_amounts(results)
+        _check_overlaps(results)
+        accepted = [r for r in results if r.status is None]
+        if mode == ATOMIC and len(accepted) != len(results):
+            for result in accepted:
+                result.status = SKIPPED
+                result.reservation = None
+            return results
+        _insert(accepted, batch_size)
+        if claim_mode():
+            _claim(accepted, mode)
+    return results
@@ -0,0 +1,249 @@
+""" Incremental Calendar materialization.
+
+Rooms are streamed venue by venue, so memory holds one venue's horizon at a
+time. Missing days are inserted in bounded batches and days whose
+reservation changed are updated; prices of existing days are left to the
+pricing job.
+
+Inserts go through executemany with values adapted once per day instead of
+bulk_create: building a model instance per row costs more than the INSERT
+itself at millions of rows.
+
+With workers > 1 the venues are split in partitions built by a process
+pool, each worker writing its own venues in its own transactions. The
+calendar is the same as the one built by a single process, only the row
+ids differ.
+"""
+import random
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import timedelta
+from itertools import groupby
+
+import django
+from django.apps import apps
+from django.db import OperationalError, connection, connections, transaction
+
+from .calendar_store import sync_months
+from .models import Calendar, Reservation, Room
+from .signals import calendar_prices_changed
+from .versions import bump_calendar_days
+
+DEFAULT_PRICE = 100
+
+
+class BuildStats(object):
+
+    def __init__(self):
+        self.venues = 0
+        self.created = 0
+        self.updated = 0
+        self.unchanged = 0
+
+    def __str__(self):
+        return ('%d venues: %d days created, %d updated, %d unchanged' %
+                (self.venues, self.created, self.updated, self.unchanged))
+
+    def merge(self, other):
+        self.venues += other.venues
+        self.created += other.created
+        self.updated += other.updated
+        self.unchanged += other.unchanged
+
+
+class CalendarWriter(object):
+    """ Buffered INSERT of (room_id, venue_id, day, price, reservation_id)
+    rows into the Calendar table """
+    columns = ('room', 'venue', 'day', 'price', 'reservation')
+
+    def __init__(self, price, batch_size):
+        opts = Calendar._meta
+        qn = connection.ops.quote_name
+        self.sql = 'INSERT INTO %s (%s) VALUES (%s)' % (
+            qn(opts.db_table),
+            ', '.join(qn(opts.get_field(c).column) for c in self.columns),
+            ', '.join(['%s'] * len(self.columns)))
+        price_field = opts.get_field('price')
+        self.price = price_field.get_db_prep_save(price, connection)
+        self.day_field = opts.get_field('day')
+        self.days = {}
+        self.batch_size = batch_size
+        self.rows = []
+        self.written = 0
+
+    def add(self, room_id, venue_id, day, reservation_id):
+        value = self.days.get(day)
+        if value is None:
+            value = self.days[day] = self.day_field.get_db_prep_save(
+                day, connection)
+        self.rows.append((room_id, venue_id, value, self.price,
+                          reservation_id))
+        if len(self.rows) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if self.rows:
+            with connection.cursor() as cursor:
+                cursor.executemany(self.sql, self.rows)
+            self.written += len(self.rows)
+            self.rows = []
+
+
+def _booked_days(venue_id, start, end):
+    """ (room_id, day) -> reservation id for the nights of the venue """
+    booked = {}
+    reservations = Reservation.objects.filter(
+        venue__id=venue_id, checkin__lte=end, checkout__gt=start)
+    for pk, room_id, checkin, checkout in reservations.values_list(
+            'id', 'room_id', 'checkin', 'checkout'):
+        day = max(checkin, start)
+        while day < checkout and day <= end:
+            booked[(room_id, day)] = pk
+            day += timedelta(days=1)
+    return booked
+
+
+def _plan_venue(venue_id, room_ids, start, end, stats):
+    """ Days to create as (room_id, day, reservation_id), Calendar ids to
+    update by reservation id, and the (room_id, day) cells they touch """
+    booked = _booked_days(venue_id, start, end)
+    existing = Calendar.objects.filter(venue__id=venue_id, day__gte=start,
+                                       day__lte=end)
+    current = dict(((room_id, day), (pk, reservation_id))
+                   for pk, room_id, day, reservation_id in existing
+                   .values_list('id', 'room_id', 'day', 'reservation_id')
+                   .iterator())
+    missing = []
+    updates = defaultdict(list)
+    changed = []
+    for room_id in room_ids:
+        day = start
+        while day <= end:
+            reservation_id = booked.get((room_id, day))
+            row = current.get((room_id, day))
+            if row is None:
+                missing.append((room_id, day, reservation_id))
+                changed.append((room_id, day))
+            elif row[1] != reservation_id:
+                updates[reservation_id].append(row[0])
+                changed.append((room_id, day))
+            else:
+                stats.unchanged += 1
+            day += timedelta(days=1)
+    return missing, updates, changed
+
+
+def _write_venue(venue_id, plan, price, batch_size, stats):
+    missing, updates, changed = plan
+    writer = CalendarWriter(price, batch_size)
+    for room_id, day, reservation_id in missing:
+        writer.add(room_id, venue_id, day, reservation_id)
+    writer.flush()
+    stats.created += writer.written
+    if missing:
+        calendar_prices_changed.send(
+            sender=Calendar,
+            rooms=set((venue_id, room_id) for room_id, _, _ in missing))
+    # A reservation spans consecutive days, so grouping by it keeps the
+    # number of UPDATE statements small
+    for reservation_id, ids in updates.items():
+        for i in range(0, len(ids), batch_size):
+            Calendar.objects.filter(id__in=ids[i:i + batch_size]) \
+                .update(reservation_id=reservation_id)
+        stats.updated += len(ids)
+    bump_calendar_days(day for _, day in changed)
+    sync_months(changed)
+
+
+def _build_venue(venue_id, room_ids, start, end, price, batch_size, stats):
+    plan = _plan_venue(venue_id, room_ids, start, end, stats)
+    _write_venue(venue_id, plan, price, batch_size, stats)
+
+
+def _build_partition(venues, start, end, price, batch_size, retries=10):
+    """ Build the calendar of [(venue_id, room_ids)] in a worker process.
+
+    The days of a venue are read outside of its transaction, which only
+    writes: with SQLite, a transaction that read cannot get the write lock
+    while another worker holds it and fails at once instead of waiting.
+    Partitions hold distinct venues, so no other worker changes them.
+    """
+    stats = BuildStats()
+    for venue_id, room_ids in venues:
+        venue_stats = BuildStats()
+        plan = _plan_venue(venue_id, room_ids, start, end, venue_stats)
+        for attempt in range(retries):
+            written = BuildStats()
+            try:
+                with transaction.atomic():
+                    _write_venue(venue_id, plan, price, batch_size, written)
+                break
+            except OperationalError as e:
+                # Waited longer than the busy timeout of the connection
+                if 'locked' not in str(e) or attempt == retries - 1:
+                    raise
+                time.sleep(random.uniform(0.01, 0.1) * (attempt + 1))
+        venue_stats.merge(written)
+        venue_stats.venues = 1
+        stats.merge(venue_stats)
+    return stats
+
+
+def _in_memory():
+    return (connection.vendor == 'sqlite' and
+            connection.is_in_memory_db())
+
+
+def _init_worker():
+    # Forked workers have the project set up, spawned ones do not
+    if not apps.ready:
+        django.setup()
+
+
+def _build_parallel(rooms, start, end, price, batch_size, workers,
+                    progress):
+    venues = [(venue_id, [room_id for _, room_id in group])
+              for venue_id, group in groupby(rooms, lambda room: room[0])]
+    # A few partitions per worker, to spread big and small venues
+    size = max(1, len(venues) // (workers * 8))
+    stats = BuildStats()
+    # A connection must not be shared with the forked workers
+    connections.close_all()
+    with ProcessPoolExecutor(workers, initializer=_init_worker) as pool:
+        futures = [pool.submit(_build_partition, venues[i:i + size], start,
+                               end, price, batch_size)
+                   for i in range(0, len(venues), size)]
+        for future in as_completed(futures):
+            stats.merge(future.result())
+            if progress is not None:
+                progress(stats)
+    return stats
+
+
+def build_calendar(start, end, venue_ids=None, price=DEFAULT_PRICE,
+                   batch_size=1000, progress=None, workers=1):
+    """ Make sure every room has a Calendar day from start to end (both
+    inclusive) that points at the reservation booking it.
+
+    `workers` > 1 builds the venues in that many processes, unless the
+    database lives in this process' memory. `progress`, when given, is
+    called with the BuildStats after each venue, or each partition of
+    venues of a parallel build.
+    """
+    stats = BuildStats()
+    rooms = Room.objects.order_by('venue_id', 'id')
+    if venue_ids:
+        rooms = rooms.filter(venue__id__in=venue_ids)
+    rooms = rooms.values_list('venue_id', 'id')
+    if workers > 1 and not _in_memory():
+        return _build_parallel(list(rooms), start, end, price, batch_size,
+                               workers, progress)
+    for venue_id, group in groupby(rooms.iterator(), lambda room: room[0]):
+        with transaction.atomic():
+            _build_venue(venue_id, [room_id for _, room_id in group],
+                         start, end, price, batch_size, stats)
+        stats.venues += 1
+        if progress is not None:
+            progress(stats)
+    return stats
@@ -0,0 +1,78 @@
+""" Room x day calendar matrix of a venue.
+
+Two queries whatever the range: the rooms, then the Calendar entries of the
+venue and day range, with a fixed number of parameters however many rooms
+the venue has. Entries of rooms filtered out by room_type are skipped while
+the matrix is filled in Python; the per-day aggregates come out of the same
+pass.
+"""
+from datetime import timedelta
+
+from .calendar_store import compact_rows, compact_storage
+from .models import Calendar, Room
+
+
+def calendar_matrix(venue_id, start, end, room_type=None, aggregates=False):
+    """ Prices and booked flags of every room of the venue, from start to
+    end (both inclusive).
+
+    Days without a Calendar entry have a null price and booked flag. With
+    `aggregates`, adds per day the cheapest free room, the number of free
+    rooms and the occupancy of the rooms that have an entry.
+    """
+    days = [start + timedelta(days=i) for i in range((end - start).days + 1)]
+    rooms = Room.objects.filter(venue__id=venue_id).order_by('id')
+    if room_type:
+        rooms = rooms.filter(room_type=room_type)
+    rooms = list(rooms.values_list('id', 'room_number', 'room_type'))
+    room_ids = [room[0] for room in rooms]
+
+    position = dict((room_id, i) for i, room_id in enumerate(room_ids))
+    prices = [[None] * len(days) for _ in rooms]
+    booked = [[None] * len(days) for _ in rooms]
+    if room_ids:
+        if compact_storage():
+            entries = ((room_id, day, price, reservation_id)
+                       for _, room_id, _, day, price, reservation_id
+                       in compact_rows(start, end, venue_id))
+        else:
+            entries = Calendar.objects.filter(
+                venue__id=venue_id, day__gte=start, day__lte=end) \
+                .order_by().values_list('room_id', 'day', 'price',
+                                        'reservation_id')
+        for room_id, day, price, reservation_id in entries:
+            row = position.get(room_id)
+            if row is None:
+                continue
+            column = (day - start).days
+            prices[row][column] = price
+            booked[row][column] = reservation_id is not None
+
+    data = {
+        'venue_id': venue_id,
+        'from': start,
+        'to': end,
+        'days': days,
+        'rooms': [{'id': room_id, 'room_number': room_number,
+                   'room_type': room_type, 'prices': prices[i],
+                   'booked': booked[i]}
+                  for i, (room_id, room_number, room_type) in enumerate(rooms)],
+    }
+    if aggregates:
+        data['aggregates'] = day_aggregates(prices, booked, len(days))
+    return data
+
+
+def day_aggregates(prices, booked, days):
+    min_price, free_rooms, occupancy = [], [], []
+    for column in range(days):
+        free = [row_prices[column]
+                for row_prices, row_booked in zip(prices, booked)
+                if row_booked[column] is False]
+        taken = sum(1 for row_booked in booked if row_booked[column])
+        min_price.append(min(free) if free else None)
+        free_rooms.append(len(free))
+        total = len(free) + taken
+        occupancy.append(round(taken / total, 4) if total else None)
+    return {'min_price': min_price, 'free_rooms': free_rooms,
+            'occupancy': occupancy}
@@ -0,0 +1,309 @@
+""" Compact Calendar storage: packing and the read layer.
+
+CalendarMonth keeps one record per room per month with the daily prices and
+reservation ids packed into int64 arrays. CompactCalendar exposes those
+records as Calendar instances, so CalendarSerializer and the paginated list
+endpoints work unchanged on top of either storage.
+
+The Calendar rows stay the storage that gets written: bookings claim
+nights on them, the builder and the pricing job update them. With
+CALENDAR_STORAGE = 'compact', every writer also rewrites the month records
+of the (room, day) cells it touched through sync_months, in its own
+transaction, so the months never lag behind the rows. compact_calendar
+builds all the records once, when switching to compact storage.
+"""
+import sys
+from array import array
+from calendar import monthrange
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+from itertools import groupby
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import F, Sum, Window
+
+from .models import Calendar, CalendarMonth
+from .versions import bump_calendar_days, month_days
+
+NO_PRICE = -1
+# Day entries get ids derived from their month record: id * 32 + day
+ID_STRIDE = 32
+
+
+def compact_storage():
+    return getattr(settings, 'CALENDAR_STORAGE', 'rows') == 'compact'
+
+
+def pack(values):
+    data = array('q', values)
+    if sys.byteorder == 'big':
+        data.byteswap()
+    return data.tobytes()
+
+
+def unpack(blob):
+    data = array('q')
+    data.frombytes(bytes(blob))
+    if sys.byteorder == 'big':
+        data.byteswap()
+    return data
+
+
+def to_cents(price):
+    return int((Decimal(price) * 100).to_integral_value())
+
+
+def from_cents(cents):
+    return Decimal(cents).scaleb(-2)
+
+
+def pack_month(venue_id, room_id, month, rows):
+    """ Build a CalendarMonth from (day, price, reservation_id) rows """
+    days = monthrange(month.year, month.month)[1]
+    prices = [NO_PRICE] * days
+    reservations = [0] * days
+    for day, price, reservation_id in rows:
+        prices[day.day - 1] = to_cents(price)
+        reservations[day.day - 1] = reservation_id or 0
+    return CalendarMonth(venue_id=venue_id, room_id=room_id, month=month,
+                         prices=pack(prices), reservations=pack(reservations),
+                         entries=days - prices.count(NO_PRICE))
+
+
+def unpack_month(record, day=None):
+    """ Calendar instances for the days of a month record that have an entry,
+    or only for `day` when given """
+    prices = unpack(record.prices)
+    reservations = unpack(record.reservations)
+    if day is None:
+        indexes = range(len(prices))
+    else:
+        indexes = [day.day - 1]
+    entries = []
+    for i in indexes:
+        if prices[i] == NO_PRICE:
+            continue
+        entries.append(Calendar(
+            id=record.id * ID_STRIDE + i + 1, room_id=record.room_id,
+            venue_id=record.venue_id, day=record.month + timedelta(days=i),
+            price=from_cents(prices[i]),
+            reservation_id=reservations[i] or None))
+    return entries
+
+
+def compact_rows(start=None, end=None, venue_id=None, room_ids=None,
+                 chunk_size=1000):
+    """ (id, room_id, venue_id, day, price, reservation_id) of every entry
+    from start to end (both inclusive), streamed month record by month
+    record without building Calendar instances """
+    queryset = CalendarMonth.objects.order_by('id')
+    if venue_id is not None:
+        queryset = queryset.filter(venue__id=venue_id)
+    if room_ids is not None:
+        queryset = queryset.filter(room__id__in=room_ids)
+    if start is not None:
+        queryset = queryset.filter(month__gte=start.replace(day=1))
+    if end is not None:
+        queryset = queryset.filter(month__lte=end)
+    for record in queryset.iterator(chunk_size=chunk_size):
+        reservations = unpack(record.reservations)
+        for i, cents in enumerate(unpack(record.prices)):
+            day = record.month + timedelta(days=i)
+            if cents == NO_PRICE or (start is not None and day < start) or \
+                    (end is not None and day > end):
+                continue
+            yield (record.id * ID_STRIDE + i + 1, record.room_id,
+                   record.venue_id, day, from_cents(cents),
+                   reservations[i] or None)
+
+
+def sync_months(cells, batch_size=500):
+    """ Rewrite, from the Calendar rows, the CalendarMonth records holding
+    the given (room_id, day) cells. No-op unless compact storage is on.
+
+    Records keep their id, so the ids of the entries served from them do
+    not change. Must run in the transaction that wrote the rows.
+    """
+    if not compact_storage():
+        return
+    rooms_by_month = defaultdict(set)
+    for room_id, day in cells:
+        rooms_by_month[day.replace(day=1)].add(room_id)
+    for month, room_ids in sorted(rooms_by_month.items()):
+        room_ids = sorted(room_ids)
+        end = month + timedelta(days=monthrange(month.year, month.month)[1])
+        for i in range(0, len(room_ids), batch_size):
+            _sync_month(month, end, room_ids[i:i + batch_size])
+
+
+def _sync_month(month, end, room_ids):
+    rows = defaultdict(list)
+    venues = {}
+    for venue_id, room_id, day, price, reservation_id in (
+            Calendar.objects.filter(room__id__in=room_ids, day__gte=month,
+                                    day__lt=end)
+            .order_by().values_list('venue_id', 'room_id', 'day', 'price',
+                                    'reservation_id')):
+        venues[room_id] = venue_id
+        rows[room_id].append((day, price, reservation_id))
+    records = dict((record.room_id, record) for record in
+                   CalendarMonth.objects.filter(room__id__in=room_ids,
+                                                month=month))
+    created, updated, emptied = [], [], []
+    for room_id in room_ids:
+        record = records.get(room_id)
+        if room_id not in rows:
+            if record is not None:
+                emptied.append(record.id)
+            continue
+        packed = pack_month(venues[room_id], room_id, month, rows[room_id])
+        if record is None:
+            created.append(packed)
+        else:
+            packed.id = record.id
+            updated.append(packed)
+    CalendarMonth.objects.bulk_create(created)
+    CalendarMonth.objects.bulk_update(
+        updated, ['venue', 'prices', 'reservations', 'entries'])
+    CalendarMonth.objects.filter(id__in=emptied).delete()
+
+
+def compact_calendar(batch_size=1000):
+    """ Rebuild CalendarMonth from the Calendar rows, returns the number of
+    month records written. Writers keep the records in sync afterwards
+    (sync_months). """
+    # Imported here, core.signals needs this module through core.quotes
+    from .signals import calendar_prices_changed
+
+    rows = (Calendar.objects
+            .order_by('venue_id', 'room_id', 'day')
+            .values_list('venue_id', 'room_id', 'day', 'price',
+                         'reservation_id')
+            .iterator(chunk_size=batch_size))
+
+    def month_key(row):
+        return row[0], row[1], row[2].replace(day=1)
+
+    written = 0
+    rooms = set()
+    with transaction.atomic():
+        # Entry ids are derived from the record ids, so every day served
+        # before or after the rebuild changes
+        months = set(CalendarMonth.objects.values_list('month', flat=True)
+                     .distinct())
+        CalendarMonth.objects.all().delete()
+        batch = []
+        for (venue_id, room_id, month), group in groupby(rows, month_key):
+            months.add(month)
+            rooms.add((venue_id, room_id))
+            batch.append(pack_month(venue_id, room_id, month,
+                                    (row[2:] for row in group)))
+            if len(batch) >= batch_size:
+                CalendarMonth.objects.bulk_create(batch)
+                written += len(batch)
+                batch = []
+        CalendarMonth.objects.bulk_create(batch)
+        written += len(batch)
+        bump_calendar_days(day for month in months
+                           for day in month_days(month))
+        calendar_prices_changed.send(sender=CalendarMonth, rooms=rooms)
+    return written
+
+
+class CompactCalendar(object):
+    """ Sliceable, countable sequence of Calendar instances read from
+    CalendarMonth, good enough for Django's Paginator.
+
+    Entries are ordered by month record id and then by day, which is also
+    the order of their ids: seek() reads the entries after a given id, for
+    keyset pagination (see api.pagination).
+    """
+    model = Calendar
+    keyset_ordering = ('id',)
+
+    def __init__(self, day=None, queryset=None):
+        if queryset is None:
+            queryset = CalendarMonth.objects.all()
+        self.day = day
+        if day is not None:
+            queryset = queryset.filter(month=day.replace(day=1))
+        self.queryset = queryset.order_by('id')
+        self._count = None
+        self._day_entries = None
+
+    def _entries_for_day(self):
+        # One blob per room for a single day, unpack them all once
+        if self._day_entries is None:
+            self._day_entries = [
+                entry for record in self.queryset
+                for entry in unpack_month(record, self.day)]
+        return self._day_entries
+
+    def count(self):
+        if self._count is None:
+            if self.day is not None:
+                self._count = len(self._entries_for_day())
+            else:
+                total = self.queryset.aggregate(total=Sum('entries'))
+                self._count = total['total'] or 0
+        return self._count
+
+    def __len__(self):
+        return self.count()
+
+    def __iter__(self):
+        if self.day is not None:
+            return iter(self._entries_for_day())
+        return (entry for record in self.queryset.iterator()
+                for entry in unpack_month(record))
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self[index:index + 1][0]
+        if self.day is not None:
+            return self._entries_for_day()[index]
+        start, stop, step = index.indices(self.count())
+        if start >= stop:
+            return []
+        first_id, skip = self._locate(start)
+        if first_id is None:
+            return []
+        # Every record holds one entry at least
+        result = []
+        records = self.queryset.filter(id__gte=first_id)[:stop - start]
+        for record in records:
+            result.extend(unpack_month(record))
+        return result[skip:skip + stop - start:step]
+
+    def _locate(self, start):
+        """ (record id, entries to skip in it) of the entry at `start`,
+        found by the database from the running total of the entry counts """
+        running = self.queryset.annotate(total=Window(
+            Sum('entries'), order_by=F('id').asc())).values_list(
+            'id', 'entries', 'total')
+        sql, params = running.query.sql_with_params()
+        with connections[running.db].cursor() as cursor:
+            cursor.execute('SELECT * FROM (%s) WHERE total > %%s '
+                           'ORDER BY id LIMIT 1' % sql, params + (start,))
+            row = cursor.fetchone()
+        if row is None:
+            return None, 0
+        record_id, entries, total = row
+        return record_id, start - (total - entries)
+
+    def seek(self, after, limit):
+        """ Up to `limit` entries with an id above `after`, an entry id or
+        None for the first ones """
+        queryset = self.queryset
+        if after is not None:
+            queryset = queryset.filter(id__gte=after // ID_STRIDE)
+        result = []
+        # Every record holds one entry at least
+        for record in queryset[:limit + 1]:
+            result.extend(entry for entry in unpack_month(record, self.day)
+                          if after is None or entry.id > after)
+            if len(result) >= limit:
+                break
+        return result[:limit]
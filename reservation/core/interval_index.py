@@ -0,0 +1,251 @@
+import threading
+import time
+from bisect import bisect_left
+
+from django.conf import settings
+from django.db import transaction
+
+from .routers import primary
+from .utils import in_transaction
+
+
+class RoomIntervals(object):
+    """ Stays of a single room kept as parallel lists sorted by checkin.
+
+    Stays of a room never overlap (Reservation.clean guarantees it), so
+    sorting by checkin also sorts by checkout. A conflicting stay can only
+    be the last one starting before the new checkout, or the one before it
+    when that stay is the reservation being modified.
+    """
+
+    def __init__(self, stays=()):
+        self.starts = []
+        self.ends = []
+        self.pks = []
+        self.checkins = {}
+        for checkin, checkout, pk in sorted(stays):
+            self.starts.append(checkin)
+            self.ends.append(checkout)
+            self.pks.append(pk)
+            self.checkins[pk] = checkin
+        self.loaded_at = time.monotonic()
+
+    def __len__(self):
+        return len(self.pks)
+
+    def add(self, pk, checkin, checkout):
+        self.discard(pk)
+        i = bisect_left(self.starts, checkin)
+        self.starts.insert(i, checkin)
+        self.ends.insert(i, checkout)
+        self.pks.insert(i, pk)
+        self.checkins[pk] = checkin
+
+    def discard(self, pk):
+        checkin = self.checkins.pop(pk, None)
+        if checkin is None:
+            return
+        i = bisect_left(self.starts, checkin)
+        while self.pks[i] != pk:
+            i += 1
+        del self.starts[i], self.ends[i], self.pks[i]
+
+    def overlaps(self, checkin, checkout, exclude=None):
+        # Guest 1 can check-out and Guest 2 can check-in on the same day, so
+        # two stays overlap when each one starts before the other ends.
+        i = bisect_left(self.starts, checkout) - 1
+        while i >= 0 and self.ends[i] > checkin:
+            if self.pks[i] != exclude:
+                return True
+            i -= 1
+        return False
+
+    def stays(self):
+        return list(zip(self.starts, self.ends, self.pks))
+
+
+class ReservationIndex(object):
+    """ Per-process interval index of reservations, keyed by (venue, room).
+
+    Rooms are loaded outside of any transaction, by Reservation.save right
+    before it opens its own (preload) or on their first overlap check, and
+    then kept in sync by the Reservation signals (see core.signals). A write
+    made inside a transaction is patched in once it commits; until then the
+    room is not answered for in the writing thread, which falls back to the
+    database that sees its own uncommitted rows.
+
+    Bookings made by other worker processes are not seen until the room is
+    reloaded (RESERVATION_INDEX_MAX_AGE), so a found overlap is final but
+    "no overlap" is not: Reservation.clean confirms it with the database.
+    """
+
+    def __init__(self):
+        self._rooms = {}
+        self._owners = {}
+        self._lock = threading.RLock()
+        # Rooms written by the open transaction of each thread
+        self._local = threading.local()
+
+    @property
+    def enabled(self):
+        return getattr(settings, 'RESERVATION_INDEX_ENABLED', True)
+
+    @property
+    def max_age(self):
+        return getattr(settings, 'RESERVATION_INDEX_MAX_AGE', None)
+
+    def _query(self, venue_id, room_id):
+        from .models import Reservation
+        return (Reservation.objects
+                .filter(venue__id=venue_id, room__id=room_id)
+                .values_list('checkin', 'checkout', 'pk'))
+
+    def _load(self, key):
+        # Shared by the whole process, never filled from a lagging replica
+        with primary():
+            intervals = RoomIntervals(self._query(*key))
+        self._rooms[key] = intervals
+        for pk in intervals.pks:
+            self._owners[pk] = key
+        return intervals
+
+    def _drop(self, key):
+        intervals = self._rooms.pop(key, None)
+        if intervals is not None:
+            for pk in intervals.pks:
+                self._owners.pop(pk, None)
+
+    def _get(self, key):
+        intervals = self._rooms.get(key)
+        if (intervals is not None and self.max_age is not None and
+                time.monotonic() - intervals.loaded_at > self.max_age):
+            self._drop(key)
+            intervals = None
+        return intervals
+
+    def _written(self):
+        """ Keys written by the open transaction of this thread """
+        if not in_transaction():
+            # Committed or rolled back since
+            self._local.written = set()
+        elif not hasattr(self._local, 'written'):
+            self._local.written = set()
+        return self._local.written
+
+    def preload(self, venue_id, room_id):
+        """ Load a room ahead of a write, so that the overlap check made
+        inside its transaction can be answered """
+        if not self.enabled or in_transaction():
+            return
+        key = (venue_id, room_id)
+        with self._lock:
+            self._written()
+            if self._get(key) is None:
+                self._load(key)
+
+    def find_overlap(self, venue_id, room_id, checkin, checkout,
+                     exclude=None):
+        """ Return True/False, or None when the caller has to ask the DB """
+        if not self.enabled:
+            return None
+        key = (venue_id, room_id)
+        with self._lock:
+            if key in self._written():
+                return None
+            intervals = self._get(key)
+            if intervals is None:
+                if in_transaction():
+                    return None
+                intervals = self._load(key)
+            return intervals.overlaps(checkin, checkout, exclude)
+
+    def _on_commit(self, keys, patch):
+        """ Run patch now, or once the open transaction commits """
+        if not in_transaction():
+            with self._lock:
+                patch()
+            return
+        written = self._written()
+        written.update(keys)
+
+        def committed():
+            with self._lock:
+                patch()
+                written.difference_update(keys)
+        transaction.on_commit(committed)
+
+    def _add(self, pk, key, checkin, checkout):
+        old_key = self._owners.pop(pk, None)
+        if old_key in self._rooms:
+            self._rooms[old_key].discard(pk)
+        intervals = self._rooms.get(key)
+        if intervals is not None:
+            intervals.add(pk, checkin, checkout)
+            self._owners[pk] = key
+
+    def _discard(self, pk):
+        old_key = self._owners.pop(pk, None)
+        if old_key in self._rooms:
+            self._rooms[old_key].discard(pk)
+
+    def reservation_saved(self, instance):
+        pk, key = instance.pk, (instance.venue_id, instance.room_id)
+        checkin, checkout = instance.checkin, instance.checkout
+        self._on_commit([key, self._owners.get(pk)],
+                        lambda: self._add(pk, key, checkin, checkout))
+
+    def reservations_created(self, reservations):
+        """ Reservations inserted in bulk, see core.bulk """
+        stays = [(r.pk, (r.venue_id, r.room_id), r.checkin, r.checkout)
+                 for r in reservations]
+
+        def patch():
+            for stay in stays:
+                self._add(*stay)
+        self._on_commit([key for _, key, _, _ in stays], patch)
+
+    def reservation_deleted(self, instance):
+        pk, key = instance.pk, (instance.venue_id, instance.room_id)
+        self._on_commit([key, self._owners.get(pk)],
+                        lambda: self._discard(pk))
+
+    def invalidate(self, keys=None):
+        """ Forget the given (venue_id, room_id) keys, or everything """
+        with self._lock:
+            if keys is None:
+                self._rooms.clear()
+                self._owners.clear()
+                return
+            for key in keys:
+                self._drop(key)
+
+    def invalidate_on_commit(self, keys):
+        """ Forget rooms written inside a transaction: right away, so this
+        connection stops trusting them, and again on commit, in case another
+        thread reloaded them in between """
+        self.invalidate(keys)
+        transaction.on_commit(lambda: self.invalidate(keys))
+
+    def verify(self, repair=True):
+        """ Compare every loaded room with the database.
+
+        Returns a list of (key, problem) tuples; inconsistent rooms are
+        dropped so they get reloaded when `repair` is set.
+        """
+        problems = []
+        with self._lock:
+            for key in list(self._rooms):
+                stays = sorted(self._query(*key))
+                if self._rooms[key].stays() != stays:
+                    problems.append((key, 'out of sync with the database'))
+                elif any(stays[i][1] > stays[i + 1][0]
+                         for i in range(len(stays) - 1)):
+                    problems.append((key, 'overlapping reservations'))
+                else:
+                    continue
+                if repair:
+                    self._drop(key)
+        return problems
+
+
+reservation_index = ReservationIndex()
@@ -0,0 +1,54 @@
+import time
+from datetime import date, datetime, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.calendar_builder import DEFAULT_PRICE, build_calendar
+
+
+def parse_date(value):
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except ValueError:
+        raise CommandError('Expected a date in YYYY-MM-DD format: %s' % value)
+
+
+class Command(BaseCommand):
+    help = ('Creates the missing Calendar days and updates the changed ones '
+            'for a date range')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--venue', type=int, action='append',
+                            dest='venues', help='Venue id, can be repeated. '
+                            'Defaults to every venue.')
+        parser.add_argument('--from', dest='start', type=parse_date,
+                            help='First day, defaults to today.')
+        parser.add_argument('--to', dest='end', type=parse_date,
+                            help='Last day (inclusive), defaults to 365 days '
+                                 'after --from.')
+        parser.add_argument('--price', type=int, default=DEFAULT_PRICE,
+                            help='Price of newly created days.')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--workers', type=int, default=1,
+                            help='Processes building venues in parallel.')
+
+    def handle(self, *args, **options):
+        start = options['start'] or date.today()
+        end = options['end'] or start + timedelta(days=365)
+        if start > end:
+            raise CommandError('--from should not be after --to.')
+        if options['workers'] < 1:
+            raise CommandError('--workers should be at least 1.')
+        began = time.perf_counter()
+
+        def progress(stats):
+            if options['verbosity'] > 1:
+                self.stdout.write('%s (%.1fs)' % (
+                    stats, time.perf_counter() - began))
+
+        stats = build_calendar(start, end, venue_ids=options['venues'],
+                               price=options['price'],
+                               batch_size=options['batch_size'],
+                               progress=progress,
+                               workers=options['workers'])
+        self.stdout.write('Calendar from %s to %s: %s' % (start, end, stats))
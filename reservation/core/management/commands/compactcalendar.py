@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from core.calendar_store import compact_calendar
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the compact (one row per room per month) calendar'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        written = compact_calendar(batch_size=options['batch_size'])
+        self.stdout.write('Wrote %d month records.' % written)
@@ -0,0 +1,53 @@
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.pricing import reprice
+
+from .buildcalendar import parse_date
+
+
+class Command(BaseCommand):
+    help = ('Reprices the free Calendar days of a date range with the '
+            'PRICING_RULES, writing only the days whose price changed')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--venue', type=int, action='append',
+                            dest='venues', help='Venue id, can be repeated. '
+                            'Defaults to every venue.')
+        parser.add_argument('--from', dest='start', type=parse_date,
+                            help='First day, defaults to today.')
+        parser.add_argument('--to', dest='end', type=parse_date,
+                            help='Last day (inclusive), defaults to 365 days '
+                                 'after --from.')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Only show what would change.')
+        parser.add_argument('--show', type=int, default=20,
+                            help='Number of changes listed by --dry-run.')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        start = options['start'] or date.today()
+        end = options['end'] or start + timedelta(days=365)
+        if start > end:
+            raise CommandError('--from should not be after --to.')
+
+        def progress(stats):
+            if options['verbosity'] > 1:
+                self.stdout.write(str(stats))
+
+        dry_run = options['dry_run']
+        stats = reprice(start, end, venue_ids=options['venues'],
+                        dry_run=dry_run, batch_size=options['batch_size'],
+                        sample_size=options['show'] if dry_run else 0,
+                        progress=progress)
+        if dry_run:
+            for pk, room_id, day, old, new in stats.sample:
+                self.stdout.write('calendar #%s room #%s %s: %s -> %s' % (
+                    pk, room_id, day, old, new))
+            if stats.changed > len(stats.sample):
+                self.stdout.write('... and %d more' % (
+                    stats.changed - len(stats.sample)))
+        self.stdout.write('%sPrices from %s to %s: %s' % (
+            'Dry run, nothing written. ' if dry_run else '', start, end,
+            stats))
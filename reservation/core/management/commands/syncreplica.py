@@ -0,0 +1,32 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.routers import replica_aliases, sync_replica
+
+
+class Command(BaseCommand):
+    help = ('Copies the primary SQLite database into its SQLite replicas '
+            '(DATABASE_REPLICAS), once or every N seconds')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--every', type=float, default=None,
+                            help='Seconds between copies, keeps running.')
+
+    def handle(self, *args, **options):
+        aliases = replica_aliases()
+        if not aliases:
+            raise CommandError('No replicas, set DATABASE_REPLICAS or '
+                               'RESERVATION_REPLICAS.')
+        while True:
+            for alias in aliases:
+                start = time.perf_counter()
+                try:
+                    sync_replica(alias)
+                except ValueError as e:
+                    raise CommandError(str(e))
+                self.stdout.write('Copied the primary to %s in %.2fs.' % (
+                    alias, time.perf_counter() - start))
+            if options['every'] is None:
+                return
+            time.sleep(options['every'])
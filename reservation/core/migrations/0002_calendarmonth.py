@@ -0,0 +1,37 @@
+# Generated by Django 2.0.2 on 2026-10-18 17:52
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CalendarMonth',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField(db_index=True)),
+                ('prices', models.BinaryField()),
+                ('reservations', models.BinaryField()),
+                ('entries', models.PositiveSmallIntegerField(default=0)),
+                ('room', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.Room')),
+                ('venue', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.Venue')),
+            ],
+            options={
+                'ordering': ['id'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='calendarmonth',
+            index=models.Index(fields=['venue', 'room', 'month'], name='core_calend_venue_i_b6405b_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='calendarmonth',
+            unique_together={('venue', 'room', 'month')},
+        ),
+    ]
@@ -1,8 +1,11 @@
-from django.db.models import Q
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F
 
 from rest_framework.exceptions import ValidationError
 
+from .interval_index import reservation_index
+from .routers import primary
+
 
 class AddressMixin(models.Model):
     # Abstract class for the address
@@ -39,6 +42,8 @@ class Venue(AddressMixin):
     # You can add more fields here: check-in time, checkout-time etc
 
     class Meta:
+        # Venues of a city taking reservations, for the search
+        indexes = [models.Index(fields=['city', 'disabled'])]
         ordering = ['id']
 
 
@@ -62,7 +67,9 @@ class Reservation(models.Model):
     room = models.ForeignKey('Room', on_delete=models.CASCADE)
     guest = models.ForeignKey('Guest', on_delete=models.CASCADE)
     created_at = models.DateField(auto_now_add=True)
-    updated_at = models.DateField(auto_now=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    # Bumped by every save, backs the ETag of the reservation endpoint
+    version = models.PositiveIntegerField(default=1, editable=False)
     amount = models.DecimalField(max_digits=8, decimal_places=2)
     state = models.IntegerField(choices=STATES, default=FUTURE, db_index=True)
     checkin = models.DateField(db_index=True)
@@ -72,6 +79,10 @@ class Reservation(models.Model):
     # Additional checks to figure out if the given rooms/dates have already
     # booked have been ignored
 
+    # Set by save() in claim mode (core.booking), where claiming the nights
+    # in the Calendar detects conflicts instead of the overlap check
+    claims_nights = False
+
     def clean(self, *args, **kwargs):
         # Assumption: Guest cannot check-in and check-out on the same day
         # assuming that the guest to book for atleast 1 day.
@@ -79,25 +90,58 @@ class Reservation(models.Model):
             raise ValidationError({'error': 'checkin date should be less than '
                                             'checkout date.'})
 
-        # Assumption: Guest 1 can check-out and Guest 2 can check-in on the
-        # same day
-        filters = (Q(checkin__lte=self.checkin, checkout__gt=self.checkin) |
-                   Q(checkin__lt=self.checkout, checkout__gte=self.checkout))
-        if self.pk:
-            # If modifying, the don't check for current one
-            filters &= ~Q(pk=self.pk)
-        if Reservation.objects.filter(
-           filters,
-           venue__id=self.venue_id, room__id=self.room_id
-           ).exists():
+        conflict = False
+        if not self.claims_nights:
+            # The per-process index rejects known conflicts without a query.
+            # It may miss bookings made by other processes, so "no conflict"
+            # is always confirmed by the primary: a replica may not have the
+            # latest bookings yet
+            conflict = reservation_index.find_overlap(
+                self.venue_id, self.room_id, self.checkin, self.checkout,
+                exclude=self.pk)
+            if not conflict:
+                with primary():
+                    conflict = self.overlapping().exists()
+        if conflict:
             raise ValidationError({'error': 'There is an existing reservation '
                                             'for this Room'})
 
         return super(Reservation, self).clean(*args, **kwargs)
 
+    def overlapping(self):
+        """ Reservations of the same room whose stay intersects this one """
+        # Assumption: Guest 1 can check-out and Guest 2 can check-in on the
+        # same day, so two stays overlap when each starts before the other
+        # ends. This also catches a new stay fully containing an old one.
+        queryset = Reservation.objects.filter(
+            venue__id=self.venue_id, room__id=self.room_id,
+            checkin__lt=self.checkout, checkout__gt=self.checkin)
+        if self.pk:
+            # If modifying, the don't check for current one
+            queryset = queryset.exclude(pk=self.pk)
+        return queryset
+
     def save(self, *args, **kwargs):
-        self.full_clean()
-        super(Reservation, self).save(*args, **kwargs)
+        # Imported here, core.booking needs the models
+        from .booking import claim_mode, claim_nights
+
+        self.claims_nights = claim_mode()
+        if not self.claims_nights:
+            # Loaded before the transaction, which could not load it
+            reservation_index.preload(self.venue_id, self.room_id)
+        # The overlap check of clean() and the write commit together
+        with transaction.atomic():
+            self.full_clean()
+            created = self._state.adding
+            if not created:
+                # Counted by the database, concurrent updates from other
+                # processes never end up on the same version
+                self.version = F('version') + 1
+            super(Reservation, self).save(*args, **kwargs)
+            if not created:
+                self.refresh_from_db(fields=['version'])
+            if self.claims_nights:
+                claim_nights(self, created)
 
     def __str__(self):
         return '%s: %s :: %s' % (self.venue, self.room, self.state)
@@ -149,3 +193,46 @@ class Calendar(models.Model):
         unique_together = (('venue', 'room', 'day'))
         indexes = [models.Index(fields=['venue', 'room', 'day'])]
         ordering = ['id']
+
+
+class CalendarMonth(models.Model):
+    """ Compact Calendar storage - one record per room per month instead of
+    one per room per day. Used when settings.CALENDAR_STORAGE is 'compact';
+    see core.calendar_store for the packing and the read layer.
+
+    prices holds one little-endian int64 per day of the month, the price in
+    cents or -1 when there is no calendar entry for that day. reservations
+    holds the reservation id per day, 0 when the day is free."""
+    room = models.ForeignKey('Room', db_index=True, on_delete=models.CASCADE)
+    venue = models.ForeignKey('Venue', db_index=True, on_delete=models.CASCADE)
+    # First day of the month
+    month = models.DateField(db_index=True)
+    prices = models.BinaryField()
+    reservations = models.BinaryField()
+    # Number of days that have a calendar entry, keeps counting cheap
+    entries = models.PositiveSmallIntegerField(default=0)
+
+    def __str__(self):
+        return '%s - %s: %s' % (self.month.strftime('%Y-%m'), self.venue,
+                                self.room)
+
+    class Meta:
+        unique_together = (('venue', 'room', 'month'))
+        indexes = [models.Index(fields=['venue', 'room', 'month'])]
+        ordering = ['id']
+
+
+class CalendarDayVersion(models.Model):
+    """ Change counter of the Calendar entries of one day, bumped by every
+    write to them (see core.versions). Backs the ETag of the calendar day
+    endpoint."""
+    day = models.DateField(unique=True)
+    version = models.PositiveIntegerField(default=0)
+    # Set explicitly, the counters are bumped with update()
+    updated_at = models.DateTimeField()
+
+    def __str__(self):
+        return '%s: v%d' % (self.day, self.version)
+
+    class Meta:
+        ordering = ['day']
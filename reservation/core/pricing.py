@@ -0,0 +1,205 @@
+""" Batch dynamic pricing of the Calendar.
+
+PricingRules compiles settings.PRICING_RULES into arrays: a base rate per
+room type, a multiplier per day of the horizon (weekday x season) and
+occupancy thresholds. reprice() loads a venue's calendar days as arrays,
+computes every free day's price in one vectorized expression
+
+    base rate[room] x day multiplier[day] x occupancy uplift[day]
+
+and writes back only the days whose price changed. Days already booked
+keep the price they were sold at.
+"""
+from datetime import datetime
+from decimal import Decimal
+
+import numpy as np
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import CharField, FloatField
+from django.db.models.functions import Cast
+
+from .calendar_builder import DEFAULT_PRICE
+from .calendar_store import sync_months
+from .models import Calendar, Room
+from .signals import calendar_prices_changed
+from .versions import bump_calendar_days
+
+# 1970-01-01, day 0 of numpy datetime64[D], was a Thursday
+EPOCH_WEEKDAY = 3
+
+
+def month_day(value):
+    """ 'MM-DD' -> MMDD """
+    parsed = datetime.strptime(value, '%m-%d')
+    return parsed.month * 100 + parsed.day
+
+
+class PricingRules(object):
+    """ Pricing rules, see PRICING_RULES in settings for their format """
+
+    def __init__(self, base_rates=None, weekday_multipliers=None, seasons=(),
+                 occupancy_uplift=(), default_rate=DEFAULT_PRICE):
+        self.base_rates = dict(base_rates or {})
+        self.default_rate = default_rate
+        self.weekday_multipliers = np.array(
+            weekday_multipliers or [1] * 7, dtype=float)
+        if len(self.weekday_multipliers) != 7:
+            raise ValueError('weekday_multipliers needs 7 values, Monday '
+                             'first.')
+        self.seasons = [(month_day(first), month_day(last), float(multiplier))
+                        for first, last, multiplier in seasons]
+        self.occupancy_uplift = sorted((float(threshold), float(multiplier))
+                                       for threshold, multiplier
+                                       in occupancy_uplift)
+
+    @classmethod
+    def from_settings(cls):
+        return cls(**getattr(settings, 'PRICING_RULES', {}))
+
+    def room_rates(self, room_types):
+        return np.array([self.base_rates.get(room_type, self.default_rate)
+                         for room_type in room_types], dtype=float)
+
+    def day_multipliers(self, start, days):
+        """ Weekday x season multiplier of `days` days from `start` """
+        dates = np.arange(np.datetime64(start), np.datetime64(start) + days)
+        multipliers = self.weekday_multipliers[
+            (dates.astype(np.int64) + EPOCH_WEEKDAY) % 7]
+        months = dates.astype('datetime64[M]')
+        month_days = ((months.astype(np.int64) % 12 + 1) * 100 +
+                      (dates - months).astype(np.int64) + 1)
+        for first, last, multiplier in self.seasons:
+            if first <= last:
+                in_season = (month_days >= first) & (month_days <= last)
+            else:
+                # Wraps around the new year
+                in_season = (month_days >= first) | (month_days <= last)
+            multipliers = np.where(in_season, multipliers * multiplier,
+                                   multipliers)
+        return multipliers
+
+    def uplift(self, occupancy):
+        """ Multiplier of the highest threshold each occupancy reaches """
+        result = np.ones(len(occupancy))
+        for threshold, multiplier in self.occupancy_uplift:
+            result = np.where(occupancy >= threshold, multiplier, result)
+        return result
+
+
+class PricingStats(object):
+
+    def __init__(self, sample_size=0):
+        self.venues = 0
+        self.days = 0
+        self.booked = 0
+        self.changed = 0
+        # Days of rooms that belong to another venue now, left as they are
+        self.skipped = 0
+        # Up to sample_size (calendar id, room id, day, old, new) changes
+        self.sample_size = sample_size
+        self.sample = []
+
+    @property
+    def unchanged(self):
+        return self.days - self.booked - self.changed
+
+    def __str__(self):
+        text = ('%d venues: %d days, %d changed, %d unchanged, %d booked' %
+                (self.venues, self.days, self.changed, self.unchanged,
+                 self.booked))
+        if self.skipped:
+            text += (', %d skipped (rooms moved to another venue)' %
+                     self.skipped)
+        return text
+
+
+def from_cents(cents):
+    return Decimal(int(cents)).scaleb(-2)
+
+
+def _reprice_venue(venue_id, room_types, rules, start, end, dry_run,
+                   batch_size, stats):
+    # Days come as ISO strings and prices as floats: numpy parses them in
+    # bulk, far faster than the ORM builds date and Decimal objects
+    rows = list(Calendar.objects.filter(
+        venue__id=venue_id, day__gte=start, day__lte=end).values_list(
+        'id', 'room_id', Cast('day', CharField(max_length=10)),
+        Cast('price', FloatField()), 'reservation_id'))
+    # A room moved to another venue keeps its rows under this one, they are
+    # not priced with either venue
+    priced = [row for row in rows if row[1] in room_types]
+    stats.skipped += len(rows) - len(priced)
+    rows = priced
+    if not rows:
+        return
+    ids, room_ids, days, prices, reservation_ids = zip(*rows)
+    horizon = (end - start).days + 1
+    days = np.array(days, dtype='datetime64[D]')
+    day_index = (days - np.datetime64(start)).astype(np.int64)
+    booked = np.array([pk is not None for pk in reservation_ids])
+
+    # Occupancy of the venue per day, over the rooms that have the day
+    occupancy = (np.bincount(day_index[booked], minlength=horizon) /
+                 np.maximum(np.bincount(day_index, minlength=horizon), 1))
+    room_position = dict((room_id, i) for i, room_id in enumerate(room_types))
+    room_index = np.array([room_position[room_id] for room_id in room_ids])
+    day_factor = rules.day_multipliers(start, horizon) * \
+        rules.uplift(occupancy)
+    new = np.rint(rules.room_rates(list(room_types.values()))[room_index] *
+                  day_factor[day_index] * 100).astype(np.int64)
+    old = np.rint(np.array(prices) * 100).astype(np.int64)
+    changed = np.flatnonzero((new != old) & ~booked)
+
+    stats.days += len(rows)
+    stats.booked += int(booked.sum())
+    stats.changed += len(changed)
+    for i in changed[:stats.sample_size - len(stats.sample)]:
+        stats.sample.append((ids[i], room_ids[i], days[i].item(),
+                             from_cents(old[i]), from_cents(new[i])))
+    if dry_run or not len(changed):
+        return
+
+    # A handful of distinct prices cover the horizon, so one UPDATE per
+    # price and chunk writes the changes. A day booked since the read above
+    # keeps its price.
+    ids = np.array(ids)
+    for cents in np.unique(new[changed]):
+        group = ids[changed[new[changed] == cents]].tolist()
+        for i in range(0, len(group), batch_size):
+            Calendar.objects.filter(id__in=group[i:i + batch_size],
+                                    reservation__isnull=True) \
+                .update(price=from_cents(cents))
+    bump_calendar_days(day.item() for day in np.unique(days[changed]))
+    sync_months((room_ids[i], days[i].item()) for i in changed.tolist())
+    calendar_prices_changed.send(
+        sender=Calendar,
+        rooms=set((venue_id, room_ids[i]) for i in changed.tolist()))
+
+
+def reprice(start, end, venue_ids=None, rules=None, dry_run=False,
+            batch_size=1000, sample_size=0, progress=None):
+    """ Reprice the free Calendar days from start to end (both inclusive).
+
+    With `dry_run` nothing is written, the returned PricingStats tell what
+    would change and keep a sample of the changes when `sample_size` is
+    set. `progress`, when given, is called with the stats after each venue.
+    """
+    rules = rules or PricingRules.from_settings()
+    stats = PricingStats(sample_size)
+    rooms = Room.objects.order_by('venue_id', 'id')
+    if venue_ids:
+        rooms = rooms.filter(venue__id__in=venue_ids)
+    venues = {}
+    for venue_id, room_id, room_type in rooms.values_list(
+            'venue_id', 'id', 'room_type'):
+        venues.setdefault(venue_id, {})[room_id] = room_type
+    for venue_id, room_types in venues.items():
+        with transaction.atomic():
+            _reprice_venue(venue_id, room_types, rules, start, end, dry_run,
+                           batch_size, stats)
+        stats.venues += 1
+        if progress is not None:
+            progress(stats)
+    return stats
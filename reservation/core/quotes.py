@@ -0,0 +1,168 @@
+""" Stay price quotes from per-room running totals of the Calendar prices.
+
+RoomPrices keeps, for one room, the running total in cents of its nightly
+prices from its first calendar day on:
+
+    totals[i] = price of the days first .. first + i - 1
+
+so the price of a stay is totals[checkout] - totals[checkin], two lookups
+however many nights it spans. A running count of the days that have a
+price tells whether every night of the stay is in the calendar.
+
+QuoteCache keeps them per process, loaded on first use with one query for
+every room a request needs, and drops a room when its calendar rows change
+(see core.signals). As with the other in-process caches, nothing is stored
+from inside a transaction and QUOTE_CACHE_MAX_AGE bounds how long changes
+made by other processes go unseen. quote_from_db sums a stay straight from
+the Calendar rows instead, for the checks that must not go by a stale price.
+"""
+import threading
+import time
+from array import array
+from collections import defaultdict
+from datetime import timedelta
+from itertools import accumulate
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Sum
+
+from .calendar_store import NO_PRICE, compact_storage, to_cents, unpack
+from .models import Calendar, CalendarMonth
+from .routers import primary
+from .utils import in_transaction
+
+
+class RoomPrices(object):
+
+    def __init__(self, days):
+        """ `days` maps each calendar day of the room to its price in
+        cents """
+        self.loaded_at = time.monotonic()
+        self.first = min(days) if days else None
+        length = (max(days) - self.first).days + 1 if days else 0
+        cents = [0] * length
+        priced = [0] * length
+        for day, price in days.items():
+            offset = (day - self.first).days
+            cents[offset] = price
+            priced[offset] = 1
+        self.totals = array('q', accumulate([0] + cents))
+        self.priced = array('q', accumulate([0] + priced))
+
+    def quote(self, checkin, checkout):
+        """ Price in cents of the nights from checkin to checkout, None
+        when one of them has no price """
+        if self.first is None:
+            return None
+        start = (checkin - self.first).days
+        end = (checkout - self.first).days
+        if start < 0 or end >= len(self.totals) or start >= end:
+            return None
+        if self.priced[end] - self.priced[start] != end - start:
+            return None
+        return self.totals[end] - self.totals[start]
+
+
+def load_prices(room_ids):
+    """ room id -> RoomPrices of the given rooms, read from the calendar
+    storage in use """
+    days = defaultdict(dict)
+    if compact_storage():
+        months = CalendarMonth.objects.filter(room__id__in=room_ids)
+        for room_id, month, prices in months.order_by().values_list(
+                'room_id', 'month', 'prices'):
+            for i, cents in enumerate(unpack(prices)):
+                if cents != NO_PRICE:
+                    days[room_id][month + timedelta(days=i)] = cents
+    else:
+        rows = Calendar.objects.filter(room__id__in=room_ids)
+        for room_id, day, price in rows.order_by().values_list(
+                'room_id', 'day', 'price'):
+            days[room_id][day] = to_cents(price)
+    return dict((room_id, RoomPrices(days[room_id])) for room_id in room_ids)
+
+
+class QuoteCache(object):
+
+    def __init__(self):
+        self._rooms = {}
+        self._lock = threading.RLock()
+
+    @property
+    def max_age(self):
+        return getattr(settings, 'QUOTE_CACHE_MAX_AGE', None)
+
+    def _get(self, room_id):
+        prices = self._rooms.get(room_id)
+        if prices is not None and self.max_age is not None and \
+                time.monotonic() - prices.loaded_at > self.max_age:
+            del self._rooms[room_id]
+            prices = None
+        return prices
+
+    def rooms(self, room_ids):
+        """ room id -> RoomPrices of every given room """
+        with self._lock:
+            found, missing = {}, []
+            for room_id in set(room_ids):
+                prices = self._get(room_id)
+                if prices is None:
+                    missing.append(room_id)
+                else:
+                    found[room_id] = prices
+            if missing:
+                # Shared by the whole process, never filled from a lagging
+                # replica nor from rows that may still be rolled back
+                with primary():
+                    loaded = load_prices(missing)
+                if not in_transaction():
+                    # Rooms without a calendar, or ids of no room, are asked
+                    # again
+                    self._rooms.update((room_id, prices) for room_id, prices
+                                       in loaded.items() if prices.first)
+                found.update(loaded)
+            return found
+
+    def invalidate(self, room_ids=None):
+        """ Forget the given rooms, or everything """
+        with self._lock:
+            if room_ids is None:
+                self._rooms.clear()
+                return
+            for room_id in room_ids:
+                self._rooms.pop(room_id, None)
+
+    def invalidate_on_commit(self, room_ids):
+        """ Forget rooms now and again once the transaction commits, in case
+        another thread reloaded them in between """
+        room_ids = list(room_ids)
+        self.invalidate(room_ids)
+        transaction.on_commit(lambda: self.invalidate(room_ids))
+
+
+quote_cache = QuoteCache()
+
+
+def quote_stays(stays):
+    """ Price in cents of each (room_id, checkin, checkout), or None when a
+    night has no price """
+    rooms = quote_cache.rooms(room_id for room_id, _, _ in stays)
+    return [rooms[room_id].quote(checkin, checkout)
+            for room_id, checkin, checkout in stays]
+
+
+def quote(room_id, checkin, checkout):
+    return quote_stays([(room_id, checkin, checkout)])[0]
+
+
+def quote_from_db(room_id, checkin, checkout):
+    """ Price in cents of the stay, or None when a night has no price, in
+    one query on the Calendar rows (written in either storage) """
+    with primary():
+        stay = Calendar.objects.filter(
+            room__id=room_id, day__gte=checkin, day__lt=checkout).aggregate(
+            price=Sum('price'), nights=Count('id'))
+    if not stay['nights'] or stay['nights'] != (checkout - checkin).days:
+        return None
+    return to_cents(stay['price'])
@@ -0,0 +1,100 @@
+""" Read replica routing.
+
+settings.DATABASE_REPLICAS lists the DATABASES aliases that serve reads.
+ReplicaRouter sends reads to one of them only inside a routing(True) block,
+which api.pinning.PrimaryPinningMiddleware opens for the safe requests of
+clients that did not write recently. One replica is picked per block, so
+the queries of a request see a single snapshot. Writes, and every read
+outside such a block (background jobs, commands, unsafe requests), go to
+the primary, 'default'.
+
+Inside a block, reads go back to the primary:
+
+- after the first write, so a request reads its own writes. Django also
+  asks for the write database when a related object is assigned, which
+  then only moves the reads to the primary early;
+- inside a transaction of the primary;
+- inside primary(), used by the conflict checks (Reservation.clean) and the
+  fills of the in-process caches, which must never see a lagging replica.
+"""
+import random
+from contextlib import contextmanager
+
+from asgiref.local import Local
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from .utils import in_transaction
+
+_state = Local()
+
+
+def replica_aliases():
+    return list(getattr(settings, 'DATABASE_REPLICAS', ()))
+
+
+def sync_replica(alias):
+    """ Copy the primary into the replica `alias`, both SQLite databases.
+    Readers of the replica see either the old or the new copy. """
+    source, target = connections[DEFAULT_DB_ALIAS], connections[alias]
+    if source.vendor != 'sqlite' or target.vendor != 'sqlite':
+        raise ValueError('Only SQLite replicas can be copied, replicate '
+                         '%s with the tools of its database' % alias)
+    source.ensure_connection()
+    target.ensure_connection()
+    # sqlite3 online backup (Python 3.7+), the primary stays writable
+    source.connection.backup(target.connection)
+
+
+@contextmanager
+def routing(replicas):
+    """ Route the reads of the block to a replica when `replicas` is True
+    and some are configured. wrote() tells whether the block wrote. """
+    aliases = replica_aliases() if replicas else []
+    previous = (getattr(_state, 'replica', None),
+                getattr(_state, 'wrote', False))
+    _state.replica = random.choice(aliases) if aliases else None
+    _state.wrote = False
+    try:
+        yield
+    finally:
+        _state.replica, _state.wrote = previous
+
+
+@contextmanager
+def primary():
+    """ Read from the primary inside the block """
+    previous = getattr(_state, 'replica', None)
+    _state.replica = None
+    try:
+        yield
+    finally:
+        _state.replica = previous
+
+
+def wrote():
+    """ True once the current routing block wrote to the primary """
+    return getattr(_state, 'wrote', False)
+
+
+class ReplicaRouter(object):
+
+    def db_for_read(self, model, **hints):
+        replica = getattr(_state, 'replica', None)
+        if replica is None or wrote() or in_transaction(DEFAULT_DB_ALIAS):
+            return DEFAULT_DB_ALIAS
+        return replica
+
+    def db_for_write(self, model, **hints):
+        _state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get their schema from the primary
+        if db in replica_aliases():
+            return False
+        return None
@@ -0,0 +1,57 @@
+""" Top-k cheapest free rooms of a city.
+
+cheapest_rooms() only looks at the rooms that can be booked: the venues of
+the city that are not disabled come from one indexed query, their free rooms
+from the availability bitsets (core.availability), and the price of the stay
+of each free room from the running totals of core.quotes. The k cheapest are
+kept with a bounded heap, so a search costs O(candidates * log k) in three
+queries at most, however many venues and nights.
+
+Venues the availability engine cannot answer for (not loaded yet, inside a
+transaction, or a stay past its horizon) are looked up together in one DB
+query. A search never loads a venue itself: the venues not loaded yet are
+loaded in a background thread for the next searches. Rooms with a night
+missing from the calendar have no price and are left out.
+"""
+import heapq
+
+from .availability import availability_engine, venues_free_rooms_from_db
+from .models import Venue
+from .quotes import quote_stays
+
+
+def city_venues(city):
+    """ Ids of the venues of a city taking reservations """
+    return list(Venue.objects.filter(city=city, disabled=False)
+                .order_by().values_list('id', flat=True))
+
+
+def candidate_rooms(venue_ids, checkin, checkout, room_type=None):
+    """ Ids of the rooms of the venues free for every night of the stay """
+    room_ids, missing = [], []
+    for venue_id in venue_ids:
+        free = availability_engine.free_rooms(venue_id, checkin, checkout,
+                                              room_type, load=False)
+        if free is None:
+            missing.append(venue_id)
+        else:
+            room_ids.extend(free)
+    if missing:
+        room_ids.extend(venues_free_rooms_from_db(missing, checkin, checkout,
+                                                  room_type))
+        availability_engine.warm_later(missing)
+    return room_ids
+
+
+def cheapest_rooms(city, checkin, checkout, room_type=None, limit=10):
+    """ [(cents, room id), ...] of the `limit` cheapest free rooms of the
+    city for the stay, cheapest first """
+    venue_ids = city_venues(city)
+    if not venue_ids:
+        return []
+    room_ids = candidate_rooms(venue_ids, checkin, checkout, room_type)
+    quotes = quote_stays([(room_id, checkin, checkout)
+                          for room_id in room_ids])
+    return heapq.nsmallest(limit, ((cents, room_id) for room_id, cents
+                                   in zip(room_ids, quotes)
+                                   if cents is not None))
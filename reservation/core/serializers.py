@@ -1,6 +1,9 @@
+from django.conf import settings
 from django.db.models import Q
 from rest_framework import serializers
+from .calendar_store import from_cents, to_cents
 from .models import Venue, Guest, Reservation, Room, Calendar
+from .quotes import quote_from_db
 
 # NOTE: for the brevity of this exercise it's assumed that there
 # will one venue/hotel, so venue api is not covered:
@@ -14,22 +17,17 @@ class GuestSerializer(serializers.ModelSerializer):
 
 
 class RoomSerializer(serializers.ModelSerializer):
-    venue_id = serializers.IntegerField(source='venue.id')
+    # Read from the venue_id column, going through room.venue would cost a
+    # query per row on list pages
+    venue_id = serializers.IntegerField()
 
     class Meta:
         model = Room
         fields = ('id', 'venue_id', 'room_number', 'room_type', 'room_desc')
         read_only_fields = ('id',)
 
-    def update(self, instance, validated_data):
-        venue = validated_data.pop('venue', None)
-        if venue is not None:
-            instance.venue_id = venue['id']
-        return super(RoomSerializer, self).update(instance, validated_data)
-
     def create(self, validated_data):
-        venue_id = validated_data.pop('venue')['id']
-        venue = Venue.objects.get(pk=venue_id)
+        venue = Venue.objects.get(pk=validated_data.pop('venue_id'))
         return Room.objects.create(venue=venue, **validated_data)
 
 
@@ -41,9 +39,11 @@ class VenueSerializer(serializers.ModelSerializer):
 
 
 class ReservationSerializer(serializers.ModelSerializer):
-    venue_id = serializers.IntegerField(source='venue.id')
-    guest_id = serializers.IntegerField(source='guest.id')
-    room_id = serializers.CharField(source='room.id')
+    # Read from the foreign key columns, going through the related objects
+    # would cost three queries per row on list pages
+    venue_id = serializers.IntegerField()
+    guest_id = serializers.IntegerField()
+    room_id = serializers.CharField()
 
     class Meta:
         model = Reservation
@@ -51,27 +51,48 @@ class ReservationSerializer(serializers.ModelSerializer):
                   'venue_id', 'guest_id', 'room_id',)
         read_only_fields = ('id', 'created_at', 'updated_at',
                             'venue', 'guest', 'room')
-
-    def update(self, instance, validated_data):
-        guest = validated_data.pop('guest', None)
-        if guest:
-            instance.guest_id = guest['id']
-        venue = validated_data.pop('venue', None)
-        if venue:
-            instance.venue_id = venue['id']
-        room = validated_data.pop('room', None)
-        if room:
-            instance.room_id = room['id']
-        return super(ReservationSerializer, self) \
-            .update(instance, validated_data)
+        # Defaults to the price of the stay, see validate()
+        extra_kwargs = {'amount': {'required': False}}
+
+    def validate_room_id(self, value):
+        if not value.isdigit():
+            raise serializers.ValidationError('A valid integer is required.')
+        return int(value)
+
+    def validate(self, attrs):
+        if self.instance is not None:
+            return attrs
+        if not self.context.get('check_amount', True):
+            # Checked for the whole batch by core.bulk
+            return attrs
+        # A new reservation costs the price of its nights in the calendar,
+        # when every night has one. Summed from the database, the quote cache
+        # may not have seen a reprice of another process yet
+        cents = None
+        if getattr(settings, 'QUOTE_CHECK_AMOUNT', False) and \
+                attrs['checkin'] < attrs['checkout']:
+            cents = quote_from_db(attrs['room_id'], attrs['checkin'],
+                                  attrs['checkout'])
+        if cents is None:
+            if 'amount' not in attrs:
+                raise serializers.ValidationError(
+                    {'amount': 'This field is required.'})
+        elif 'amount' not in attrs:
+            attrs['amount'] = from_cents(cents)
+        elif to_cents(attrs['amount']) != cents:
+            raise serializers.ValidationError(
+                {'amount': 'Expected %s, the price of the stay.' %
+                           from_cents(cents)})
+        return attrs
+
+    def to_record(self):
+        """ Flat dict of the validated data, as core.bulk expects it """
+        return dict(self.validated_data)
 
     def create(self, validated_data):
-        dct_guest = validated_data.pop('guest')
-        dct_venue = validated_data.pop('venue')
-        dct_room = validated_data.pop('room')
-        venue = Venue.objects.get(pk=dct_venue['id'])
-        guest = Guest.objects.get(pk=dct_guest['id'])
-        room = Room.objects.get(venue=venue, pk=dct_room['id'])
+        venue = Venue.objects.get(pk=validated_data.pop('venue_id'))
+        guest = Guest.objects.get(pk=validated_data.pop('guest_id'))
+        room = Room.objects.get(venue=venue, pk=validated_data.pop('room_id'))
         return Reservation.objects.create(venue=venue, guest=guest, room=room,
                                           **validated_data)
 
@@ -81,3 +102,16 @@ class CalendarSerializer(serializers.ModelSerializer):
         model = Calendar
         fields = ('id', 'room_id', 'venue_id', 'day', 'price', 'reservation_id')
         read_only_fields = ('id',)
+
+
+class StaySerializer(serializers.Serializer):
+    """ A stay to quote, see api.views.StayQuote """
+    room_id = serializers.IntegerField()
+    checkin = serializers.DateField()
+    checkout = serializers.DateField()
+
+    def validate(self, attrs):
+        if attrs['checkin'] >= attrs['checkout']:
+            raise serializers.ValidationError(
+                {'error': 'checkin date should be less than checkout date.'})
+        return attrs
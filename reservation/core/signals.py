@@ -0,0 +1,84 @@
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import Signal, receiver
+
+from .availability import availability_engine
+from .calendar_store import sync_months
+from .interval_index import reservation_index
+from .models import Calendar, Reservation, Room
+from .quotes import quote_cache
+from .versions import bump_calendar_days
+
+# Sent with rooms=[(venue_id, room_id), ...] after reservations were written
+# in bulk, which bypasses post_save
+reservations_bulk_changed = Signal()
+
+# Sent with reservations=[Reservation, ...], with their ids, after core.bulk
+# inserted them
+reservations_created = Signal()
+
+# Sent with rooms=[(venue_id, room_id), ...] after Calendar days were
+# created or repriced in bulk
+calendar_prices_changed = Signal()
+
+
+# Keep the in-process reservation index and availability bitsets in sync
+# with the Reservation table
+@receiver(post_save, sender=Reservation)
+def reservation_saved(sender, instance, **kwargs):
+    reservation_index.reservation_saved(instance)
+    availability_engine.reservation_saved(instance)
+
+
+@receiver(post_delete, sender=Reservation)
+def reservation_deleted(sender, instance, **kwargs):
+    reservation_index.reservation_deleted(instance)
+    availability_engine.reservation_deleted(instance)
+    # Its nights are free in the Calendar rows now, see reservation_deleting
+    sync_months(getattr(instance, '_held_nights', ()))
+
+
+@receiver(post_save, sender=Room)
+@receiver(post_delete, sender=Room)
+def room_changed(sender, instance, **kwargs):
+    availability_engine.room_changed(instance)
+    quote_cache.invalidate_on_commit([instance.pk])
+
+
+@receiver(reservations_bulk_changed)
+def reservations_bulk_changed_handler(sender, rooms, **kwargs):
+    rooms = list(rooms)
+    reservation_index.invalidate_on_commit(rooms)
+    availability_engine.invalidate_on_commit(
+        set(venue_id for venue_id, room_id in rooms))
+
+
+@receiver(reservations_created)
+def reservations_created_handler(sender, reservations, **kwargs):
+    reservations = list(reservations)
+    reservation_index.reservations_created(reservations)
+    availability_engine.reservations_created(reservations)
+
+
+# Calendar day versions (core.versions) and compact months
+# (core.calendar_store), written in the writing transaction
+@receiver(post_save, sender=Calendar)
+@receiver(post_delete, sender=Calendar)
+def calendar_changed(sender, instance, **kwargs):
+    bump_calendar_days([instance.day])
+    sync_months([(instance.room_id, instance.day)])
+    quote_cache.invalidate_on_commit([instance.room_id])
+
+
+@receiver(calendar_prices_changed)
+def calendar_prices_changed_handler(sender, rooms, **kwargs):
+    quote_cache.invalidate_on_commit(room_id for venue_id, room_id in rooms)
+
+
+@receiver(pre_delete, sender=Reservation)
+def reservation_deleting(sender, instance, **kwargs):
+    # The Calendar entries pointing at it are about to be set to NULL
+    # without any signal
+    instance._held_nights = list(
+        Calendar.objects.filter(reservation_id=instance.pk)
+        .values_list('room_id', 'day'))
+    bump_calendar_days(day for _, day in instance._held_nights)
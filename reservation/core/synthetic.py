@@ -0,0 +1,198 @@
+""" Deterministic synthetic data for load testing, used by populatedb.
+
+Everything is drawn from one random.Random(seed), so the same arguments on
+an empty database give the same venues, rooms, guests and stays. Rows are
+written with chunked bulk_create, which skips save() and full_clean():
+
+- field values come from fixed templates, so clean_fields() on the first
+  instance of each chunk stands for the rest of it;
+- stays are laid out per room by plan_stays, one per slot of the horizon,
+  so checkin < checkout and stays of a room never overlap by construction;
+- reservations only go to rooms created in the same run, so they cannot
+  overlap existing stays either.
+
+The calendar of the horizon is then built and priced with the regular
+build_calendar and reprice jobs.
+"""
+import random
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Max
+
+from .calendar_builder import build_calendar
+from .models import Guest, Reservation, Room, Venue
+from .pricing import PricingRules, reprice
+from .signals import reservations_bulk_changed
+
+# (city, zipcode, timezone) of the generated venues and guests
+CITIES = (
+    ('Los Angeles', '90000', 'America/Los_Angeles'),
+    ('San Francisco', '94103', 'America/Los_Angeles'),
+    ('New York', '10001', 'America/New_York'),
+    ('Boston', '02108', 'America/New_York'),
+    ('Chicago', '60601', 'America/Chicago'),
+    ('Denver', '80202', 'America/Denver'),
+)
+# Relative share of each room type
+ROOM_TYPE_WEIGHTS = ((Room.REGULAR, 6), ('Deluxe', 3), ('Suite', 1))
+MAX_NIGHTS = 7
+
+
+class GenerateStats(object):
+
+    def __init__(self):
+        self.venues = 0
+        self.rooms = 0
+        self.guests = 0
+        self.reservations = 0
+        self.calendar = None
+        self.prices = None
+
+    def __str__(self):
+        return ('%d venues, %d rooms, %d guests, %d reservations' %
+                (self.venues, self.rooms, self.guests, self.reservations))
+
+
+def plan_stays(rng, count, days, max_nights=MAX_NIGHTS):
+    """ `count` non-overlapping stays within `days` days, as (first night
+    offset, nights). The horizon is cut into `count` slots of (nearly) equal
+    length and each stay falls inside its own slot. """
+    if count > days:
+        raise ValueError('Cannot fit %d stays in %d days.' % (count, days))
+    stays = []
+    for i in range(count):
+        slot_start, slot_end = i * days // count, (i + 1) * days // count
+        nights = rng.randint(1, min(max_nights, slot_end - slot_start))
+        stays.append((rng.randint(slot_start, slot_end - nights), nights))
+    return stays
+
+
+def _last_id(model):
+    return model.objects.aggregate(last=Max('id'))['last'] or 0
+
+
+def _bulk_create(model, chunk):
+    """ Validate the first instance, see the module docstring, and write
+    the chunk. Returns its length. """
+    if not chunk:
+        return 0
+    chunk[0].clean_fields()
+    with transaction.atomic():
+        model.objects.bulk_create(chunk)
+    return len(chunk)
+
+
+def _insert(model, instances, batch_size):
+    """ Chunked _bulk_create, returns the ids of the new rows """
+    last_id = _last_id(model)
+    for i in range(0, len(instances), batch_size):
+        _bulk_create(model, instances[i:i + batch_size])
+    # Backends like SQLite do not return ids from bulk inserts
+    return list(model.objects.filter(id__gt=last_id).order_by('id')
+                .values_list('id', flat=True))
+
+
+def _venues(rng, count, batch_size):
+    offset = _last_id(Venue)
+    venues = []
+    for i in range(count):
+        city, zipcode, timezone = rng.choice(CITIES)
+        venues.append(Venue(name='Hotel %d' % (offset + i + 1),
+                            address='%d Main Street' % rng.randint(1, 999),
+                            city=city, zipcode=zipcode, timezone=timezone))
+    return _insert(Venue, venues, batch_size)
+
+
+def _rooms(rng, venue_ids, per_venue, batch_size):
+    """ Returns (room id, venue id, room type) of the new rooms """
+    types, weights = zip(*ROOM_TYPE_WEIGHTS)
+    rooms = [Room(venue_id=venue_id, room_number=str(101 + i),
+                  room_type=rng.choices(types, weights)[0])
+             for venue_id in venue_ids for i in range(per_venue)]
+    ids = _insert(Room, rooms, batch_size)
+    return [(pk, room.venue_id, room.room_type)
+            for pk, room in zip(ids, rooms)]
+
+
+def _guests(rng, count, batch_size):
+    offset = _last_id(Guest)
+    guests = []
+    for i in range(count):
+        city, zipcode, _ = rng.choice(CITIES)
+        guests.append(Guest(name='Guest %d' % (offset + i + 1),
+                            address='%d Oak Avenue' % rng.randint(1, 999),
+                            city=city, zipcode=zipcode))
+    return _insert(Guest, guests, batch_size)
+
+
+def _reservations(rng, rooms, guest_ids, total, start, days, batch_size):
+    """ Spread `total` stays evenly over the rooms, the first rooms getting
+    one more when it does not divide. Returns the number written. """
+    rates = PricingRules.from_settings()
+    per_room, extra = divmod(total, len(rooms))
+    batch = []
+    written = 0
+    for i, (room_id, venue_id, room_type) in enumerate(rooms):
+        rate = Decimal(str(rates.base_rates.get(room_type,
+                                                rates.default_rate)))
+        for first, nights in plan_stays(rng, per_room + (i < extra), days):
+            checkin = start + timedelta(days=first)
+            batch.append(Reservation(
+                venue_id=venue_id, room_id=room_id,
+                guest_id=rng.choice(guest_ids), amount=rate * nights,
+                checkin=checkin, checkout=checkin + timedelta(days=nights)))
+            if len(batch) >= batch_size:
+                written += _bulk_create(Reservation, batch)
+                batch = []
+    written += _bulk_create(Reservation, batch)
+    reservations_bulk_changed.send(
+        sender=Reservation,
+        rooms=[(venue_id, room_id) for room_id, venue_id, _ in rooms])
+    return written
+
+
+def generate(venues, rooms_per_venue, guests, reservations, days, start,
+             seed=0, batch_size=5000, progress=None, workers=1):
+    """ Create venues, rooms, guests and `reservations` stays from start
+    over `days` days, then build and price their calendar.
+
+    Raises ValueError when the stays do not fit: a room holds at most one
+    stay per day of the horizon. `progress`, when given, is called with a
+    message after each step. `workers` processes build the calendar, see
+    core.calendar_builder. Returns the GenerateStats.
+    """
+    rooms_total = venues * rooms_per_venue
+    if reservations and (not rooms_total or not guests):
+        raise ValueError('Reservations need at least one room and one guest.')
+    if rooms_total and -(-reservations // rooms_total) > days:
+        raise ValueError('%d reservations do not fit in %d rooms over %d '
+                         'days, at most one stay per room and day.' %
+                         (reservations, rooms_total, days))
+    progress = progress or (lambda message: None)
+    rng = random.Random(seed)
+    stats = GenerateStats()
+
+    with transaction.atomic():
+        venue_ids = _venues(rng, venues, batch_size)
+        rooms = _rooms(rng, venue_ids, rooms_per_venue, batch_size)
+        guest_ids = _guests(rng, guests, batch_size)
+    stats.venues, stats.rooms, stats.guests = (len(venue_ids), len(rooms),
+                                               len(guest_ids))
+    progress(str(stats))
+    if reservations:
+        stats.reservations = _reservations(rng, rooms, guest_ids,
+                                           reservations, start, days,
+                                           batch_size)
+        progress(str(stats))
+    if venue_ids:
+        end = start + timedelta(days=days - 1)
+        stats.calendar = build_calendar(start, end, venue_ids=venue_ids,
+                                        batch_size=batch_size,
+                                        workers=workers)
+        progress('Calendar: %s' % stats.calendar)
+        stats.prices = reprice(start, end, venue_ids=venue_ids,
+                               batch_size=batch_size)
+        progress('Prices: %s' % stats.prices)
+    return stats
@@ -0,0 +1,11 @@
+from django.db import transaction
+
+
+def in_transaction(using=None):
+    """ True while the connection is inside an atomic block.
+
+    In-process caches must not be filled or patched from inside a
+    transaction: they never hear about a rollback, so they would keep rows
+    that were never committed.
+    """
+    return transaction.get_connection(using).in_atomic_block
@@ -0,0 +1,57 @@
+""" Version counters for conditional GETs.
+
+Reservations carry their own version column, bumped by Reservation.save.
+Calendar entries are versioned per day in CalendarDayVersion: every write
+touching a Calendar entry bumps the days it touched, in the same
+transaction. Single saves and deletes are covered by core.signals; code
+writing in bulk (update(), raw INSERTs, bulk_create) calls
+bump_calendar_days itself, along with core.calendar_store.sync_months.
+"""
+from calendar import monthrange
+from datetime import timedelta
+
+from django.db.models import F
+from django.utils import timezone
+
+from .models import CalendarDayVersion
+
+BATCH_SIZE = 500
+
+
+def bump_calendar_days(days):
+    """ Increment the version of every day in `days` """
+    days = sorted(set(days))
+    for i in range(0, len(days), BATCH_SIZE):
+        chunk = days[i:i + BATCH_SIZE]
+        now = timezone.now()
+        counters = CalendarDayVersion.objects.filter(day__in=chunk)
+        if counters.update(version=F('version') + 1,
+                           updated_at=now) == len(chunk):
+            continue
+        # First write to some of the days. A concurrent writer may insert
+        # the same ones, so create them at 0 and bump whatever is there
+        existing = set(counters.values_list('day', flat=True))
+        missing = [day for day in chunk if day not in existing]
+        CalendarDayVersion.objects.bulk_create(
+            [CalendarDayVersion(day=day, version=0, updated_at=now)
+             for day in missing], ignore_conflicts=True)
+        CalendarDayVersion.objects.filter(day__in=missing).update(
+            version=F('version') + 1, updated_at=now)
+
+
+def calendar_day_version(day):
+    """ (version, updated_at) of the day, (0, None) if it was never written """
+    row = CalendarDayVersion.objects.filter(day=day) \
+        .values_list('version', 'updated_at').first()
+    return row or (0, None)
+
+
+def stay_days(start, end):
+    """ Days from start (inclusive) to end (exclusive) """
+    return [start + timedelta(days=i) for i in range((end - start).days)]
+
+
+def month_days(month):
+    """ Every day of the month starting at `month` """
+    return stay_days(month, month + timedelta(
+        days=monthrange(month.year, month.month)[1]))
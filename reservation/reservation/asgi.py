@@ -0,0 +1,34 @@
+"""
+ASGI config for reservation project.
+
+It exposes the ASGI callable as a module-level variable named ``application``.
+Requests are routed by reservation.asgi_urls, where the read-only API views
+are async (see api.async_views). Serve it with any ASGI server, e.g.
+
+    uvicorn reservation.asgi:application
+
+For more information on this file, see
+https://docs.djangoproject.com/en/3.2/howto/deployment/asgi/
+"""
+
+import os
+
+import django
+from django.core.handlers.asgi import ASGIHandler
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "reservation.settings")
+
+
+class ReadPathASGIHandler(ASGIHandler):
+    urlconf = 'reservation.asgi_urls'
+
+    def create_request(self, scope, body_file):
+        request, error_response = super(
+            ReadPathASGIHandler, self).create_request(scope, body_file)
+        if request is not None:
+            request.urlconf = self.urlconf
+        return request, error_response
+
+
+django.setup(set_prefix=False)
+application = ReadPathASGIHandler()
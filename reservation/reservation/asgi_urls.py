@@ -0,0 +1,10 @@
+""" URLs of the ASGI entry point: reservation.urls with the async read-only
+API views of api.async_urls """
+from django.urls import include, path
+from django.contrib import admin
+
+urlpatterns = [
+    path('', include('core.urls')),
+    path('api/', include(('api.async_urls', 'api'), namespace='api')),
+    path('admin/', admin.site.urls),
+]
@@ -44,6 +44,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.querycount.QueryCountMiddleware',
+    'api.pinning.PrimaryPinningMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -73,6 +75,17 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'reservation.wsgi.application'
 
+# Same project with async read-only API views, see api.async_views
+ASGI_APPLICATION = 'reservation.asgi.application'
+# Conditional GETs served by the ASGI entry point can long poll with
+# ?wait=<seconds>: the view runs again every INTERVAL seconds, for at most
+# MAX_WAIT seconds, until the resource changes
+ASYNC_LONG_POLL_INTERVAL = 0.5
+ASYNC_LONG_POLL_MAX_WAIT = 30
+
+# Fails any test request that goes over its QUERY_BUDGETS entry
+TEST_RUNNER = 'api.querycount.BudgetTestRunner'
+
 REST_FRAMEWORK = {
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 10,
@@ -92,6 +105,129 @@ CACHES = {
     }
 }
 
+# Reservation overlap checks first look at an in-process interval index
+# (core.interval_index), which rejects known conflicts without a query. Each
+# worker process has its own copy and may miss bookings of the others, so a
+# stay it finds free is still checked against the DB, in the transaction of
+# the write. A room is reloaded once it is older than MAX_AGE seconds.
+RESERVATION_INDEX_ENABLED = True
+RESERVATION_INDEX_MAX_AGE = 30
+
+# Availability search (core.availability) keeps a bitset per room covering
+# HORIZON_DAYS nights from today; longer or past stays are answered by the DB.
+AVAILABILITY_HORIZON_DAYS = 730
+AVAILABILITY_MAX_AGE = 30
+
+# 'check' books a reservation when no overlapping one is found. 'claim' books
+# it by claiming its nights in the Calendar with one conditional UPDATE, which
+# stays correct under concurrent bookings; nights missing from the calendar
+# cannot be booked then (see core.booking).
+BOOKING_MODE = 'check'
+
+# Reservation creates and updates of the API are written by one thread per
+# process (core.booking_queue), which commits every booking queued while it
+# was busy, up to MAX_BATCH, in one transaction. LINGER seconds to wait for
+# more bookings before a commit, TIMEOUT seconds a request waits for its own
+# before it responds with a 503 and its booking is dropped.
+BOOKING_QUEUE_ENABLED = True
+BOOKING_QUEUE_MAX_BATCH = 64
+BOOKING_QUEUE_LINGER = 0
+BOOKING_QUEUE_TIMEOUT = 30
+
+# 'rows' reads the calendar from Calendar (one row per room per day),
+# 'compact' from CalendarMonth (one row per room per month), which is built
+# once with `python manage.py compactcalendar`. Calendar stays the table
+# that is written; in compact storage every write also rewrites the month
+# records it touched, in the same transaction (core.calendar_store).
+CALENDAR_STORAGE = 'rows'
+
+# Longest range, in days, /api/calendar?venue_id=&from=&to= returns at once
+CALENDAR_RANGE_MAX_DAYS = 366
+
+# Stay prices are quoted from per-room running totals of the calendar prices
+# (core.quotes, POST /api/quote), kept per process for at most MAX_AGE
+# seconds. With CHECK_AMOUNT a new reservation must cost the price of its
+# nights, which is also its default amount, when every night of the stay has
+# one; that price is summed from the database, never from the cache.
+QUOTE_CACHE_MAX_AGE = 30
+QUOTE_CHECK_AMOUNT = True
+# Most stays quoted by one request
+QUOTE_MAX_STAYS = 1000
+
+# Most rooms returned by the cheapest rooms search (core.search)
+SEARCH_MAX_RESULTS = 100
+
+# Rules of the pricing job (core.pricing, `python manage.py reprice`).
+# A free calendar day costs base_rates[room type] (default_rate for the
+# others) x the weekday multiplier (Monday first) x the multiplier of every
+# season it falls in ('MM-DD' to 'MM-DD', both inclusive, may wrap around the
+# new year) x the multiplier of the highest occupancy threshold the venue
+# reaches that day.
+PRICING_RULES = {
+    'base_rates': {'Regular': 100, 'Deluxe': 150, 'Suite': 250},
+    'weekday_multipliers': [1, 1, 1, 1, 1.2, 1.3, 1.1],
+    'seasons': [
+        ('06-15', '08-31', 1.25),
+        ('12-20', '01-05', 1.3),
+    ],
+    'occupancy_uplift': [
+        (0.7, 1.1),
+        (0.9, 1.25),
+    ],
+}
+
+# /api/analytics/occupancy results (core.analytics) are cached under a
+# fingerprint of the reservations and calendar days they were computed from,
+# TIMEOUT only bounds how long unused results are kept
+ANALYTICS_CACHE = 'default'
+ANALYTICS_CACHE_TIMEOUT = 300
+ANALYTICS_MAX_DAYS = 731
+
+# Most queries a view may run per request, per method. Going over is logged,
+# and fails the test suite (see api.querycount). A booking written by the
+# booking queue counts its share of the writer batch.
+QUERY_BUDGETS = {
+    'GuestList': {'GET': 2},
+    'GuestDetail': {'GET': 1},
+    'RoomList': {'GET': 2},
+    'RoomDetail': {'GET': 1},
+    'ReservationList': {'GET': 3},
+    # Conditional GETs read the version first (api.conditional)
+    'ReservationDetail': {'GET': 2},
+    'VenueList': {'GET': 2},
+    'VenueDetail': {'GET': 1},
+    'CalendarList': {'GET': 3},
+    'CalendarDayList': {'GET': 3},
+    'AvailabilityList': {'GET': 5},
+    'OccupancyAnalytics': {'GET': 5},
+    'StayQuote': {'POST': 1},
+    # Venues, free rooms of the venues not loaded in core.availability,
+    # quotes, rooms
+    'RoomSearch': {'GET': 4},
+}
+
+# Read-through cache of the Venue and Room GET responses (api.view_cache),
+# per process. TIMEOUT bounds how long writes from other processes go unseen.
+VIEW_CACHE_MAX_ENTRIES = 1000
+VIEW_CACHE_TIMEOUT = 60
+
+# Throttle algorithm per scope (api.throttling), 'sliding_log' when not
+# listed. 'sliding_window_counter' stores two counters per resource instead
+# of a timestamp per request, at the cost of up to one extra window of
+# waiting; under 4 requests per window it keeps the timestamps of the last
+# ones instead, which is exact, so state_change stays 1 call/minute.
+THROTTLE_ALGORITHMS = {
+    'state_change': 'sliding_window_counter',
+}
+
+# Throttle state (api.throttle_store). The SQLite store is atomic across
+# every worker process on the host; CacheThrottleStore with a 'LOCATION'
+# naming one of CACHES is the old per-process get/set behaviour.
+THROTTLE_STORE = {
+    'BACKEND': 'api.throttle_store.SQLiteThrottleStore',
+    'LOCATION': '/var/tmp/reservation_throttle.sqlite3',
+}
+
 # Database
 # https://docs.djangoproject.com/en/2.0/ref/settings/#databases
 
@@ -102,6 +238,28 @@ DATABASES = {
     }
 }
 
+# Keep the integer primary keys of the existing migrations
+DEFAULT_AUTO_FIELD = 'django.db.models.AutoField'
+
+# Reads of safe requests go to one of DATABASE_REPLICAS (core.routers), e.g.
+# RESERVATION_REPLICAS=/var/tmp/replica.sqlite3 (comma separated) refreshed
+# by `python manage.py syncreplica --every 1`. Writes, conflict checks and
+# the in-process caches use the primary. A client that wrote reads from the
+# primary for the next REPLICA_LAG_TOLERANCE seconds (api.pinning), which has
+# to cover how far behind the replicas may be.
+DATABASE_ROUTERS = ['core.routers.ReplicaRouter']
+DATABASE_REPLICAS = []
+for index, path in enumerate(filter(None, os.environ.get(
+        'RESERVATION_REPLICAS', '').split(','))):
+    DATABASES['replica%d' % index] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': path,
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append('replica%d' % index)
+REPLICA_LAG_TOLERANCE = 5
+REPLICA_PIN_COOKIE = 'primary_pin'
+
 
 # Password validation
 # https://docs.djangoproject.com/en/2.0/ref/settings/#auth-password-validators